@@ -0,0 +1,90 @@
+# time and peak memory of exporting an AST: the old recursive str() against the streaming
+# text, JSON and S-expression writers, and loading the binary encoding against parsing again
+# run from repository root: python -m benchmarks.ast_export [file] [generator options]
+
+import argparse
+import gc
+import time
+import tracemalloc
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import text_layouts, child_fields
+from src.serialize import *
+from benchmarks.generator import add_arguments, source_from_arguments
+
+class NullWriter:
+    # counts characters instead of keeping them
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+
+def recursive_text(node):
+    # str(node) as the nodes built it before, every level joins the text of its children
+    children = child_fields[type(node)]
+    text = ""
+    for prefix, field in text_layouts[type(node)]:
+        text += prefix
+        if field is None:
+            continue
+        value = getattr(node, field)
+        if field not in children:
+            text += str(value)
+        elif type(value) is list:
+            text += "\n".join(recursive_text(child) for child in value)
+        else:
+            text += "None" if value is None else recursive_text(value)
+    return text
+
+def measure(run):
+    # seconds and peak traced bytes of one run, and its result
+    gc.collect()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, result
+
+def streamed(write, root):
+    def run():
+        out = NullWriter()
+        write(root, out)
+        return out.size
+    return run
+
+def run(text, file_name):
+    root = TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens()
+    data = encode_tree(root)
+    cases = [
+        ("str recursive", lambda: len(recursive_text(root))),
+        ("str", lambda: len(str(root))),
+        ("text stream", streamed(write_text, root)),
+        ("json stream", streamed(write_json, root)),
+        ("sexp stream", streamed(write_sexp, root)),
+        ("binary encode", lambda: len(encode_tree(root))),
+        ("binary decode", lambda: decode_tree(data) and len(data)),
+        ("parse", lambda: TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens() and len(text)),
+    ]
+    results = {}
+    for name, case in cases:
+        seconds, peak, size = measure(case)
+        results[name] = {"seconds": seconds, "peak_bytes": peak, "output_bytes": size}
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file, a generated corpus by default")
+    add_arguments(parser)
+    parser.set_defaults(modules=40, functions=100)
+    args = parser.parse_args()
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    for name, result in run(text, args.file or "<generated>").items():
+        print(name.ljust(16) + format(result["seconds"] * 1000, "8.1f") + " ms  peak " + format(result["peak_bytes"] / 1024, "9.0f") + " KiB  output " + format(result["output_bytes"] / 1024, "8.0f") + " KiB")
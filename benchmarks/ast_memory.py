@@ -0,0 +1,110 @@
+# bytes per node of the slotted, interned AST versus the same tree with __dict__ nodes
+# and a string copy per node, the layout syntax nodes had before
+# run from repository root: python -m benchmarks.ast_memory [file] [generator options]
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import node_types, child_fields, walk
+from benchmarks.generator import add_arguments, source_from_arguments
+
+# plain __dict__ class per node class
+dict_classes = {node_type: type(node_type.__name__, (), {}) for node_type in node_types}
+
+def copy_string(value):
+    # new str object with the same text, like a value sliced from each token
+    return (value + ".")[:-1] if isinstance(value, str) else value
+
+def dict_tree(node):
+    # old layout: no spans, every string a separate copy
+    copy = dict_classes[type(node)]()
+    children = child_fields[type(node)]
+    for field in type(node).__slots__:
+        if field == "line" or field == "column":
+            continue
+        value = getattr(node, field)
+        if field in children:
+            if type(value) is list:
+                value = [dict_tree(item) for item in value]
+            elif value is not None:
+                value = dict_tree(value)
+        else:
+            value = copy_string(value)
+        setattr(copy, field, value)
+    return copy
+
+def shallow_copy(node, dict_layout):
+    copy = dict_classes[type(node)]() if dict_layout else type(node).__new__(type(node))
+    for field in type(node).__slots__:
+        if dict_layout and (field == "line" or field == "column"):
+            continue
+        setattr(copy, field, getattr(node, field))
+    return copy
+
+def traced(build):
+    # bytes still allocated by build once it returned, and its result
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+def node_bytes(node, dict_layout, copies=1000):
+    # per instance without its field values, __dict__ sizes from getsizeof
+    # would count dictionaries python only creates on access
+    size, nodes = traced(lambda: [shallow_copy(node, dict_layout) for _ in range(copies)])
+    return (size - sys.getsizeof(nodes)) / copies
+
+def run(text, file_name):
+    start = time.perf_counter()
+    TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens()
+    elapsed = time.perf_counter() - start
+    # strings of the tree are allocated by the tokenizer, tokens are dropped after parsing
+    slotted, root = traced(lambda: TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens())
+    old, old_root = traced(lambda: dict_tree(root))
+    nodes = {}
+    for node in walk(root):
+        nodes.setdefault(type(node), []).append(node)
+    classes = {}
+    for node_type, instances in sorted(nodes.items(), key=lambda item: item[0].__name__):
+        classes[node_type.__name__] = {
+            "count": len(instances),
+            "slotted_bytes": node_bytes(instances[0], False),
+            "dict_bytes": node_bytes(instances[0], True),
+        }
+    count = sum(len(instances) for instances in nodes.values())
+    return {
+        "source_bytes": len(text),
+        "nodes": count,
+        "parse_seconds": elapsed,
+        "classes": classes,
+        "slotted_total_bytes": slotted,
+        "dict_total_bytes": old,
+        "slotted_bytes_per_node": slotted / count,
+        "dict_bytes_per_node": old / count,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file, a generated corpus by default")
+    add_arguments(parser)
+    parser.set_defaults(modules=40, functions=100)
+    args = parser.parse_args()
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    result = run(text, args.file or "<generated>")
+    print("nodes: " + str(result["nodes"]) + " parsed in " + format(result["parse_seconds"], ".3f") + "s")
+    for name, sizes in result["classes"].items():
+        print("  " + name.ljust(24) + str(sizes["count"]).rjust(8) + "  slotted " + format(sizes["slotted_bytes"], "5.0f") + " bytes, __dict__ " + format(sizes["dict_bytes"], "5.0f") + " bytes")
+    print("retained by the tree")
+    print("slotted:  " + str(result["slotted_total_bytes"]) + " bytes, " + format(result["slotted_bytes_per_node"], ".1f") + " bytes/node")
+    print("__dict__: " + str(result["dict_total_bytes"]) + " bytes, " + format(result["dict_bytes_per_node"], ".1f") + " bytes/node")
+    print("ratio: " + format(result["dict_total_bytes"] / result["slotted_total_bytes"], ".1f") + "x")
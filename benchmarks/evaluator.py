@@ -0,0 +1,91 @@
+# calls per second of src.evaluator against a tree-walking interpreter which reads
+# the function body and converts its literals again on every call
+# run from repository root: python -m benchmarks.evaluator [file] [--calls N] [generator options]
+
+import argparse
+import time
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import *
+from src.evaluator import Program, atom
+from benchmarks.generator import add_arguments, source_from_arguments
+
+def evaluate(node):
+    while type(node) is FunctionReturnNode:
+        node = node.return_value
+    if node is None:
+        return None
+    if type(node) is IntegerLiteralNode:
+        return int(node.value)
+    if type(node) is FloatLiteralNode:
+        return float(node.value)
+    if type(node) is StringLiteralNode:
+        return node.value
+    if type(node) is AtomLiteralNode:
+        return atom(node.identifier)
+    raise ValueError("cannot evaluate " + type(node).__name__)
+
+def walk_call(definition):
+    # same rules as src.evaluator, straight from the tree
+    result = None
+    for node in definition.body:
+        if type(node) is DefinitionEndNode or type(node) is FunctionDefinitionNode or type(node) is ModuleDefinitionNode:
+            continue
+        if type(node) is FunctionReturnNode:
+            return evaluate(node.return_value)
+        result = evaluate(node)
+    return result
+
+def run(text, file_name, calls):
+    root = TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens()
+    program = Program(root, file_name)
+    names = sorted(program.definitions)
+    definitions = [program.definitions[name] for name in names]
+
+    start = time.perf_counter()
+    for name in names:
+        program.function(name)
+    compile_seconds = time.perf_counter() - start
+    functions = [program.function(name).run for name in names]
+
+    for function, definition in zip(functions, definitions):
+        if function(None) != walk_call(definition):
+            raise AssertionError("results differ for " + definition.identifier)
+
+    rounds = max(1, calls // len(names))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for definition in definitions:
+            walk_call(definition)
+    walk_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for function in functions:
+            function(None)
+    compiled_seconds = time.perf_counter() - start
+    total = rounds * len(names)
+    return {
+        "functions": len(names),
+        "calls": total,
+        "compile_seconds": compile_seconds,
+        "tree_walk_calls_per_second": total / walk_seconds,
+        "compiled_calls_per_second": total / compiled_seconds,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file, a generated corpus by default")
+    parser.add_argument("--calls", type=int, default=1000000)
+    add_arguments(parser)
+    parser.set_defaults(modules=10, functions=50, statements=4)
+    args = parser.parse_args()
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    result = run(text, args.file or "<generated>", args.calls)
+    print(str(result["functions"]) + " functions compiled in " + format(result["compile_seconds"] * 1000, ".1f") + " ms, " + str(result["calls"]) + " calls")
+    print("tree walk: " + format(result["tree_walk_calls_per_second"], ".0f") + " calls/s")
+    print("compiled:  " + format(result["compiled_calls_per_second"], ".0f") + " calls/s ("
+        + format(result["compiled_calls_per_second"] / result["tree_walk_calls_per_second"], ".1f") + "x)")
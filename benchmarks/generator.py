@@ -0,0 +1,106 @@
+# deterministic generator of synthetic .sima sources
+# run from repository root: python -m benchmarks.generator [options] > corpus.sima
+
+import argparse
+import random
+
+type_names = ["Int", "Float", "Bool", "String", "Void"]
+atoms = [":ok", ":error", ":none", ":some"]
+words = ["value", "result", "entry", "point", "index", "count", "state", "filter"]
+
+class CorpusGenerator:
+    # only emits constructs FileTokenizer and TokenParser accept:
+    # TokenParser takes named and empty struct ({}) types in signatures,
+    # struct types with fields are emitted commented out like in the sample
+
+    def __init__(self, modules=4, functions=16, statements=2, comment_density=0.2, struct_fields=3, signature_depth=1, seed=0):
+        self.modules = modules
+        self.functions = functions
+        self.statements = statements
+        self.comment_density = comment_density
+        self.struct_fields = struct_fields
+        self.signature_depth = signature_depth
+        self.random = random.Random(seed)
+
+    def comment(self):
+        return "# " + " ".join(self.random.choice(words) for _ in range(self.random.randint(1, 6)))
+
+    def maybe_comment(self):
+        if self.random.random() < self.comment_density:
+            return " " + self.comment()
+        return ""
+
+    def signature(self):
+        # depth arrows, argument types alternate between names and {}
+        parts = []
+        for _ in range(self.signature_depth):
+            parts.append("{}" if self.random.random() < 0.5 else self.random.choice(type_names))
+        parts.append(self.random.choice(type_names))
+        if len(parts) == 1:
+            parts.insert(0, "Void")
+        return " -> ".join(parts)
+
+    def struct_type(self, depth):
+        fields = []
+        for index in range(self.struct_fields):
+            if depth > 0 and index == 0:
+                field_type = self.struct_type(depth - 1) + " -> " + self.random.choice(type_names)
+            else:
+                field_type = self.random.choice(type_names)
+            fields.append(self.random.choice(words) + str(index) + ": " + field_type)
+        return "{" + " ".join(fields) + "}"
+
+    def literal(self):
+        kind = self.random.randrange(4)
+        if kind == 0:
+            return str(self.random.randrange(100000))
+        if kind == 1:
+            return str(self.random.randrange(1000)) + "." + str(self.random.randrange(1000))
+        if kind == 2:
+            return "\"" + self.random.choice(words) + "\""
+        return self.random.choice(atoms)
+
+    def lines(self):
+        for module in range(self.modules):
+            if self.random.random() < self.comment_density:
+                yield self.comment()
+            yield "defmodule Module" + str(module) + ":"
+            yield ""
+            for function in range(self.functions):
+                if self.random.random() < self.comment_density:
+                    yield "    " + self.comment()
+                yield "    def function" + str(function) + ": " + self.signature() + self.maybe_comment()
+                for _ in range(self.statements):
+                    yield "        ret " + self.literal()
+                yield "    end"
+                yield ""
+                if self.struct_fields and self.random.random() < self.comment_density:
+                    yield "    #def Struct" + str(function) + ":"
+                    yield "    #    " + self.struct_type(self.signature_depth)
+                    yield "    #end"
+                    yield ""
+            yield "end"
+            yield ""
+
+    def source(self):
+        return "\n".join(self.lines())
+
+def generate_source(modules=4, functions=16, statements=2, comment_density=0.2, struct_fields=3, signature_depth=1, seed=0):
+    return CorpusGenerator(modules, functions, statements, comment_density, struct_fields, signature_depth, seed).source()
+
+def add_arguments(parser):
+    parser.add_argument("--modules", type=int, default=4)
+    parser.add_argument("--functions", type=int, default=16, help="functions per module")
+    parser.add_argument("--statements", type=int, default=2, help="ret statements per function")
+    parser.add_argument("--comment-density", type=float, default=0.2)
+    parser.add_argument("--struct-fields", type=int, default=3)
+    parser.add_argument("--signature-depth", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+
+def source_from_arguments(args):
+    return generate_source(args.modules, args.functions, args.statements, args.comment_density, args.struct_fields, args.signature_depth, args.seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    print(source_from_arguments(parser.parse_args()))
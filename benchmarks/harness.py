@@ -0,0 +1,197 @@
+# front-end benchmark over generated corpora, results as JSON
+# run from repository root:
+#   python -m benchmarks.harness --output results.json
+#   python -m benchmarks.harness --baseline results.json
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from src.tokenizer import *
+from src.parser import *
+from src.cache import FrontEndCache
+from benchmarks.generator import generate_source
+
+# size name -> generator arguments
+sizes = {
+    "small": dict(modules=2, functions=10),
+    "medium": dict(modules=10, functions=50),
+    "large": dict(modules=40, functions=100),
+}
+
+def lex_file(file_name, text):
+    with open(file_name, "r") as file_stream:
+        return FileTokenizer(file_name, file_stream).tokenize()
+
+def lex_text(file_name, text):
+    return tokenize_path(file_name)
+
+def lex_buffer(file_name, text):
+    return TextTokenizer(file_name, read_source(file_name)).tokenize_buffer()
+
+def lex_push(file_name, text):
+    # pipe sized chunks through PushTokenizer
+    tokenizer = PushTokenizer(file_name)
+    tokens = []
+    with open(file_name, "r") as file_stream:
+        while True:
+            chunk = file_stream.read(65536)
+            if not chunk:
+                break
+            tokens.extend(tokenizer.feed(chunk))
+    tokens.extend(tokenizer.close())
+    return tokens
+
+def parse_list(tokens):
+    return TokenParser(tokens).parse_tokens()
+
+def end_to_end_text(file_name, text):
+    return TokenParser(tokenize_path(file_name)).parse_tokens()
+
+def end_to_end_stream(file_name, text):
+    return TokenParser(TextTokenizer(file_name, read_source(file_name)).iter_tokens()).parse_tokens()
+
+def end_to_end_cached(file_name, text):
+    # warm after the untimed first run of time_runs
+    return FrontEndCache(os.path.join(os.path.dirname(file_name), "cache")).front_end(file_name)
+
+# stage, engine, runs on pre-lexed tokens, function
+cases = [
+    ("tokenize", "file", False, lex_file),
+    ("tokenize", "text", False, lex_text),
+    ("tokenize", "buffer", False, lex_buffer),
+    ("tokenize", "push", False, lex_push),
+    ("parse", "list", True, parse_list),
+    ("parse", "buffer", True, parse_list),
+    ("end_to_end", "text", False, end_to_end_text),
+    ("end_to_end", "stream", False, end_to_end_stream),
+    ("end_to_end", "cached", False, end_to_end_cached),
+]
+
+def percentile(samples, fraction):
+    # nearest rank on sorted samples
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def latency_summary(samples):
+    return {
+        "min": min(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 0.5),
+        "p90": percentile(samples, 0.9),
+        "p99": percentile(samples, 0.99),
+        "max": max(samples),
+    }
+
+def time_runs(run, repeat):
+    run()
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def peak_memory(run):
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def run_size(size, repeat, directory):
+    text = generate_source(**sizes[size])
+    file_name = os.path.join(directory, size + ".sima")
+    with open(file_name, "w") as file_stream:
+        file_stream.write(text)
+    token_list = tokenize_path(file_name)
+    token_buffer = TextTokenizer(file_name, text).tokenize_buffer()
+    results = []
+    for stage, engine, needs_tokens, function in cases:
+        if needs_tokens:
+            tokens = token_buffer if engine == "buffer" else token_list
+            run = lambda: function(tokens)
+        else:
+            run = lambda: function(file_name, text)
+        samples = time_runs(run, repeat)
+        latency = latency_summary(samples)
+        results.append({
+            "size": size,
+            "stage": stage,
+            "engine": engine,
+            "source_bytes": len(text),
+            "tokens": len(token_list),
+            "latency": latency,
+            "bytes_per_second": len(text) / latency["p50"],
+            "tokens_per_second": len(token_list) / latency["p50"],
+            "peak_memory": peak_memory(run),
+        })
+    return results
+
+def run_benchmarks(size_names, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        results = []
+        for size in size_names:
+            results.extend(run_size(size, repeat, directory))
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+def compare(current, baseline, threshold):
+    # regressions of median latency above threshold (fraction) against baseline
+    previous = {(result["size"], result["stage"], result["engine"]): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = (result["size"], result["stage"], result["engine"])
+        if key not in previous:
+            continue
+        before = previous[key]["latency"]["p50"]
+        after = result["latency"]["p50"]
+        if after > before * (1 + threshold):
+            regressions.append({"case": "/".join(key), "baseline_p50": before, "p50": after, "change": after / before - 1})
+    return regressions
+
+def print_table(report, stream):
+    for result in report["results"]:
+        latency = result["latency"]
+        print(result["size"].ljust(7) + result["stage"].ljust(11) + result["engine"].ljust(7)
+            + " p50 " + format(latency["p50"] * 1000, "9.2f") + " ms"
+            + " p90 " + format(latency["p90"] * 1000, "9.2f") + " ms"
+            + format(result["tokens_per_second"], "12.0f") + " tokens/s"
+            + format(result["peak_memory"] / 1024, "10.0f") + " KiB peak", file=stream)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="small,medium", help="comma separated, from " + ", ".join(sizes))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed p50 slowdown against baseline")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes.split(","), args.repeat)
+    print_table(report, sys.stderr)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print("regression " + regression["case"] + ": p50 " + format(regression["baseline_p50"] * 1000, ".2f") + " ms -> " + format(regression["p50"] * 1000, ".2f") + " ms (+" + format(regression["change"] * 100, ".0f") + "%)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,60 @@
+# lexing one large source in slices on worker processes against a single TextTokenizer
+# pools are started before timing, the parallel times include sending the text to the
+# workers, stitching and building the Token list
+# run from repository root: python -m benchmarks.parallel_lex [file] [--workers 1,2,4] [generator options]
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from src.tokenizer import *
+from src.parallel import tokenize_parallel
+from benchmarks.generator import add_arguments, source_from_arguments
+
+def best_of(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best, result
+
+def run(text, file_name, worker_counts, repeat):
+    sequential_seconds, tokens = best_of(lambda: TextTokenizer(file_name, text).tokenize(), repeat)
+    expected = [str(token) for token in tokens]
+    runs = []
+    for workers in worker_counts:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # starts the worker processes
+            list(executor.map(abs, range(workers)))
+            seconds, tokens = best_of(lambda: tokenize_parallel(file_name, text, workers, 0, executor), repeat)
+        if [str(token) for token in tokens] != expected:
+            raise AssertionError("tokens differ with " + str(workers) + " workers")
+        runs.append({"workers": workers, "seconds": seconds, "speedup": sequential_seconds / seconds})
+    return {
+        "characters": len(text),
+        "tokens": len(expected),
+        "cpus": os.cpu_count(),
+        "sequential_seconds": sequential_seconds,
+        "parallel": runs,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file, a generated corpus by default")
+    parser.add_argument("--workers", default="2,4", help="comma separated worker counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    add_arguments(parser)
+    parser.set_defaults(modules=1, functions=10000)
+    args = parser.parse_args()
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    result = run(text, args.file or "<generated>", [int(count) for count in args.workers.split(",")], args.repeat)
+    print(str(result["tokens"]) + " tokens, " + str(result["characters"]) + " characters, " + str(result["cpus"]) + " cpus")
+    print("sequential: " + format(result["sequential_seconds"] * 1000, ".1f") + " ms")
+    for entry in result["parallel"]:
+        print(str(entry["workers"]) + " workers: " + format(entry["seconds"] * 1000, ".1f") + " ms (" + format(entry["speedup"], ".2f") + "x)")
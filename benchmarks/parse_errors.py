@@ -0,0 +1,94 @@
+# time to report every syntax error of a source: the fix and rerun loop, where each
+# run of tokenizer and parser finds the first error which is then fixed, against one
+# recovering parse collecting all of them; also the cost of recovery on a clean source
+# errors are put into evenly spaced signatures of the corpus
+# run from repository root: python -m benchmarks.parse_errors [file] [--errors N] [generator options]
+
+import argparse
+import time
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import *
+from benchmarks.generator import add_arguments, source_from_arguments
+
+def break_signatures(lines, errors):
+    # line numbers of the signatures given an integer in place of a type
+    signatures = [index for index, line in enumerate(lines) if line.lstrip().startswith("def ") and " -> " in line]
+    step = max(1, len(signatures) // max(errors, 1))
+    broken = []
+    for index in signatures[::step][:errors]:
+        lines[index] = lines[index].replace(" -> ", " -> 0 ", 1)
+        broken.append(index + 1)
+    return broken
+
+def rerun_loop(file_name, lines, fixed):
+    # lines of the errors in the order the runs found them
+    lines = list(lines)
+    found = []
+    while True:
+        parser = TokenParser(TextTokenizer(file_name, "\n".join(lines)).tokenize())
+        parser.print_errors = False
+        try:
+            parser.parse_tokens()
+            return found
+        except SyntaxError as error:
+            line = error.token.line
+            found.append(line)
+            lines[line - 1] = fixed[line - 1]
+
+def recovering_parse(file_name, text):
+    parser = TokenParser(TextTokenizer(file_name, text).tokenize())
+    parser.diagnostics = []
+    parser.parse_tokens()
+    return [diagnostic.line for diagnostic in parser.diagnostics]
+
+def parse(file_name, text):
+    return TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens()
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def run(text, file_name, errors):
+    fixed = text.split("\n")
+    lines = list(fixed)
+    broken = break_signatures(lines, errors)
+    broken_text = "\n".join(lines)
+
+    rerun_seconds, rerun_found = timed(lambda: rerun_loop(file_name, lines, fixed))
+    recovering_seconds, recovered = timed(lambda: recovering_parse(file_name, broken_text))
+    if rerun_found != broken or recovered != broken:
+        raise AssertionError("errors differ: injected " + str(broken) + ", rerun " + str(rerun_found) + ", recovering " + str(recovered))
+
+    clean_seconds, _ = timed(lambda: parse(file_name, text))
+    clean_recovering_seconds, clean_found = timed(lambda: recovering_parse(file_name, text))
+    if clean_found:
+        raise AssertionError("errors in the clean source at lines " + str(clean_found))
+    return {
+        "lines": len(fixed),
+        "errors": len(broken),
+        "rerun_runs": len(broken) + 1,
+        "rerun_seconds": rerun_seconds,
+        "recovering_seconds": recovering_seconds,
+        "clean_seconds": clean_seconds,
+        "clean_recovering_seconds": clean_recovering_seconds,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file without syntax errors, a generated corpus by default")
+    parser.add_argument("--errors", type=int, default=20)
+    add_arguments(parser)
+    parser.set_defaults(modules=20, functions=50)
+    args = parser.parse_args()
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    result = run(text, args.file or "<generated>", args.errors)
+    print(str(result["errors"]) + " errors in " + str(result["lines"]) + " lines")
+    print("fix and rerun: " + format(result["rerun_seconds"] * 1000, ".1f") + " ms in " + str(result["rerun_runs"]) + " runs")
+    print("recovering:    " + format(result["recovering_seconds"] * 1000, ".1f") + " ms in 1 run ("
+        + format(result["rerun_seconds"] / result["recovering_seconds"], ".1f") + "x)")
+    print("clean source:  " + format(result["clean_seconds"] * 1000, ".1f") + " ms, recovering " + format(result["clean_recovering_seconds"] * 1000, ".1f") + " ms")
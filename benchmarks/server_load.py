@@ -0,0 +1,209 @@
+# request latency of the src.server daemon under a scripted load, results as JSON
+# a client stand-in opens generated files, then sends edits to random files mixed with
+# requests, keeping up to --concurrency requests in flight, and times every response
+# run from repository root: python -m benchmarks.server_load [--files 50] [--rounds 2000]
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.generator import generate_source
+from benchmarks.harness import latency_summary
+
+# method, weight
+requests = [
+    ("textDocument/documentSymbol", 3),
+    ("textDocument/definition", 3),
+    ("workspace/symbol", 1),
+    ("sima/diagnostics", 2),
+    ("sima/tokenize", 1),
+    ("sima/parse", 1),
+]
+
+class Client:
+    # talks to a server process, a thread reads responses and records when they arrive
+
+    def __init__(self, command):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.next_id = 0
+        # id -> (method, send time)
+        self.pending = {}
+        # method -> latencies in seconds
+        self.latencies = {}
+        self.errors = 0
+        self.notifications = 0
+        self.condition = threading.Condition()
+        self.reader = threading.Thread(target=self.read_responses, daemon=True)
+        self.reader.start()
+
+    def write(self, message):
+        body = json.dumps(message).encode("utf-8")
+        self.process.stdin.write(b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+        self.process.stdin.flush()
+
+    def request(self, method, params):
+        self.next_id += 1
+        with self.condition:
+            self.pending[self.next_id] = (method, time.perf_counter())
+        self.write({"jsonrpc": "2.0", "id": self.next_id, "method": method, "params": params})
+        return self.next_id
+
+    def notify(self, method, params):
+        self.write({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def read_responses(self):
+        stream = self.process.stdout
+        while True:
+            length = None
+            while True:
+                line = stream.readline()
+                if not line:
+                    return
+                if not line.strip():
+                    break
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            message = json.loads(stream.read(length))
+            received = time.perf_counter()
+            if "id" not in message:
+                self.notifications += 1
+                continue
+            with self.condition:
+                method, sent = self.pending.pop(message["id"])
+                self.latencies.setdefault(method, []).append(received - sent)
+                if "error" in message:
+                    self.errors += 1
+                self.condition.notify_all()
+
+    def wait(self, in_flight):
+        # until at most in_flight requests are unanswered
+        with self.condition:
+            while len(self.pending) > in_flight:
+                self.condition.wait()
+
+    def close(self):
+        self.wait(0)
+        self.request("shutdown", None)
+        self.wait(0)
+        self.notify("exit", None)
+        self.process.stdin.close()
+        self.reader.join()
+        return self.process.wait()
+
+def position_of(text, offset):
+    line = text.count("\n", 0, offset)
+    return {"line": line, "character": offset - (text.rfind("\n", 0, offset) + 1)}
+
+def edit(random_source, text):
+    # inserts a comment line or removes one inserted before, both keep the file valid
+    inserted = text.find("    # edited\n")
+    if inserted >= 0 and random_source.random() < 0.4:
+        start, end, replacement = inserted, inserted + len("    # edited\n"), ""
+    else:
+        # start of a random line after the first
+        start = 0
+        for _ in range(random_source.randrange(1, max(2, text.count("\n")))):
+            start = text.find("\n", start) + 1
+        end = start
+        replacement = "    # edited\n"
+    change = {"range": {"start": position_of(text, start), "end": position_of(text, end)}, "text": replacement}
+    return text[:start] + replacement + text[end:], change
+
+def request_params(method, random_source, uri, text):
+    if method == "workspace/symbol":
+        return {"query": "Module" + str(random_source.randrange(4)) + ".function"}
+    params = {"textDocument": {"uri": uri}}
+    if method == "textDocument/definition":
+        # on a function declaration
+        offset = text.find("def function", random_source.randrange(len(text) + 1))
+        offset = offset + len("def ") if offset >= 0 else 0
+        params["position"] = position_of(text, offset)
+    if method == "sima/parse":
+        params["format"] = "sexp"
+    return params
+
+def run_load(files, modules, functions, rounds, concurrency, seed):
+    random_source = random.Random(seed)
+    methods = [method for method, weight in requests for _ in range(weight)]
+    with tempfile.TemporaryDirectory() as directory:
+        texts = {}
+        for index in range(files):
+            file_name = os.path.join(directory, "file" + str(index) + ".sima")
+            text = generate_source(modules=modules, functions=functions, seed=index)
+            with open(file_name, "w") as file_stream:
+                file_stream.write(text)
+            texts["file://" + file_name] = text
+        uris = sorted(texts)
+        client = Client([sys.executable, "-m", "src.server"])
+        start = time.perf_counter()
+        client.request("initialize", {"rootUri": "file://" + directory})
+        client.wait(0)
+        for uri in uris:
+            client.notify("textDocument/didOpen", {"textDocument": {"uri": uri, "text": texts[uri], "version": 0}})
+        versions = dict.fromkeys(uris, 0)
+        load_start = time.perf_counter()
+        edits = 0
+        for _ in range(rounds):
+            uri = random_source.choice(uris)
+            if random_source.random() < 0.5:
+                texts[uri], change = edit(random_source, texts[uri])
+                versions[uri] += 1
+                client.notify("textDocument/didChange", {"textDocument": {"uri": uri, "version": versions[uri]}, "contentChanges": [change]})
+                edits += 1
+            method = random_source.choice(methods)
+            client.request(method, request_params(method, random_source, uri, texts[uri]))
+            client.wait(concurrency - 1)
+        client.wait(0)
+        load_seconds = time.perf_counter() - load_start
+        exit_code = client.close()
+    latencies = dict(client.latencies)
+    initialize = latencies.pop("initialize")
+    latencies.pop("shutdown", None)
+    served = sum(len(samples) for samples in latencies.values())
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "files": files,
+        "rounds": rounds,
+        "concurrency": concurrency,
+        "edits": edits,
+        "requests": served,
+        "errors": client.errors,
+        "notifications": client.notifications,
+        "exit_code": exit_code,
+        "initialize_seconds": initialize[0],
+        "total_seconds": time.perf_counter() - start,
+        "requests_per_second": served / load_seconds,
+        "latency": {method: latency_summary(samples) for method, samples in sorted(latencies.items())},
+        "all_requests": latency_summary([sample for samples in latencies.values() for sample in samples]),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--modules", type=int, default=2)
+    parser.add_argument("--functions", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_load(args.files, args.modules, args.functions, args.rounds, args.concurrency, args.seed)
+    for method, latency in list(report["latency"].items()) + [("all", report["all_requests"])]:
+        print(method.ljust(28) + " p50 " + format(latency["p50"] * 1000, "8.2f") + " ms p90 " + format(latency["p90"] * 1000, "8.2f")
+            + " ms p99 " + format(latency["p99"] * 1000, "8.2f") + " ms", file=sys.stderr)
+    print(format(report["requests_per_second"], ".0f") + " requests/s, " + str(report["edits"]) + " edits, " + str(report["errors"]) + " errors", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,56 @@
+# bytes per token of a Token list versus a TokenBuffer
+# run from repository root: python -m benchmarks.token_memory [file] [generator options]
+
+import argparse
+import gc
+import time
+import tracemalloc
+from src.tokenizer import *
+from benchmarks.generator import add_arguments, source_from_arguments
+
+def measure(build):
+    # timed without tracing, tracemalloc slows allocation down several times
+    gc.collect()
+    start = time.perf_counter()
+    tokens = build()
+    elapsed = time.perf_counter() - start
+    del tokens
+    gc.collect()
+    tracemalloc.start()
+    tokens = build()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tokens, size, peak, elapsed
+
+def run(text, file_name):
+    token_list, list_size, list_peak, list_time = measure(lambda: TextTokenizer(file_name, text).tokenize())
+    count = len(token_list)
+    del token_list
+    token_buffer, buffer_size, buffer_peak, buffer_time = measure(lambda: TextTokenizer(file_name, text).tokenize_buffer())
+    del token_buffer
+    return {
+        "tokens": count,
+        "source_bytes": len(text),
+        "list_bytes_per_token": list_size / count,
+        "list_peak_bytes_per_token": list_peak / count,
+        "list_seconds": list_time,
+        "buffer_bytes_per_token": buffer_size / count,
+        "buffer_peak_bytes_per_token": buffer_peak / count,
+        "buffer_seconds": buffer_time,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file, a generated corpus by default")
+    add_arguments(parser)
+    args = parser.parse_args()
+    # source text is read before measuring, the buffer keeps a reference to it
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    result = run(text, args.file or "<generated>")
+    print("tokens: " + str(result["tokens"]))
+    print("Token list:  " + format(result["list_bytes_per_token"], ".1f") + " bytes/token (peak " + format(result["list_peak_bytes_per_token"], ".1f") + ") in " + format(result["list_seconds"], ".3f") + "s")
+    print("TokenBuffer: " + format(result["buffer_bytes_per_token"], ".1f") + " bytes/token (peak " + format(result["buffer_peak_bytes_per_token"], ".1f") + ") in " + format(result["buffer_seconds"], ".3f") + "s")
+    print("ratio: " + format(result["list_bytes_per_token"] / result["buffer_bytes_per_token"], ".1f") + "x")
@@ -0,0 +1,88 @@
+# comparing every pair of function signatures of a corpus: a walk over both type trees
+# against canonical types from src.canonical_types, plus the cost of resolving and the table stats
+# run from repository root: python -m benchmarks.type_equality [file] [generator options]
+
+import argparse
+import time
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import *
+from src.canonical_types import TypeTable
+from benchmarks.generator import add_arguments, source_from_arguments
+
+def same_structure(left, right):
+    # type trees equal field by field, ignoring positions
+    stack = [(left, right)]
+    while stack:
+        left, right = stack.pop()
+        if left is None or right is None:
+            if left is not right:
+                return False
+            continue
+        if type(left) is not type(right):
+            return False
+        if type(left) is TypeIdentifierNode:
+            if left.identifier != right.identifier:
+                return False
+        elif type(left) is FunctionTypeNode:
+            stack.append((left.argument_type, right.argument_type))
+            stack.append((left.return_type, right.return_type))
+        else:
+            if len(left.fields) != len(right.fields):
+                return False
+            for left_field, right_field in zip(left.fields, right.fields):
+                if left_field.field_identifier != right_field.field_identifier:
+                    return False
+                stack.append((left_field.field_type, right_field.field_type))
+    return True
+
+def run(text, file_name, pairs):
+    root = TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens()
+    signatures = [node.function_type for node in walk(root) if type(node) is FunctionDefinitionNode and node.function_type is not None]
+    count = len(signatures)
+    # the same pairs for both, index i against every other signature in turn
+    pairs = min(pairs, count * count)
+    indexes = [(index % count, (index // count + index) % count) for index in range(pairs)]
+
+    start = time.perf_counter()
+    structural = sum(1 for left, right in indexes if same_structure(signatures[left], signatures[right]))
+    structural_seconds = time.perf_counter() - start
+
+    table = TypeTable()
+    start = time.perf_counter()
+    table.resolve_tree(root)
+    resolve_seconds = time.perf_counter() - start
+
+    resolved = [signature.resolved_type for signature in signatures]
+    start = time.perf_counter()
+    canonical = sum(1 for left, right in indexes if resolved[left] is resolved[right])
+    canonical_seconds = time.perf_counter() - start
+    if structural != canonical:
+        raise AssertionError("structural and canonical equality disagree: " + str(structural) + " != " + str(canonical))
+    return {
+        "signatures": count,
+        "pairs": pairs,
+        "equal_pairs": canonical,
+        "structural_seconds": structural_seconds,
+        "resolve_seconds": resolve_seconds,
+        "canonical_seconds": canonical_seconds,
+        "table_size": len(table),
+        "stats": table.stats.report(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file, a generated corpus by default")
+    parser.add_argument("--pairs", type=int, default=200000)
+    add_arguments(parser)
+    parser.set_defaults(modules=40, functions=100, signature_depth=4)
+    args = parser.parse_args()
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    result = run(text, args.file or "<generated>", args.pairs)
+    print(str(result["signatures"]) + " signatures, " + str(result["pairs"]) + " pairs, " + str(result["equal_pairs"]) + " equal")
+    print("structural " + format(result["structural_seconds"] * 1000, ".1f") + " ms, resolve " + format(result["resolve_seconds"] * 1000, ".1f")
+        + " ms + canonical " + format(result["canonical_seconds"] * 1000, ".1f") + " ms")
+    print(str(result["table_size"]) + " canonical types, hit rate " + format(result["stats"]["hit_rate"] * 100, ".0f") + "%, names " + format(result["stats"]["name_hit_rate"] * 100, ".0f") + "%")
@@ -0,0 +1,157 @@
+# several analysis passes over one tree: a walk() loop per pass, a Visitor per pass
+# and all visitors fused by run_passes into one walk; then the same passes over a
+# chain of nested ret nodes deeper than the recursion limit
+# run from repository root: python -m benchmarks.visitor [file] [--depth N] [generator options]
+
+import argparse
+import time
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import *
+from src.visitor import Visitor, run_passes
+from benchmarks.generator import add_arguments, source_from_arguments
+
+class LiteralCount(Visitor):
+    def __init__(self):
+        self.count = 0
+
+    def enter_IntegerLiteralNode(self, node):
+        self.count += 1
+
+    def enter_FloatLiteralNode(self, node):
+        self.count += 1
+
+    def enter_StringLiteralNode(self, node):
+        self.count += 1
+
+    def enter_AtomLiteralNode(self, node):
+        self.count += 1
+
+class TypeNames(Visitor):
+    def __init__(self):
+        self.names = set()
+
+    def enter_TypeIdentifierNode(self, node):
+        self.names.add(node.identifier)
+
+class DefinitionDepth(Visitor):
+    # deepest nesting of definitions
+    def __init__(self):
+        self.depth = 0
+        self.deepest = 0
+
+    def enter_ModuleDefinitionNode(self, node):
+        self.depth += 1
+        self.deepest = max(self.deepest, self.depth)
+
+    def leave_ModuleDefinitionNode(self, node):
+        self.depth -= 1
+
+    def enter_FunctionDefinitionNode(self, node):
+        self.depth += 1
+        self.deepest = max(self.deepest, self.depth)
+
+    def leave_FunctionDefinitionNode(self, node):
+        self.depth -= 1
+
+class ReturnDepth(Visitor):
+    # longest chain of nested ret
+    def __init__(self):
+        self.depth = 0
+        self.deepest = 0
+
+    def enter_FunctionReturnNode(self, node):
+        self.depth += 1
+        self.deepest = max(self.deepest, self.depth)
+
+    def leave_FunctionReturnNode(self, node):
+        self.depth -= 1
+
+visitor_passes = (LiteralCount, TypeNames, DefinitionDepth, ReturnDepth)
+
+def pass_results(visitors):
+    return (visitors[0].count, len(visitors[1].names), visitors[2].deepest, visitors[3].deepest)
+
+def walk_passes(root):
+    # the same passes written as walk() loops, depths taken from ancestors on a stack
+    literals = 0
+    for node in walk(root):
+        if type(node) is IntegerLiteralNode or type(node) is FloatLiteralNode or type(node) is StringLiteralNode or type(node) is AtomLiteralNode:
+            literals += 1
+    names = set()
+    for node in walk(root):
+        if type(node) is TypeIdentifierNode:
+            names.add(node.identifier)
+    deepest = []
+    for node_classes in ((ModuleDefinitionNode, FunctionDefinitionNode), (FunctionReturnNode,)):
+        best = 0
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if type(node) in node_classes:
+                depth += 1
+                best = max(best, depth)
+            for child in child_nodes(node):
+                stack.append((child, depth))
+        deepest.append(best)
+    return (literals, len(names), deepest[0], deepest[1])
+
+def separate_passes(root):
+    return pass_results([visitor_pass().visit(root) for visitor_pass in visitor_passes])
+
+def fused_passes(root):
+    visitors = [visitor_pass() for visitor_pass in visitor_passes]
+    run_passes(root, visitors)
+    return pass_results(visitors)
+
+def timed(function, root, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(root)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best, result
+
+def deep_tree(depth):
+    node = IntegerLiteralNode("0")
+    for _ in range(depth):
+        node = FunctionReturnNode(node)
+    return RootNode([node])
+
+def run(text, file_name, depth, repeat):
+    result = {}
+    for name, root in (("corpus", TokenParser(TextTokenizer(file_name, text).tokenize()).parse_tokens()), ("deep", deep_tree(depth))):
+        walk_seconds, expected = timed(walk_passes, root, repeat)
+        separate_seconds, separate = timed(separate_passes, root, repeat)
+        fused_seconds, fused = timed(fused_passes, root, repeat)
+        if separate != expected or fused != expected:
+            raise AssertionError(name + ": pass results differ " + str(expected) + " " + str(separate) + " " + str(fused))
+        result[name] = {
+            "nodes": sum(1 for _ in walk(root)),
+            "walk_seconds": walk_seconds,
+            "separate_seconds": separate_seconds,
+            "fused_seconds": fused_seconds,
+        }
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", help="source file, a generated corpus by default")
+    parser.add_argument("--depth", type=int, default=200000, help="nested ret nodes of the deep tree")
+    parser.add_argument("--repeat", type=int, default=3)
+    add_arguments(parser)
+    parser.set_defaults(modules=40, functions=100, statements=3, signature_depth=3)
+    args = parser.parse_args()
+    if args.file:
+        text = read_source(args.file)
+    else:
+        text = source_from_arguments(args)
+    result = run(text, args.file or "<generated>", args.depth, args.repeat)
+    for name in ("corpus", "deep"):
+        entry = result[name]
+        print(name + ": " + str(entry["nodes"]) + " nodes, " + str(len(visitor_passes)) + " passes")
+        print("  walk loops:     " + format(entry["walk_seconds"] * 1000, ".1f") + " ms")
+        print("  visitors:       " + format(entry["separate_seconds"] * 1000, ".1f") + " ms")
+        print("  fused visitors: " + format(entry["fused_seconds"] * 1000, ".1f") + " ms")
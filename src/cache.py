@@ -0,0 +1,247 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+from src.tokenizer import *
+from src.parser import *
+from src.serialize import encode_tree, decode_tree, tree_format
+
+# bump when the entry layout changes
+cache_format = 3
+magic = b"SIMC"
+# magic, format, token count, joined newline count, tree bytes
+header = struct.Struct("<4sHIII")
+# column arrays of a TokenBuffer in entry order
+columns = ("types", "value_starts", "value_ends", "starts", "ends")
+# temporary files older than this are left over from crashed writers
+stale_seconds = 3600
+
+front_end_digest = None
+
+def front_end_version():
+    # digest of tokenizer, parser and syntax sources plus the binary layout,
+    # entries written by any other version get other keys and are never read
+    global front_end_digest
+    if front_end_digest is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in ("tokenizer.py", "parser.py", "syntax.py"):
+            with open(os.path.join(directory, name), "rb") as source:
+                digest.update(source.read())
+        layout = [cache_format, sys.byteorder, array('h').itemsize, array('i').itemsize, tree_format]
+        digest.update(" ".join(str(part) for part in layout).encode())
+        front_end_digest = digest.hexdigest()
+    return front_end_digest
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        # unreadable entries, removed and counted as misses
+        self.invalid = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def report(self):
+        report = dict(vars(self))
+        report["hit_rate"] = self.hit_rate()
+        return report
+
+    def __str__(self):
+        return ("cache: " + str(self.hits) + " hits, " + str(self.misses) + " misses (" + format(self.hit_rate() * 100, ".0f") + "%), "
+            + str(self.stores) + " stores, " + str(self.evictions) + " evictions, " + str(self.invalid) + " invalid")
+
+class FrontEndCache:
+    # token streams and trees on disk, keyed by the source text and front end version
+    # entries are a header followed by the compressed TokenBuffer columns, the offsets of
+    # newlines joined by strings and the RootNode as src.serialize.encode_tree bytes,
+    # token values are offsets into the source text the caller already has
+    # writes go to a temporary file renamed into place, so concurrent processes
+    # only ever see whole entries; file modification times order entries for LRU eviction
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = front_end_version()
+        self.stats = CacheStats()
+        # bytes in the directory, counted on first store and kept up to date from there
+        self.size = None
+
+    def key(self, text):
+        digest = hashlib.sha256(self.version.encode())
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def encode(self, tokens, root):
+        # newlines joined by strings go with the tree, see LineIndex
+        tree = encode_tree(root)
+        joined = array('i', tokens.lines.joined)
+        parts = [getattr(tokens, column).tobytes() for column in columns]
+        parts.append(joined.tobytes())
+        parts.append(tree)
+        # token columns are mostly small repeating integers, compressed about 5x
+        return header.pack(magic, cache_format, len(tokens), len(joined), len(tree)) + zlib.compress(b"".join(parts))
+
+    def decode(self, data, file_name, text):
+        entry_magic, entry_format, count, joined_count, tree_size = header.unpack_from(data)
+        if entry_magic != magic or entry_format != cache_format:
+            raise ValueError("not a cache entry")
+        data = zlib.decompress(memoryview(data)[header.size:])
+        view = memoryview(data)
+        tokens = TokenBuffer(file_name, text)
+        position = 0
+        for column in columns:
+            values = getattr(tokens, column)
+            size = count * values.itemsize
+            values.frombytes(view[position:position + size])
+            position += size
+        joined = array('i')
+        size = joined_count * joined.itemsize
+        if position + size + tree_size != len(data):
+            raise ValueError("truncated cache entry")
+        joined.frombytes(view[position:position + size])
+        tokens.lines.joined = joined.tolist()
+        return tokens, decode_tree(view[position + size:])
+
+    def lookup(self, file_name, text):
+        # (TokenBuffer, RootNode) or None
+        path = self.path(self.key(text))
+        try:
+            with open(path, "rb") as entry:
+                data = entry.read()
+        except OSError:
+            self.stats.misses += 1
+            return None
+        try:
+            result = self.decode(data, file_name, text)
+        except Exception:
+            self.stats.invalid += 1
+            self.stats.misses += 1
+            self.remove(path)
+            return None
+        try:
+            # most recently used
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats.hits += 1
+        self.stats.bytes_read += len(data)
+        return result
+
+    def store(self, text, tokens, root):
+        # an entry that cannot be encoded is not stored, the caller has the tree anyway
+        try:
+            data = self.encode(tokens, root)
+        except Exception:
+            return
+        path = self.path(self.key(text))
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as entry:
+                entry.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            self.remove(temporary)
+            raise
+        self.stats.stores += 1
+        self.stats.bytes_written += len(data)
+        if self.size is None:
+            self.size = self.disk_size()
+        else:
+            self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def entries(self):
+        # (modification time, size, path) of all entries, drops stale temporary files
+        entries = []
+        now = time.time()
+        for path, directories, files in os.walk(self.directory):
+            for file in files:
+                file_path = os.path.join(path, file)
+                try:
+                    status = os.stat(file_path)
+                except OSError:
+                    # removed by another process
+                    continue
+                if file.startswith(".tmp-"):
+                    if now - status.st_mtime > stale_seconds:
+                        self.remove(file_path)
+                    continue
+                entries.append((status.st_mtime, status.st_size, file_path))
+        return entries
+
+    def disk_size(self):
+        return sum(entry[1] for entry in self.entries())
+
+    def evict(self):
+        # least recently used first, down to 90% so the next stores do not evict again
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        limit = self.max_bytes * 0.9
+        for modified, entry_size, path in entries:
+            if size <= limit:
+                break
+            if self.remove(path):
+                self.stats.evictions += 1
+            size -= entry_size
+        self.size = size
+
+    def clear(self):
+        for modified, size, path in self.entries():
+            self.remove(path)
+        self.size = 0
+
+    def front_end(self, file_name, text=None):
+        # tokens as TokenBuffer and the RootNode, from the cache when the text was seen before
+        # tokenizer and syntax errors are raised and not cached
+        if text is None:
+            text = read_source(file_name)
+        cached = self.lookup(file_name, text)
+        if cached is not None:
+            return cached
+        tokenizer = TextTokenizer(file_name, text)
+        records = list(tokenizer.scan())
+        parser = TokenParser(list(tokenizer.iter_tokens(records)))
+        parser.print_errors = False
+        root = parser.parse_tokens()
+        tokens = TokenBuffer(file_name, text)
+        tokens.lines = tokenizer.lines
+        tokens.extend(records)
+        self.store(text, tokens, root)
+        return tokens, root
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--clear", action="store_true", help="remove all entries")
+    args = parser.parse_args()
+
+    cache = FrontEndCache(args.directory)
+    if args.clear:
+        cache.clear()
+    entries = cache.entries()
+    print(str(len(entries)) + " entries, " + str(sum(entry[1] for entry in entries)) + " bytes")
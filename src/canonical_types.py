@@ -0,0 +1,217 @@
+from src.syntax import *
+from src.visitor import Visitor, skip_children
+
+# canonical types: a TypeTable hands out one object per structure, so two types
+# are equal exactly when they are the same object and comparing signatures is `is`
+# types are only built by a TypeTable and never change; hashing and equality are
+# the default identity ones, which is what makes the table keys cheap
+
+builtin_type_names = ("Int", "Float", "Bool", "String", "Void")
+
+class Type:
+    __slots__ = ()
+
+    def __str__(self):
+        # iterative, function types can be nested thousands deep
+        pieces = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                pieces.append(item)
+            elif item is None:
+                pieces.append("None")
+            else:
+                stack.extend(reversed(item.parts()))
+        return "".join(pieces)
+
+class NamedType(Type):
+    __slots__ = ('name', 'builtin')
+
+    def __init__(self, name, builtin):
+        self.name = name
+        self.builtin = builtin
+
+    def parts(self):
+        return [self.name]
+
+class FunctionType(Type):
+    __slots__ = ('argument', 'result')
+
+    def __init__(self, argument, result):
+        self.argument = argument
+        self.result = result
+
+    def parts(self):
+        # arrows group to the right, a function argument needs parentheses
+        if type(self.argument) is FunctionType:
+            return ["(", self.argument, ") -> ", self.result]
+        return [self.argument, " -> ", self.result]
+
+class StructType(Type):
+    __slots__ = ('names', 'types')
+
+    def __init__(self, names, types):
+        # field names without their colon and field types, in declaration order
+        self.names = names
+        self.types = types
+
+    def parts(self):
+        parts = ["{"]
+        for index, name in enumerate(self.names):
+            if index > 0:
+                parts.append(" ")
+            parts.append(name + ": ")
+            parts.append(self.types[index])
+        parts.append("}")
+        return parts
+
+class TypeStats:
+    def __init__(self):
+        # structural types asked for, and how many were in the table already
+        self.lookups = 0
+        self.hits = 0
+        # named type resolutions, and how many came from the memo
+        self.name_lookups = 0
+        self.name_hits = 0
+        # type nodes which already had a resolved_type
+        self.node_hits = 0
+        self.resolved_nodes = 0
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups > 0 else 0.0
+
+    def name_hit_rate(self):
+        return self.name_hits / self.name_lookups if self.name_lookups > 0 else 0.0
+
+    def report(self):
+        report = dict(vars(self))
+        report["hit_rate"] = self.hit_rate()
+        report["name_hit_rate"] = self.name_hit_rate()
+        return report
+
+    def __str__(self):
+        return ("types: " + str(self.lookups) + " lookups (" + format(self.hit_rate() * 100, ".0f") + "% hits), "
+            + str(self.name_lookups) + " names (" + format(self.name_hit_rate() * 100, ".0f") + "% hits), "
+            + str(self.resolved_nodes) + " nodes resolved, " + str(self.node_hits) + " already resolved")
+
+class TypeTable:
+    # canonical types by structure, shared by every module resolved with it
+
+    def __init__(self):
+        # ("function", argument, result) or ("struct", names, types) -> type,
+        # children are canonical already so the keys hash and compare by identity
+        self.types = {}
+        # type name -> NamedType, the memo of named type resolution
+        self.names = {}
+        self.stats = TypeStats()
+
+    def __len__(self):
+        return len(self.types) + len(self.names)
+
+    def named(self, name):
+        self.stats.name_lookups += 1
+        named = self.names.get(name)
+        if named is not None:
+            self.stats.name_hits += 1
+            return named
+        named = self.names[name] = NamedType(name, name in builtin_type_names)
+        return named
+
+    def function(self, argument, result):
+        return self.canonical(("function", argument, result), FunctionType, argument, result)
+
+    def struct(self, names, types):
+        return self.canonical(("struct", names, types), StructType, names, types)
+
+    def canonical(self, key, type_class, first, second):
+        self.stats.lookups += 1
+        found = self.types.get(key)
+        if found is not None:
+            self.stats.hits += 1
+            return found
+        found = self.types[key] = type_class(first, second)
+        return found
+
+    def resolve(self, node):
+        # canonical type of a type node, or None; sets resolved_type on it and every
+        # type node below it, nodes resolved before are not walked again
+        if node is None:
+            return None
+        stats = self.stats
+        stack = [(node, False)]
+        while stack:
+            item, children_done = stack.pop()
+            if item is None:
+                continue
+            if item.resolved_type is not None and not children_done:
+                stats.node_hits += 1
+                continue
+            item_type = type(item)
+            if item_type is TypeIdentifierNode:
+                item.resolved_type = self.named(item.identifier)
+            elif not children_done:
+                stack.append((item, True))
+                if item_type is FunctionTypeNode:
+                    stack.append((item.return_type, False))
+                    stack.append((item.argument_type, False))
+                else:
+                    for field in item.fields:
+                        stack.append((field.field_type, False))
+                continue
+            elif item_type is FunctionTypeNode:
+                item.resolved_type = self.function(resolved(item.argument_type), resolved(item.return_type))
+            else:
+                names = tuple(declared_name(field.field_identifier) for field in item.fields)
+                item.resolved_type = self.struct(names, tuple(resolved(field.field_type) for field in item.fields))
+            stats.resolved_nodes += 1
+        return node.resolved_type
+
+    def resolve_tree(self, root):
+        # signatures of all function definitions in a tree, returns how many
+        return SignaturePass(self).visit(root).count
+
+class SignaturePass(Visitor):
+    # resolves function signatures into table, run_passes can run it with other passes
+    # type nodes are resolved by TypeTable.resolve, the walk does not go into them
+
+    def __init__(self, table):
+        self.table = table
+        self.count = 0
+
+    def enter_FunctionDefinitionNode(self, node):
+        if node.function_type is not None:
+            self.table.resolve(node.function_type)
+            self.count += 1
+
+    def enter_FunctionTypeNode(self, node):
+        return skip_children
+
+    def enter_StructTypeNode(self, node):
+        return skip_children
+
+def resolved(node):
+    return node.resolved_type if node is not None else None
+
+if __name__ == "__main__":
+    import sys
+    from src.tokenizer import *
+    from src.parser import *
+    # one table over all files given, then functions grouped by identical signature
+    table = TypeTable()
+    signatures = {}
+    for file_name in sys.argv[1:]:
+        try:
+            parser = TokenParser(tokenize_path(file_name))
+            parser.print_errors = False
+            root = parser.parse_tokens()
+        except (TokenizerError, SyntaxError) as error:
+            print(file_name + ": " + str(error), file=sys.stderr)
+            continue
+        table.resolve_tree(root)
+        for node in walk(root):
+            if type(node) is FunctionDefinitionNode and node.function_type is not None:
+                signatures.setdefault(node.function_type.resolved_type, []).append(file_name + ":" + str(node.line) + " " + declared_name(node.identifier))
+    for signature, functions in sorted(signatures.items(), key=lambda item: -len(item[1])):
+        print(str(signature) + ": " + str(len(functions)) + " functions")
+    print(str(len(table)) + " canonical types, " + str(table.stats), file=sys.stderr)
@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import write_text
+from src.serialize import encode_tree, decode_tree
+from src.cache import FrontEndCache
+from src.symbols import SymbolIndex, collect_symbols
+from src.parallel import split_threshold, submit_slices, stitch_slices, buffer_tokens
+
+class FileResult:
+    # outcome of one file, only the tree and counts go back to the driver process, not the tokens
+    def __init__(self, file_name, root, diagnostic, token_count, source_bytes, seconds, cached=False, symbols=()):
+        self.file_name = file_name
+        # None when the file has a diagnostic
+        self.root = root
+        # encode_tree bytes of root while the result is on its way from a worker, pickle
+        # recurses into nodes and fails on deep trees
+        self.tree = None
+        # src.symbols.Symbol of its definitions, collected right after parsing
+        self.symbols = symbols
+        self.diagnostic = diagnostic
+        self.token_count = token_count
+        self.source_bytes = source_bytes
+        self.seconds = seconds
+        # tokens and tree came from the on-disk cache
+        self.cached = cached
+
+class ProjectResult:
+    def __init__(self, results, workers, seconds):
+        # in discovery order, whatever order the workers finished in
+        self.results = results
+        self.workers = workers
+        self.seconds = seconds
+
+    def token_count(self):
+        return sum(result.token_count for result in self.results)
+
+    def source_bytes(self):
+        return sum(result.source_bytes for result in self.results)
+
+    def cache_hits(self):
+        return sum(1 for result in self.results if result.cached)
+
+    def symbol_index(self):
+        index = SymbolIndex()
+        for result in self.results:
+            index.set_symbols(result.file_name, result.symbols)
+        return index
+
+    def diagnostics(self):
+        return [result for result in self.results if result.diagnostic is not None]
+
+    def tokens_per_second(self):
+        return self.token_count() / self.seconds if self.seconds > 0 else 0.0
+
+    def bytes_per_second(self):
+        return self.source_bytes() / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return (str(len(self.results)) + " files, " + str(len(self.diagnostics())) + " with errors, "
+            + str(self.token_count()) + " tokens in " + format(self.seconds * 1000, ".1f") + " ms on "
+            + str(self.workers) + " workers (" + format(self.tokens_per_second(), ".0f") + " tokens/s, "
+            + format(self.bytes_per_second() / 1024, ".0f") + " KiB/s, " + str(self.cache_hits()) + " cached)")
+
+def discover(directory, extension=".sima"):
+    # sorted so results come back in the same order on every run
+    file_names = []
+    for path, directories, files in os.walk(directory):
+        directories.sort()
+        for file in sorted(files):
+            if file.endswith(extension):
+                file_names.append(os.path.join(path, file))
+    return file_names
+
+# FrontEndCache per directory in this process, it keeps the directory size between files
+caches = {}
+
+def front_end_cache(cache_directory):
+    cache = caches.get(cache_directory)
+    if cache is None:
+        cache = caches[cache_directory] = FrontEndCache(cache_directory)
+    return cache
+
+def file_size(file_name):
+    try:
+        return os.path.getsize(file_name)
+    except OSError:
+        return 0
+
+def process_file(file_name, cache_directory=None):
+    # runs in the worker processes, errors are returned as diagnostics
+    start = time.perf_counter()
+    text = ""
+    tokens = []
+    root = None
+    diagnostic = None
+    cached = False
+    try:
+        text = read_source(file_name)
+        if cache_directory is not None:
+            cache = front_end_cache(cache_directory)
+            hits = cache.stats.hits
+            tokens, root = cache.front_end(file_name, text)
+            cached = cache.stats.hits > hits
+        else:
+            tokens = TextTokenizer(file_name, text).tokenize()
+            parser = TokenParser(tokens)
+            parser.print_errors = False
+            root = parser.parse_tokens()
+        symbols = collect_symbols(file_name, root)
+    except (TokenizerError, SyntaxError, OSError, UnicodeDecodeError) as error:
+        diagnostic = str(error)
+        symbols = []
+    return FileResult(file_name, root, diagnostic, len(tokens), len(text), time.perf_counter() - start, cached, symbols)
+
+def failed_file(file_name, error):
+    # result of a file whose processing failed in a way process_file does not expect
+    return FileResult(file_name, None, "internal error: " + type(error).__name__ + ": " + str(error), 0, 0, 0.0)
+
+def checked_file(file_name, cache_directory=None):
+    # process_file, anything else going wrong becomes the diagnostic of that file only
+    try:
+        return process_file(file_name, cache_directory)
+    except Exception as error:
+        return failed_file(file_name, error)
+
+def encoded_file(file_name, cache_directory=None):
+    # runs in the worker processes: checked_file with the tree as bytes, decoded_file
+    # turns it back into the tree and symbols in the driver process
+    result = checked_file(file_name, cache_directory)
+    if result.root is not None:
+        try:
+            result.tree = encode_tree(result.root)
+        except Exception as error:
+            return failed_file(file_name, error)
+        result.root = None
+        result.symbols = ()
+    return result
+
+def decoded_file(result):
+    if result.tree is not None:
+        result.root = decode_tree(result.tree)
+        result.tree = None
+        result.symbols = collect_symbols(result.file_name, result.root)
+    return result
+
+def process_split_file(file_name, text, parts, start, cache=None):
+    # rest of process_file for a file whose slices were handed to the workers with
+    # src.parallel.submit_slices, runs in this process while they go on with other files
+    tokens = []
+    root = None
+    diagnostic = None
+    try:
+        tokens = stitch_slices(file_name, text, parts)
+        parser = TokenParser(buffer_tokens(tokens))
+        parser.print_errors = False
+        root = parser.parse_tokens()
+        if cache is not None:
+            cache.store(text, tokens, root)
+        symbols = collect_symbols(file_name, root)
+    except (TokenizerError, SyntaxError) as error:
+        diagnostic = str(error)
+        symbols = []
+    return FileResult(file_name, root, diagnostic, len(tokens), len(text), time.perf_counter() - start, False, symbols)
+
+def process_files(file_names, workers=None, chunksize=None, cache_directory=None, threshold=split_threshold):
+    # workers defaults to the cpu count, a single worker runs in this process
+    # with cache_directory unchanged files are loaded from a src.cache.FrontEndCache
+    # with more than one worker, files of threshold bytes or more are lexed in slices
+    # by all workers and parsed in this process, see src.parallel
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(file_names)))
+    start = time.perf_counter()
+    if workers == 1:
+        results = [checked_file(file_name, cache_directory) for file_name in file_names]
+        return ProjectResult(results, workers, time.perf_counter() - start)
+    split = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # slices are queued before the other files, this process parses the split
+        # files while the workers go on with the rest
+        pending = []
+        for file_name in file_names:
+            if file_size(file_name) < threshold:
+                continue
+            file_start = time.perf_counter()
+            try:
+                text = read_source(file_name)
+            except (OSError, UnicodeDecodeError):
+                # process_file reports it
+                continue
+            cache = front_end_cache(cache_directory) if cache_directory is not None else None
+            if cache is not None:
+                cached = cache.lookup(file_name, text)
+                if cached is not None:
+                    tokens, root = cached
+                    split[file_name] = FileResult(file_name, root, None, len(tokens), len(text), time.perf_counter() - file_start, True, collect_symbols(file_name, root))
+                    continue
+            pending.append((file_name, text, submit_slices(file_name, text, executor, workers), file_start, cache))
+            split[file_name] = None
+        others = [file_name for file_name in file_names if file_name not in split]
+        if chunksize is None:
+            # few round trips per worker, small enough to even out uneven file sizes
+            chunksize = max(1, len(others) // (workers * 4))
+        results = executor.map(partial(encoded_file, cache_directory=cache_directory), others, chunksize=chunksize)
+        for file_name, text, parts, file_start, cache in pending:
+            try:
+                split[file_name] = process_split_file(file_name, text, parts, file_start, cache)
+            except Exception as error:
+                split[file_name] = failed_file(file_name, error)
+        results = {result.file_name: decoded_file(result) for result in results}
+    results.update(split)
+    return ProjectResult([results[file_name] for file_name in file_names], workers, time.perf_counter() - start)
+
+def process_project(directory, workers=None, chunksize=None, cache_directory=None, threshold=split_threshold):
+    return process_files(discover(directory), workers, chunksize, cache_directory, threshold)
+
+def file_stamp(file_name):
+    status = os.stat(file_name)
+    return (status.st_mtime_ns, status.st_size)
+
+def refresh_index(index, directory, workers=None):
+    # parses only files added or changed since their stamp and drops removed ones,
+    # returns the ProjectResult of the parsed files
+    file_names = discover(directory)
+    present = set(file_names)
+    for file_name in list(index.files):
+        if file_name not in present:
+            index.remove_file(file_name)
+    stamps = {file_name: file_stamp(file_name) for file_name in file_names}
+    changed = [file_name for file_name in file_names if file_name not in index.files or index.stamp(file_name) != stamps[file_name]]
+    project = process_files(changed, workers)
+    for result in project.results:
+        # files with errors keep no symbols until they parse again, the stamp
+        # is kept so they are not parsed again while unchanged
+        index.set_symbols(result.file_name, result.symbols, stamps[result.file_name])
+    return project
+
+if __name__ == "__main__":
+    import argparse
+    # workers unpickle results by module name, so use src.driver and not __main__
+    import src.driver as driver
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, help="processes, defaults to the cpu count")
+    parser.add_argument("--chunksize", type=int, help="files sent to a worker at once")
+    parser.add_argument("--cache", help="directory of the on-disk token and tree cache")
+    parser.add_argument("--split-threshold", type=int, default=split_threshold, help="bytes from which one file is lexed in slices by all workers")
+    parser.add_argument("--print-trees", action="store_true")
+    args = parser.parse_args()
+
+    project = driver.process_project(args.directory, args.workers, args.chunksize, args.cache, args.split_threshold)
+    for result in project.results:
+        if result.diagnostic is not None:
+            print(result.file_name + ": " + result.diagnostic)
+        elif args.print_trees:
+            print(result.file_name)
+            write_text(result.root, sys.stdout)
+            print()
+    print(str(project), file=sys.stderr)
+    if project.diagnostics():
+        sys.exit(1)
@@ -0,0 +1,130 @@
+from src.syntax import *
+from src.symbols import collect_symbols
+
+# runs parsed programs in process: every function body is compiled once, on its
+# first call, into Python closures with literal values already converted, calls
+# after that only run the closures and never look at the tree again
+# a function returns the value of its first ret, or of its last expression when it
+# has none
+
+class EvaluationError(Exception):
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __str__(self):
+        return self.reason
+
+class Atom:
+    # one object per atom name, compared with `is`
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+atoms = {}
+
+def atom(name):
+    found = atoms.get(name)
+    if found is None:
+        found = atoms[name] = Atom(name)
+    return found
+
+def constant(value):
+    return lambda: value
+
+# literal node class -> value of the literal
+literal_values = {
+    IntegerLiteralNode: lambda node: int(node.value),
+    FloatLiteralNode: lambda node: float(node.value),
+    StringLiteralNode: lambda node: node.value,
+    AtomLiteralNode: lambda node: atom(node.identifier),
+}
+
+class CompiledFunction:
+    __slots__ = ('name', 'node', 'run')
+
+    def __init__(self, name, node, run):
+        self.name = name
+        self.node = node
+        # closure taking the argument, returns the result
+        self.run = run
+
+class Program:
+    # functions of a tree by qualified name, compiled the first time they are called
+
+    def __init__(self, root, file_name="<program>"):
+        # qualified name -> FunctionDefinitionNode, the first definition wins
+        self.definitions = {}
+        for symbol in collect_symbols(file_name, root):
+            if symbol.kind == "function" and symbol.name not in self.definitions:
+                self.definitions[symbol.name] = symbol.node
+        # qualified name -> CompiledFunction
+        self.compiled = {}
+
+    def function(self, name):
+        compiled = self.compiled.get(name)
+        if compiled is None:
+            node = self.definitions.get(name)
+            if node is None:
+                raise EvaluationError("Unknown function " + name)
+            compiled = self.compiled[name] = CompiledFunction(name, node, self.compile_body(node))
+        return compiled
+
+    def call(self, name, argument=None):
+        return self.function(name).run(argument)
+
+    def compile_expression(self, node):
+        # closure without arguments returning the value of node
+        # ret inside an expression returns what it wraps, nested ret chains are unwrapped
+        while type(node) is FunctionReturnNode:
+            node = node.return_value
+        if node is None:
+            return constant(None)
+        convert = literal_values.get(type(node))
+        if convert is None:
+            raise EvaluationError("Cannot evaluate " + type(node).__name__ + " at line " + str(node.line))
+        return constant(convert(node))
+
+    def compile_body(self, definition):
+        # every expression is a literal so far, statements before the one giving the
+        # result cannot have effects and are only compiled to report errors early;
+        # calls will have to keep them
+        result = constant(None)
+        for node in definition.body:
+            node_type = type(node)
+            if node_type is DefinitionEndNode or node_type is FunctionDefinitionNode or node_type is ModuleDefinitionNode:
+                continue
+            if node_type is FunctionReturnNode:
+                result = self.compile_expression(node.return_value)
+                break
+            result = self.compile_expression(node)
+        return lambda argument: result()
+
+def run(root, name, argument=None):
+    # calls the function with qualified name in the program of root and returns its result
+    return Program(root).call(name, argument)
+
+def format_value(value):
+    if value is None:
+        return "nil"
+    if type(value) is str:
+        return "\"" + value + "\""
+    return str(value)
+
+if __name__ == "__main__":
+    import sys
+    from src.tokenizer import *
+    from src.parser import *
+    file_name = sys.argv[1]
+    name = sys.argv[2] if len(sys.argv) > 2 else "Main.main"
+    try:
+        parser = TokenParser(tokenize_path(file_name))
+        parser.print_errors = False
+        root = parser.parse_tokens()
+        print(format_value(Program(root, file_name).call(name)))
+    except (TokenizerError, SyntaxError, EvaluationError) as error:
+        print(file_name + ": " + str(error), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,592 @@
+from bisect import bisect_left, bisect_right
+from operator import attrgetter, itemgetter
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import child_fields
+
+# an edit moves everything after it; instead of visiting all of that, the move is left
+# pending from a gap on, like in a gap buffer: tokens, line starts and top level entries
+# from the gap on are stored without it and it is added when they are looked up; the
+# gap moves to the next edit, so an edit costs the edited block and the stretch between
+# it and the edit before, never the rest of the document
+
+token_start = attrgetter('start')
+entry_start = itemgetter(0)
+entry_end = itemgetter(1)
+
+class Shift:
+    # characters still to add to the offsets of the tokens sharing it
+    __slots__ = ('chars',)
+
+    def __init__(self):
+        self.chars = 0
+
+class DocumentToken(Token):
+    # Token of an IncrementalDocument, start is offset plus the pending shift of its side
+    # of the gap; lines and columns come from the DocumentLines, which know their gap
+    __slots__ = ('offset', 'shift')
+
+    def __init__(self, type, value, source, start, end, shift):
+        self.type = type
+        self.value = value
+        self.source = source
+        self.shift = shift
+        self.offset = start - shift.chars
+        self.length = end - start
+
+    @property
+    def start(self):
+        return self.offset + self.shift.chars
+
+    def position(self):
+        return self.source.position(self.offset + self.shift.chars)
+
+    @property
+    def line(self):
+        return self.source.line(self.offset + self.shift.chars)
+
+    @property
+    def start_column(self):
+        return self.source.position(self.offset + self.shift.chars)[1]
+
+class DocumentLines(LineIndex):
+    # LineIndex of an IncrementalDocument, line starts from gap on are stored without shift
+    # the text is only read to build the starts, edits do not keep it
+
+    def line_starts(self):
+        # the starts with nothing pending, for code reading the list itself
+        if self.starts is None:
+            LineIndex.line_starts(self)
+            self.text = None
+            self.gap = len(self.starts)
+            self.shift = 0
+        else:
+            self.move_gap(len(self.starts))
+        return self.starts
+
+    def move_gap(self, index):
+        starts = self.starts
+        gap = self.gap
+        shift = self.shift
+        if shift:
+            if index > gap:
+                starts[gap:index] = [start + shift for start in starts[gap:index]]
+            elif index < gap:
+                starts[index:gap] = [start - shift for start in starts[index:gap]]
+        self.gap = index
+        if index == len(starts):
+            self.shift = 0
+
+    def line(self, offset):
+        starts = self.starts
+        if starts is None:
+            starts = self.line_starts()
+        gap = self.gap
+        if gap < len(starts) and offset >= starts[gap] + self.shift:
+            return bisect_right(starts, offset - self.shift, gap)
+        return bisect_right(starts, offset, 0, gap)
+
+    def line_start(self, line):
+        index = line - 1
+        if index >= self.gap:
+            return self.starts[index] + self.shift
+        return self.starts[index]
+
+    def position(self, offset):
+        line = self.line(offset)
+        return line, offset - self.line_start(line) + 1
+
+    def end_column(self, start, end):
+        return end - self.line_start(self.line(start)) + 1
+
+    def join(self, offset):
+        joined = self.joined
+        index = bisect_left(joined, offset)
+        if index < len(joined) and joined[index] == offset:
+            return
+        joined.insert(index, offset)
+        if self.starts is None:
+            return
+        index = self.line(offset + 1) - 1
+        if index >= 0 and self.line_start(index + 1) == offset + 1:
+            del self.starts[index]
+            if index < self.gap:
+                self.gap -= 1
+
+    def split_from(self, offset):
+        index = bisect_left(self.joined, offset)
+        split = self.joined[index:]
+        del self.joined[index:]
+        if self.starts is not None:
+            for newline in split:
+                # after the line start of newline, which is not a line start itself
+                index = self.line(newline + 1)
+                if index <= self.gap:
+                    self.starts.insert(index, newline + 1)
+                    self.gap += 1
+                else:
+                    self.starts.insert(index, newline + 1 - self.shift)
+        return split
+
+    def edit(self, start, end, replacement):
+        # the starts after the edited ones take its shift as pending, from a gap after them
+        shift = len(replacement) - (end - start)
+        joined = self.joined
+        if joined:
+            first = bisect_left(joined, start)
+            joined[first:] = [newline + shift for newline in joined[bisect_left(joined, end, first):]]
+        starts = self.starts
+        if starts is None:
+            return
+        first = self.line(start)
+        last = self.line(end)
+        self.move_gap(last)
+        added = []
+        position = replacement.find("\n")
+        while position >= 0:
+            added.append(start + position + 1)
+            position = replacement.find("\n", position + 1)
+        starts[first:last] = added
+        self.gap = first + len(added)
+        if self.gap == len(starts):
+            self.shift = 0
+        else:
+            self.shift += shift
+
+class LinesBeforeEdit:
+    # line positions of the text before one edit, made before the DocumentLines take it;
+    # offsets after the edit are looked up in the edited lines and counted back, so
+    # nothing the size of the document is copied
+
+    def __init__(self, lines, text, start, end, replacement):
+        self.lines = lines
+        self.text = text
+        self.joined = list(lines.joined)
+        self.start = start
+        self.end = end
+        self.shift = len(replacement) - (end - start)
+        # newlines the edit removed less the ones it added
+        self.newlines = text.count("\n", start, end) - replacement.count("\n")
+
+    def line(self, offset):
+        # lines differ only by newlines removed or added and by newlines joined or not
+        joined = self.joined
+        if self.start < offset < self.end:
+            return self.line(self.start) + self.text.count("\n", self.start, offset) - bisect_left(joined, offset) + bisect_left(joined, self.start)
+        lines = self.lines
+        new_offset = offset + self.shift if offset >= self.end else offset
+        line = lines.line(new_offset) + bisect_left(lines.joined, new_offset) - bisect_left(joined, offset)
+        if offset >= self.end:
+            line += self.newlines
+        return line
+
+    def position(self, offset):
+        text = self.text
+        joined = self.joined
+        newline = text.rfind("\n", 0, offset)
+        while newline >= 0:
+            index = bisect_left(joined, newline)
+            if index == len(joined) or joined[index] != newline:
+                break
+            newline = text.rfind("\n", 0, newline)
+        return self.line(offset), offset - newline
+
+def same_token(old, old_lines, new, new_lines, line_shift):
+    # old positions are looked up in the line positions from before the edit
+    if old.type != new.type or old.value != new.value:
+        return False
+    old_line, old_column = old_lines.position(old.start)
+    line, column = new_lines.position(new.start)
+    return old_line + line_shift == line and old_column == column
+
+class EditResult:
+    # what apply_edit redid, token indexes are into the edited token list
+    def __init__(self):
+        # whole document was tokenized and parsed again
+        self.full = False
+        self.first_token = 0
+        # old tokens replaced and new tokens produced by the tokenizer
+        self.removed_tokens = 0
+        self.lexed_tokens = 0
+        # tokens after the edit whose offset, and maybe line, moved; the move is pending
+        self.shifted_tokens = 0
+        # node parsed again, the root when top level parsing was resumed, None when nothing changed
+        self.reparsed = None
+        self.reparsed_tokens = 0
+
+class IncrementalDocument:
+    # tokens and syntax tree of one source text, kept up to date under edits
+    # an edit is relexed from the token in front of it until the tokenizer is back
+    # in step with the old tokens, then only the innermost definition body node
+    # that read a changed token is parsed again, or top level nodes until the
+    # parser is back in step with the old ones; all other nodes are kept as they are
+    # a TokenizerError or SyntaxError is raised like the full pipeline would,
+    # the next edit then tokenizes and parses the whole text again
+    # tokens after the last edit get their offsets through a shared Shift, top level
+    # entries from top_gap on are stored without top_shift and line_shift, and node
+    # lines are only moved when root is read, see the comment at the top
+
+    def __init__(self, file_name, text):
+        self.file_name = file_name
+        self.text = text
+        self.rebuild()
+
+    def rebuild(self):
+        self.valid = False
+        tokenizer = TextTokenizer(self.file_name, self.text)
+        # shared by all tokens, kept up to date by edits
+        self.lines = tokenizer.lines = DocumentLines(self.file_name, self.text)
+        # tokens before token_gap share exact, the ones from it on shift
+        self.exact = Shift()
+        self.shift = Shift()
+        self.tokens = []
+        self.append_records(tokenizer.scan(), self.tokens)
+        self.lines.line_starts()
+        self.token_gap = len(self.tokens)
+        # [start index, end index, node, units, lines] of top level nodes, like TokenParser.iter_nodes
+        # units are [start, end, node, body] of the nodes in its definition bodies,
+        # indexes relative to the top level start so they do not move with it
+        # lines is added to the lines of its nodes when they are next read
+        self.top = self.parse_top(self.parser(-1), None)
+        self.top_gap = len(self.top)
+        self.top_shift = 0
+        self.line_shift = 0
+        self.tree = RootNode([entry[2] for entry in self.top])
+        self.valid = True
+
+    @property
+    def root(self):
+        if self.valid:
+            self.settle_lines()
+        return self.tree
+
+    def append_records(self, records, tokens, stop=None):
+        # stop(start) ends the scan before a record, its result is returned
+        text = self.text
+        lines = self.lines
+        types = token_types
+        exact = self.exact
+        for code, value_start, value_end, start, end in records:
+            if stop is not None:
+                found = stop(start)
+                if found is not None:
+                    return found
+            tokens.append(DocumentToken(types[code], text[value_start:value_end] if value_start >= 0 else None, lines, start, end, exact))
+        return None
+
+    def token_index(self, offset):
+        # index of the last token starting at or before offset, -1 when there is none
+        return bisect_right(self.tokens, offset, key=token_start) - 1
+
+    def parser(self, current_index):
+        parser = TokenParser(self.tokens)
+        parser.spans = []
+        parser.current_index = current_index
+        return parser
+
+    def parse_top(self, parser, in_step):
+        # TokenParser.iter_nodes without printing, in_step(end index) ends it early
+        top = []
+        while parser.current_index < 0 or parser.has_token(parser.current_index):
+            start = parser.current_index
+            recorded = len(parser.spans)
+            try:
+                node = parser.parse_next()
+            except SyntaxError:
+                raise
+            except:
+                # body nodes of the unfinished node are not in the tree
+                del parser.spans[recorded:]
+                break
+            units = [[span[0] - start, span[1] - start, span[2], span[3]] for span in parser.spans[recorded:]]
+            top.append([start, parser.current_index, node, units, 0])
+            if in_step is not None and in_step(parser.current_index):
+                break
+        return top
+
+    def apply_edit(self, start, end, replacement):
+        # replaces text[start:end] with replacement, returns EditResult
+        if start < 0 or end < start or end > len(self.text):
+            raise ValueError("invalid edit range " + str(start) + ":" + str(end) + " for text of length " + str(len(self.text)))
+        old_text = self.text
+        self.text = old_text[:start] + replacement + old_text[end:]
+        result = EditResult()
+        if not self.valid:
+            self.rebuild()
+            result.full = True
+            result.lexed_tokens = len(self.tokens)
+            result.reparsed = self.tree
+            result.reparsed_tokens = len(self.tokens)
+            return result
+        self.valid = False
+        old_lines = LinesBeforeEdit(self.lines, old_text, start, end, replacement)
+        self.lines.edit(start, end, replacement)
+        first, old_end, new_end = self.relex(start, end, replacement, old_lines, result)
+        if old_end > first or new_end > first:
+            self.reparse(first, old_end, new_end, result)
+        if self.top_gap < len(self.top):
+            self.top_shift += new_end - old_end
+        self.valid = True
+        return result
+
+    def move_token_gap(self, index):
+        tokens = self.tokens
+        gap = self.token_gap
+        exact = self.exact
+        shift = self.shift
+        if index > gap:
+            for token in tokens[gap:index]:
+                token.offset += shift.chars
+                token.shift = exact
+        elif index < gap:
+            for token in tokens[index:gap]:
+                token.offset -= shift.chars
+                token.shift = shift
+        self.token_gap = index
+
+    def relex(self, edit_start, edit_end, replacement, old_lines, result):
+        # returns the token range whose types or values changed as first, old end, new end
+        # self.lines already has the line starts of the edited text, old_lines the ones before
+        # the old tokens keep their old offsets until they are replaced or shifted at the end
+        tokens = self.tokens
+        lines = self.lines
+        char_shift = len(replacement) - (edit_end - edit_start)
+        # the last token starting before the edit can run into it
+        first = self.token_index(edit_start - 1)
+        if first < 0:
+            first = 0
+            position = 0
+        else:
+            position = tokens[first].start
+        self.move_token_gap(first)
+        replaced_end = edit_start + len(replacement)
+        candidate = [first]
+        # newlines joined by strings are found again by the scan, the ones after it are put back
+        split = lines.split_from(position)
+        tokenizer = TextTokenizer(self.file_name, self.text)
+        tokenizer.lines = lines
+
+        def in_step(start):
+            # an old token starting at the same place after the edit, with the same column,
+            # is lexed from the same state and so are all tokens after it
+            if start < replaced_end:
+                return None
+            old_start = start - char_shift
+            index = bisect_left(tokens, old_start, candidate[0], key=token_start)
+            candidate[0] = index
+            if index < len(tokens) and tokens[index].start == old_start:
+                old_line, old_column = old_lines.position(old_start)
+                line, column = lines.position(start)
+                if column == old_column:
+                    return index, line - old_line
+            return None
+
+        new_tokens = []
+        found = self.append_records(tokenizer.scan(position), new_tokens, in_step)
+        resume, line_shift = found if found is not None else (len(tokens), 0)
+        if resume < len(tokens):
+            resume_start = tokens[resume].start + char_shift
+            for newline in split:
+                if newline >= resume_start:
+                    lines.join(newline)
+
+        # tokens after the relexed ones keep their objects, so do nodes starting at them
+        if resume < len(tokens):
+            line, column = old_lines.position(tokens[resume].start)
+        else:
+            line, column = None, None
+        self.shift_lines(first, resume, line, column, line_shift)
+        result.shifted_tokens = len(tokens) - resume
+
+        # narrow the changed range to tokens that differ in more than the line shift,
+        # nodes keep the position of their first token
+        old_tokens = tokens[first:resume]
+        prefix = 0
+        while prefix < len(old_tokens) and prefix < len(new_tokens) and same_token(old_tokens[prefix], old_lines, new_tokens[prefix], lines, 0):
+            prefix += 1
+        suffix = 0
+        while suffix < len(old_tokens) - prefix and suffix < len(new_tokens) - prefix and same_token(old_tokens[-1 - suffix], old_lines, new_tokens[-1 - suffix], lines, line_shift):
+            suffix += 1
+
+        tokens[first:resume] = new_tokens
+        self.token_gap = first + len(new_tokens)
+        if self.token_gap == len(tokens):
+            self.shift.chars = 0
+        else:
+            self.shift.chars += char_shift
+        result.first_token = first
+        result.removed_tokens = len(old_tokens)
+        result.lexed_tokens = len(new_tokens)
+        return first + prefix, resume - suffix, first + len(new_tokens) - suffix
+
+    def find_top(self, index, field=entry_end):
+        # first top level entry whose end, or start, index is index or after it
+        top = self.top
+        gap = self.top_gap
+        found = bisect_left(top, index, 0, gap, key=field)
+        if found == gap:
+            found = bisect_left(top, index - self.top_shift, gap, len(top), key=field)
+        return found
+
+    def move_top_gap(self, index):
+        top = self.top
+        gap = self.top_gap
+        if index > gap:
+            for entry in top[gap:index]:
+                entry[0] += self.top_shift
+                entry[1] += self.top_shift
+                entry[4] += self.line_shift
+        elif index < gap:
+            for entry in top[index:gap]:
+                entry[0] -= self.top_shift
+                entry[1] -= self.top_shift
+                entry[4] -= self.line_shift
+        self.top_gap = index
+        if index == len(top):
+            self.top_shift = 0
+            self.line_shift = 0
+
+    def shift_lines(self, first, resume, line, column, line_shift):
+        # old tokens from resume on moved by line_shift lines; top level entries from the
+        # one holding token first to the last one starting before resume are settled now,
+        # the later ones take line_shift as pending, like their token indexes take the
+        # token shift once the edit is parsed
+        index = self.find_top(first)
+        after = self.find_top(resume, entry_start)
+        self.move_top_gap(after)
+        for entry in self.top[index:after]:
+            self.shift_node_lines(entry, line, column, line_shift)
+        if after < len(self.top):
+            self.line_shift += line_shift
+
+    def shift_node_lines(self, entry, line, column, line_shift):
+        # adds the pending lines of a top level entry to its nodes, and line_shift to the
+        # ones starting at or after line and column
+        pending = entry[4]
+        if pending == 0 and line_shift == 0:
+            return
+        entry[4] = 0
+        stack = [entry[2]]
+        while stack:
+            node = stack.pop()
+            if node.line is not None:
+                node.line += pending
+                if line_shift != 0 and (node.line > line or (node.line == line and node.column >= column)):
+                    node.line += line_shift
+            for field in child_fields[type(node)]:
+                value = getattr(node, field)
+                if type(value) is list:
+                    stack.extend(value)
+                elif value is not None:
+                    stack.append(value)
+
+    def settle_lines(self):
+        # moves the nodes of every entry with pending lines, entries keep their place
+        # before or after the gap
+        top = self.top
+        gap = self.top_gap
+        for entry in top[:gap]:
+            if entry[4] != 0:
+                self.shift_node_lines(entry, None, None, 0)
+        line_shift = self.line_shift
+        for entry in top[gap:]:
+            if entry[4] != -line_shift:
+                entry[4] += line_shift
+                self.shift_node_lines(entry, None, None, 0)
+                entry[4] = -line_shift
+
+    def reparse(self, first, old_end, new_end, result):
+        # old tokens [first, old_end) became [first, new_end), later indexes moved by shift
+        # entries before top_gap are in old indexes, the ones from it on take shift later
+        shift = new_end - old_end
+        top = self.top
+        index = self.find_top(first)
+        if index < len(top) and top[index][0] < first and old_end <= top[index][1]:
+            entry = top[index]
+            base = entry[0]
+            # body nodes which read the changed tokens, innermost first
+            enclosing = [unit for unit in entry[3] if base + unit[0] < first and old_end <= base + unit[1]]
+            enclosing.sort(key=lambda unit: unit[0], reverse=True)
+            for unit in enclosing:
+                start, end, node, body = unit
+                parser = self.parser(base + start)
+                try:
+                    new_node = parser.parse_next()
+                except SyntaxError:
+                    raise
+                except:
+                    # ends the top level loop of a full parse
+                    break
+                # the rest of the body is only in step when the same, unchanged, token ends the node
+                new_end_index = parser.current_index - base
+                if new_end_index - shift != end or parser.current_index < new_end:
+                    continue
+                for position, item in enumerate(body):
+                    if item is node:
+                        body[position] = new_node
+                        break
+                self.replace_units(entry, start, end, shift, parser.spans, [start, new_end_index, new_node, body])
+                entry[1] += shift
+                for later in top[index + 1:self.top_gap]:
+                    later[0] += shift
+                    later[1] += shift
+                result.reparsed = new_node
+                result.reparsed_tokens = new_end_index - start
+                return
+        self.reparse_top(index, new_end, shift, result)
+
+    def reparse_top(self, index, new_end, shift, result):
+        top = self.top
+        gap = self.top_gap
+        start = top[index - 1][1] if index > 0 else -1
+        old = [index]
+        resume = [len(top)]
+
+        def old_end(position):
+            if position >= gap:
+                return top[position][1] + self.top_shift
+            return top[position][1]
+
+        def in_step(end):
+            # parsing goes on the same way after an old top level end if no changed token is left
+            if end < new_end - 1:
+                return False
+            while old[0] < len(top) and old_end(old[0]) < end - shift:
+                old[0] += 1
+            if old[0] < len(top) and old_end(old[0]) == end - shift:
+                resume[0] = old[0] + 1
+                return True
+            return False
+
+        parser = self.parser(start)
+        parsed = self.parse_top(parser, in_step)
+        resume = resume[0]
+        for later in top[resume:gap]:
+            later[0] += shift
+            later[1] += shift
+        top[index:resume] = parsed
+        self.tree.content[index:resume] = [entry[2] for entry in parsed]
+        # parsed entries are exact, the kept ones after the gap stay pending
+        self.top_gap = max(gap, resume) + len(parsed) - (resume - index)
+        if self.top_gap == len(top):
+            self.top_shift = 0
+            self.line_shift = 0
+        result.reparsed = self.tree
+        result.reparsed_tokens = (parser.current_index if parsed else start) - start
+
+    def replace_units(self, entry, start, end, shift, spans, replacement):
+        # drops body nodes of the old node between start and end, shifts the ones after it
+        base = entry[0]
+        units = []
+        for unit in entry[3]:
+            if unit[0] >= start and unit[1] <= end:
+                continue
+            if unit[0] >= end:
+                unit[0] += shift
+                unit[1] += shift
+            elif unit[1] >= end:
+                unit[1] += shift
+            units.append(unit)
+        units.extend([span[0] - base, span[1] - base, span[2], span[3]] for span in spans)
+        units.append(replacement)
+        entry[3] = units
@@ -0,0 +1,137 @@
+import os
+import re
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from src.tokenizer import *
+
+# lexes one large source in slices on worker processes and stitches the tokens back
+# into what a single TextTokenizer gives for the whole text
+# a slice starts at the first character after a run of blanks holding a newline, which
+# is always a token start: comments stop in front of a newline, a string ends at one,
+# and from there blanks are skipped or merged into a newline token up to that character
+# records carry absolute offsets, so stitching is concatenation; lines and columns come
+# from one LineIndex with the newlines joined by strings of every slice
+
+# sources with fewer characters are lexed in one piece
+split_threshold = 1 << 20
+split_pattern = re.compile(r'\n[ \t\n]*')
+# TokenBuffer columns returned by lex_slice, in record order
+buffer_columns = ("types", "value_starts", "value_ends", "starts", "ends")
+
+class SliceTokenizer(TextTokenizer):
+    # keeps what an error was about, the message needs the line starts of all slices
+    # before it and is made by the process which has them
+
+    def __init__(self, file_name, text):
+        TextTokenizer.__init__(self, file_name, text)
+        self.error_char = None
+        self.error_offset = None
+
+    def error(self, char, offset):
+        self.error_char = char
+        self.error_offset = offset
+        return TokenizerError("Invalid token: " + char)
+
+def split_points(text, slices):
+    # starts of at most slices slices of about equal size, the first one is 0
+    points = [0]
+    length = len(text)
+    for index in range(1, slices):
+        target = max(length * index // slices, points[-1])
+        found = split_pattern.search(text, target)
+        if found is None or found.end() >= length:
+            break
+        if found.end() > points[-1]:
+            points.append(found.end())
+    return points
+
+def lex_slice(file_name, start, text, cut):
+    # runs in the worker processes: (columns, joined newlines, error) for the tokens of
+    # one slice starting at offset start of the source, error is (char, offset) or None;
+    # offsets are those of the whole source
+    # with cut the slice ends in front of more text: every token before the cut is
+    # followed by the blanks in front of it, so the text can end there, and a newline is
+    # put in place of the rest because a string may have taken the last one, the blanks
+    # after it would be an error at the end of the text
+    if cut:
+        text += "\n"
+    tokenizer = SliceTokenizer(file_name, text)
+    tokens = TokenBuffer(file_name, text)
+    tokens.lines = tokenizer.lines
+    joined = tokenizer.lines.joined
+    try:
+        records = tokenizer.scan()
+        tokens.extend((code, value_start + start if value_start >= 0 else value_start, value_end + start if value_end >= 0 else value_end, token_start + start, end + start)
+            for code, value_start, value_end, token_start, end in records)
+    except TokenizerError:
+        return None, [newline + start for newline in joined], (tokenizer.error_char, tokenizer.error_offset + start)
+    columns = tuple(getattr(tokens, column) for column in buffer_columns)
+    # the newline token of the added newline starts the next slice
+    if cut and len(tokens) > 0 and tokens.starts[-1] >= start + len(text) - 1:
+        for values in columns:
+            values.pop()
+    return columns, [newline + start for newline in joined], None
+
+def submit_slices(file_name, text, executor, slices):
+    # lexing of text in slices on executor, the workers start right away and each gets
+    # only its own slice; returns what stitch_slices takes
+    points = split_points(text, slices)
+    stops = points[1:] + [len(text)]
+    return executor.map(partial(lex_slice, file_name), points, [text[start:stop] for start, stop in zip(points, stops)], [stop < len(text) for stop in stops])
+
+def stitch_slices(file_name, text, parts):
+    # TokenBuffer of the slices in order, a TokenizerError is raised for the first
+    # invalid token like a single scan would
+    tokens = TokenBuffer(file_name, text)
+    lines = tokens.lines
+    for columns, joined, error in parts:
+        for newline in joined:
+            lines.join(newline)
+        if error is not None:
+            tokenizer = TextTokenizer(file_name, text)
+            tokenizer.lines = lines
+            raise tokenizer.error(error[0], error[1])
+        for column, values in zip(buffer_columns, columns):
+            getattr(tokens, column).extend(values)
+    return tokens
+
+def buffer_tokens(tokens):
+    # Token list of a TokenBuffer, the parser reads these much faster than TokenViews
+    tokenizer = TextTokenizer(tokens.file_name, tokens.text)
+    tokenizer.lines = tokens.lines
+    return list(tokenizer.iter_tokens(zip(*(getattr(tokens, column) for column in buffer_columns))))
+
+def tokenize_parallel(file_name, text, workers=None, threshold=split_threshold, executor=None):
+    # Token list equal to TextTokenizer(file_name, text).tokenize(), lexed in slices on
+    # workers processes when text has at least threshold characters
+    # executor is a running ProcessPoolExecutor to use instead of starting one
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(text) < threshold:
+        return TextTokenizer(file_name, text).tokenize()
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tokens = stitch_slices(file_name, text, submit_slices(file_name, text, executor, workers))
+    else:
+        tokens = stitch_slices(file_name, text, submit_slices(file_name, text, executor, workers))
+    return buffer_tokens(tokens)
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file")
+    parser.add_argument("--workers", type=int, help="processes, defaults to the cpu count")
+    parser.add_argument("--threshold", type=int, default=split_threshold, help="characters below which the file is lexed in one piece")
+    args = parser.parse_args()
+    text = read_source(args.file)
+    start = time.perf_counter()
+    try:
+        tokens = tokenize_parallel(args.file, text, args.workers, args.threshold)
+    except TokenizerError as error:
+        print(str(error))
+        sys.exit(1)
+    for token in tokens:
+        print(str(token))
+    print(str(len(tokens)) + " tokens in " + format((time.perf_counter() - start) * 1000, ".1f") + " ms", file=sys.stderr)
@@ -1,129 +1,451 @@
+from collections import deque
+from sys import intern
 from src.tokenizer import *
 from src.syntax import *
 
+class LookaheadBuffer:
+    # bounded window over a token iterator, indexed like a list
+    # only the last `size` tokens stay reachable, older ones are dropped
+
+    def __init__(self, tokens, size=2):
+        self.tokens = iter(tokens)
+        self.size = size
+        self.window = deque()
+        # index of the first token in window
+        self.offset = 0
+        self.exhausted = False
+
+    def __getitem__(self, index):
+        while not self.exhausted and index >= self.offset + len(self.window):
+            token = next(self.tokens, None)
+            if token is None:
+                self.exhausted = True
+            else:
+                self.window.append(token)
+                if len(self.window) > self.size:
+                    self.window.popleft()
+                    self.offset += 1
+        if index < self.offset:
+            raise IndexError("token " + str(index) + " is out of lookahead window")
+        if index >= self.offset + len(self.window):
+            raise IndexError("token " + str(index) + " is past end of stream")
+        return self.window[index - self.offset]
+
+class EndOfTokens(Exception):
+    # raised when the tokens run out where a node could start
+    pass
+
+class Diagnostic:
+    # a syntax error found by a recovering parse, the span is that of the token it
+    # was found at, on its line
+    __slots__ = ('message', 'file_name', 'line', 'column', 'end_column')
+
+    def __init__(self, message, token):
+        self.message = message
+        self.file_name = token.file_name
+        self.line, self.column = token.position()
+        self.end_column = token.end_column
+
+    def __str__(self):
+        return self.message
+
+# token types a recovering parse resumes at after a syntax error
+sync_types = (TokenType.newline, TokenType.definition_end, TokenType.definition)
+
+# requests handed back instead of a result, the next node or type is parsed first
+want_node = object()
+want_type = object()
+
+# frames of TokenParser.run, each waits for the node or type parsed after it was pushed
+# and gives back a result or another request
+
+class ReturnFrame:
+    __slots__ = ('token',)
+
+    def __init__(self, token):
+        self.token = token
+
+    def resume(self, parser, stack, node):
+        return FunctionReturnNode(node, *self.token.position())
+
+class SignatureFrame:
+    __slots__ = ('definition_token', 'declaration_token')
+
+    def __init__(self, definition_token, declaration_token):
+        self.definition_token = definition_token
+        self.declaration_token = declaration_token
+
+    def resume(self, parser, stack, function_type):
+        return parser.start_body(BodyFrame(self.definition_token, self.declaration_token, False, function_type), stack)
+
+class BodyFrame:
+    __slots__ = ('definition_token', 'declaration_token', 'module', 'function_type', 'body', 'node_start')
+
+    def __init__(self, definition_token, declaration_token, module, function_type):
+        self.definition_token = definition_token
+        self.declaration_token = declaration_token
+        self.module = module
+        self.function_type = function_type
+        self.body = []
+        self.node_start = None
+
+    def resume(self, parser, stack, node):
+        if parser.tracer is not None:
+            parser.tracer.node(node)
+        if parser.spans is not None:
+            parser.spans.append((self.node_start, parser.current_index, node, self.body))
+        self.body.append(node)
+        return parser.continue_body(self, stack)
+
+    def definition(self):
+        identifier = intern(self.declaration_token.value)
+        if self.module:
+            return ModuleDefinitionNode(identifier, self.body, *self.definition_token.position())
+        return FunctionDefinitionNode(identifier, self.function_type, self.body, *self.definition_token.position())
+
+class ArrowFrame:
+    __slots__ = ('token', 'argument_type')
+
+    def __init__(self, token, argument_type):
+        self.token = token
+        self.argument_type = argument_type
+
+    def resume(self, parser, stack, return_type):
+        return FunctionTypeNode(None, self.argument_type, return_type, *self.token.position())
+
+class StructFrame:
+    __slots__ = ('token', 'fields', 'field_identifier_token')
+
+    def __init__(self, token):
+        self.token = token
+        self.fields = []
+        self.field_identifier_token = None
+
+    def resume(self, parser, stack, field_type):
+        token = self.field_identifier_token
+        self.fields.append(StructFieldNode(intern(token.value), field_type, *token.position()))
+        return parser.continue_struct(self, stack)
+
 class TokenParser:
 
-    def __init__(self, tokens):
-        self.tokens = tokens
+    def __init__(self, tokens, lookahead=2, tracer=None):
+        # lists are indexed directly, any other iterable is parsed as a stream
+        if hasattr(tokens, '__getitem__'):
+            self.tokens = tokens
+        else:
+            self.tokens = LookaheadBuffer(tokens, lookahead)
         self.current_index = -1
+        # optional src.profiling.Tracer, hooks are skipped entirely when None
+        self.tracer = tracer
+        # optional list, definition bodies then record every node they parse
+        # as (start index, end index, node, body) for src.incremental
+        self.spans = None
+        # iter_nodes prints syntax errors before raising them, callers reporting them turn it off
+        self.print_errors = True
+        # optional list, parse_tokens then collects syntax errors into it as Diagnostics
+        # instead of raising the first one and returns the tree of everything else
+        self.diagnostics = None
+        # a recovering parse stops after this many diagnostics
+        self.max_errors = 100
+        # (definition token, declaration token) of the last definition started, a
+        # recovering parse opens its body when the error was in its signature
+        self.header = None
 
-    def parse_tokens(self):
-        nodes = []
-        while self.current_index < len(self.tokens):
+    def has_token(self, index):
+        try:
+            self.tokens[index]
+            return True
+        except IndexError:
+            return False
+
+    def iter_nodes(self):
+        while self.current_index < 0 or self.has_token(self.current_index):
             try:
-                nodes.append(self.parse_next())
+                node = self.parse_next()
             except SyntaxError as syntax_error:
-                print(str(syntax_error))
+                if self.print_errors:
+                    print(str(syntax_error))
                 raise syntax_error
+            except TokenizerError:
+                raise
             except:
                 break
+            if self.tracer is not None:
+                self.tracer.node(node)
+            yield node
+
+    def iter_recovering(self):
+        # iter_nodes collecting syntax errors into diagnostics: the node being parsed is
+        # dropped and parsing resumes at the next newline, end or definition, in the
+        # innermost body still open; tokens are skipped at most once per error so the
+        # whole parse stays linear in the number of tokens
+        stack = []
+        result = want_node
+        while len(self.diagnostics) < self.max_errors:
+            try:
+                node = self.run(stack, result)
+            except SyntaxError as syntax_error:
+                self.diagnostics.append(Diagnostic(str(syntax_error), syntax_error.token or self.last_token()))
+                result = self.recover(stack)
+                continue
+            except EndOfTokens:
+                # only the end of the tokens at the top level is not an error
+                if stack:
+                    for node in self.close_bodies(stack, type(stack[-1]) is not BodyFrame):
+                        yield node
+                return
+            except IndexError:
+                # the tokens ended inside a node, anything else is not a syntax error
+                for node in self.close_bodies(stack, True):
+                    yield node
+                return
+            if self.tracer is not None:
+                self.tracer.node(node)
+            yield node
+            result = want_node
+        for node in self.close_bodies(stack, None):
+            yield node
+
+    def recover(self, stack):
+        # skips to the next token of sync_types and returns what run continues with
+        header = self.header
+        self.header = None
+        # frames waiting for a type or the rest of a node go with it, bodies stay open
+        while stack and type(stack[-1]) is not BodyFrame:
+            stack.pop()
+        tokens = self.tokens
+        index = self.current_index
+        while self.has_token(index) and tokens[index].type not in sync_types:
+            index += 1
+        self.current_index = index - 1
+        if stack:
+            stack[-1].node_start = self.current_index
+        if header is None or not self.has_token(index) or tokens[index].type != TokenType.newline:
+            return want_node
+        definition_token, declaration_token = header
+        if declaration_token.type != TokenType.declaration_literal:
+            return want_node
+        # the error was in the signature, the body is read without a type like start_body would
+        frame = BodyFrame(definition_token, declaration_token, definition_token.value == "module", None)
+        self.current_index = index
+        return self.continue_body(frame, stack)
+
+    def close_bodies(self, stack, unexpected):
+        # nodes of the definitions still open when parsing stopped, with the body read so far
+        # unexpected is True when the tokens ended inside a node, diagnostics are only
+        # added while it is not None
+        if unexpected:
+            token = self.last_token()
+            self.diagnostics.append(Diagnostic("Unexpected end of file in " + token.file_name + ":" + str(token.line), token))
+        node = None
+        while stack:
+            frame = stack.pop()
+            if type(frame) is not BodyFrame:
+                continue
+            if node is not None:
+                frame.body.append(node)
+            if unexpected is not None:
+                token = frame.definition_token
+                self.diagnostics.append(Diagnostic("Missing end of definition " + frame.declaration_token.value[:-1] + " in " + token.file_name + ":" + str(token.line), token))
+            node = frame.definition()
+        if node is not None:
+            yield node
+
+    def last_token(self):
+        # token at current_index or the last one in front of it
+        index = self.current_index
+        while index > 0 and not self.has_token(index):
+            index -= 1
+        return self.tokens[index]
+
+    def parse_tokens(self):
+        if self.diagnostics is not None:
+            return RootNode(list(self.iter_recovering()))
+        return RootNode(list(self.iter_nodes()))
 
-        return RootNode(nodes)
+    def syntax_error(self, reason):
+        # SyntaxError at the current token, reason is followed by its file and line
+        token = self.tokens[self.current_index]
+        return SyntaxError(reason + token.file_name + ":" + str(token.line), token)
     
     def ignore_comments(self):
-        while self.current_index < len(self.tokens) and self.tokens[self.current_index].type == TokenType.comment:
+        while self.has_token(self.current_index) and self.tokens[self.current_index].type == TokenType.comment:
             self.current_index += 1
-            print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
+            if self.tracer is not None:
+                self.tracer.advance(self.current_index, self.tokens[self.current_index])
 
-    def parse_next(self):
-        self.current_index += 1
-        print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-        self.ignore_comments()
-        if self.current_index >= len(self.tokens):
-            raise Exception()
-        token = self.tokens[self.current_index]
-        if token.type == TokenType.atom_literal:
-            return AtomLiteralNode(token.value)
-        elif token.type == TokenType.integer_literal:
-            return IntegerLiteralNode(token.value)
-        elif token.type == TokenType.float_literal:
-            return FloatLiteralNode(token.value)
-        elif token.type == TokenType.string_literal:
-            return StringLiteralNode(token.value)
-        elif token.type == TokenType.definition_end:
-            return DefinitionEndNode()
-        elif token.type == TokenType.definition:
-            return self.parse_definition(token.value)
-        elif token.type == TokenType.function_return:
-            return FunctionReturnNode(self.parse_next())
-        else:
-            return self.parse_next()
-            # raise SyntaxError("Invalid token " + str(self.tokens[self.current_index].type) + " in " + self.tokens[self.current_index].file_name + ":" + str(self.tokens[self.current_index].line))
+    def run(self, stack, result):
+        # feeds results to the frames on stack until one is left for the caller
+        while True:
+            while result is want_node or result is want_type:
+                result = self.start_node(stack) if result is want_node else self.start_type(stack)
+            if not stack:
+                return result
+            result = stack.pop().resume(self, stack, result)
 
-    def parse_definition(self, definition_type):
+    def advance(self):
         self.current_index += 1
-        print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-        declaration_token = self.tokens[self.current_index]
-        print("declaration: " + declaration_token.value)
-        if declaration_token.type == TokenType.declaration_literal:
-            if self.tokens[self.current_index + 1].type == TokenType.identifier or self.tokens[self.current_index + 1].type == TokenType.curly_bracket_open:
-                function_type = self.parse_type()
-                self.current_index += 1
-                print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-                self.ignore_comments()
-                if self.tokens[self.current_index].type == TokenType.newline:
-                    self.current_index += 1
-                    print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-                    self.ignore_comments()
-                    body = []
-                    while self.tokens[self.current_index].type != TokenType.definition_end:
-                        body.append(self.parse_next())
-                    return FunctionDefinitionNode(declaration_token.value, function_type, body)
-                else:
-                    raise SyntaxError("Invalid definition in " + self.tokens[self.current_index].file_name + ":" + str(self.tokens[self.current_index].line))
-            else:
-                self.current_index += 1
-                print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-                self.ignore_comments()
-                if self.tokens[self.current_index].type == TokenType.newline:
-                    # self.current_index += 1
-                    # print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-                    # self.ignore_comments()
-                    if definition_type == "module":
-                        print("parsing module body")
-                        body = []
-                        while self.tokens[self.current_index].type != TokenType.definition_end:
-                            print("parsing module body next")
-                            body.append(self.parse_next())
-                            print("parsing module body state: " + str(body))
-                        print("parsing module body end")
-                        return ModuleDefinitionNode(declaration_token.value, body)
-                    else:
-                        raise SyntaxError("Definition of type not supported yet..." + self.tokens[self.current_index].file_name + ":" + str(self.tokens[self.current_index].line))
-                else:
-                    raise SyntaxError("Invalid definition in " + self.tokens[self.current_index].file_name + ":" + str(self.tokens[self.current_index].line))
-        else:
-            raise SyntaxError("Invalid definition in " + self.tokens[self.current_index].file_name + ":" + str(self.tokens[self.current_index].line))
-   
+        if self.tracer is not None:
+            self.tracer.advance(self.current_index, self.tokens[self.current_index])
+
+    def parse_next(self):
+        # node starting after current_index, current_index is left at its last token
+        return self.run([], want_node)
+
     def parse_type(self):
-        self.current_index += 1
-        print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-        token = self.tokens[self.current_index]
-        if token.type == TokenType.identifier:
-            if self.tokens[self.current_index + 1].type == TokenType.function_arrow:
-                self.current_index += 1
-                print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-                return_type = self.parse_type()
-                return FunctionTypeNode(None, TypeIdentifierNode(token.value, None), return_type)
-            else:
-                return TypeIdentifierNode(token.value, None)
-        elif token.type == TokenType.curly_bracket_open:
-            fields = []
+        return self.run([], want_type)
+
+    def start_node(self, stack):
+        # skips tokens without a handler, returns a node or a request after pushing a frame
+        handlers = self.node_handlers
+        tokens = self.tokens
+        tracer = self.tracer
+        while True:
             self.current_index += 1
-            print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-            while self.tokens[self.current_index].type != TokenType.curly_bracket_close:
-                field_identifier_token = self.tokens[self.current_index]
-                if field_identifier_token.type == TokenType.declaration_literal:
-                    field_type = self.parse_type()
-                    fields.append(StructFieldNode(field_identifier_token.value, field_type))
-                else:
-                    raise SyntaxError("Field declaration expected " + self.tokens[self.current_index].file_name + ":" + str(self.tokens[self.current_index].line))
-            if self.tokens[self.current_index + 1].type == TokenType.function_arrow:
-                self.current_index += 1
-                print("Next index [" + str(self.current_index) + "]: " + str(self.tokens[self.current_index]))
-                return_type = self.parse_type()
-                return FunctionTypeNode(None, StructTypeNode(None, fields), return_type)
-            else:
-                StructTypeNode(None, fields)
+            if tracer is not None:
+                tracer.advance(self.current_index, tokens[self.current_index])
+            self.ignore_comments()
+            try:
+                token = tokens[self.current_index]
+            except IndexError:
+                raise EndOfTokens()
+            handler = handlers.get(token.type)
+            if handler is not None:
+                return handler(self, token, stack)
+
+    def parse_atom(self, token, stack):
+        return AtomLiteralNode(intern(token.value), *token.position())
+
+    def parse_integer(self, token, stack):
+        return IntegerLiteralNode(token.value, *token.position())
+
+    def parse_float(self, token, stack):
+        return FloatLiteralNode(token.value, *token.position())
+
+    def parse_string(self, token, stack):
+        return StringLiteralNode(token.value, *token.position())
+
+    def parse_definition_end(self, token, stack):
+        return DefinitionEndNode(*token.position())
+
+    def parse_return(self, token, stack):
+        stack.append(ReturnFrame(token))
+        return want_node
+
+    def parse_definition(self, definition_token, stack):
+        definition_type = definition_token.value
+        self.advance()
+        declaration_token = self.tokens[self.current_index]
+        self.header = (definition_token, declaration_token)
+        if self.tracer is not None:
+            self.tracer.declaration(definition_type, declaration_token)
+        if declaration_token.type != TokenType.declaration_literal:
+            raise self.syntax_error("Invalid definition in ")
+        next_type = self.tokens[self.current_index + 1].type
+        if next_type == TokenType.identifier or next_type == TokenType.curly_bracket_open:
+            stack.append(SignatureFrame(definition_token, declaration_token))
+            return want_type
+        self.advance()
+        self.ignore_comments()
+        if self.tokens[self.current_index].type != TokenType.newline:
+            raise self.syntax_error("Invalid definition in ")
+        if definition_type != "module":
+            raise self.syntax_error("Definition of type not supported yet...")
+        # the body starts on the newline itself
+        return self.continue_body(BodyFrame(definition_token, declaration_token, True, None), stack)
+
+    def start_body(self, frame, stack):
+        # function signature read, the body starts on the newline like a module body,
+        # its first node is the one after it
+        self.advance()
+        self.ignore_comments()
+        if self.tokens[self.current_index].type != TokenType.newline:
+            raise self.syntax_error("Invalid definition in ")
+        return self.continue_body(frame, stack)
+
+    def continue_body(self, frame, stack):
+        if self.tokens[self.current_index].type != TokenType.definition_end:
+            frame.node_start = self.current_index
+            stack.append(frame)
+            return want_node
+        return frame.definition()
+
+    def start_type(self, stack):
+        self.advance()
+        token = self.tokens[self.current_index]
+        handler = self.type_handlers.get(token.type)
+        if handler is None:
+            raise self.syntax_error("Type declaration expected ")
+        return handler(self, token, stack)
+
+    def parse_type_identifier(self, token, stack):
+        type_identifier = TypeIdentifierNode(intern(token.value), None, *token.position())
+        if self.tokens[self.current_index + 1].type == TokenType.function_arrow:
+            self.advance()
+            stack.append(ArrowFrame(token, type_identifier))
+            return want_type
+        return type_identifier
+
+    def parse_struct_type(self, token, stack):
+        self.advance()
+        return self.continue_struct(StructFrame(token), stack)
+
+    def continue_struct(self, frame, stack):
+        if self.tokens[self.current_index].type != TokenType.curly_bracket_close:
+            field_identifier_token = self.tokens[self.current_index]
+            if field_identifier_token.type != TokenType.declaration_literal:
+                raise self.syntax_error("Field declaration expected ")
+            frame.field_identifier_token = field_identifier_token
+            stack.append(frame)
+            return want_type
+        if self.tokens[self.current_index + 1].type == TokenType.function_arrow:
+            self.advance()
+            stack.append(ArrowFrame(frame.token, StructTypeNode(None, frame.fields, *frame.token.position())))
+            return want_type
+        # struct types are only supported as argument of a function type so far
+        return None
+
+    # token type -> handler of the token a node or type starts at, tokens without one are skipped
+    node_handlers = {
+        TokenType.atom_literal: parse_atom,
+        TokenType.integer_literal: parse_integer,
+        TokenType.float_literal: parse_float,
+        TokenType.string_literal: parse_string,
+        TokenType.definition_end: parse_definition_end,
+        TokenType.definition: parse_definition,
+        TokenType.function_return: parse_return,
+    }
+    type_handlers = {
+        TokenType.identifier: parse_type_identifier,
+        TokenType.curly_bracket_open: parse_struct_type,
+    }
+
+if __name__ == "__main__":
+    import sys
+    from src.profiling import PrintTracer, run_profiled
+    file_name = sys.argv[1]
+    options = sys.argv[2:]
+    tracer = PrintTracer() if "--trace" in options else None
+    try:
+        if "--profile" in options:
+            tokens, root, profile = run_profiled(file_name, tracer=tracer)
+            write_text(root, sys.stdout)
+            print()
+            print(str(profile), file=sys.stderr)
+        elif "--recover" in options:
+            parser = TokenParser(tokenize_path(file_name), tracer=tracer)
+            parser.diagnostics = []
+            write_text(parser.parse_tokens(), sys.stdout)
+            print()
+            for diagnostic in parser.diagnostics:
+                print(str(diagnostic), file=sys.stderr)
+            if parser.diagnostics:
+                sys.exit(1)
         else:
-            raise SyntaxError("Type declaration expected " + self.tokens[self.current_index].file_name + ":" + str(self.tokens[self.current_index].line))
+            write_text(TokenParser(tokenize_path(file_name), tracer=tracer).parse_tokens(), sys.stdout)
+            print()
+    except TokenizerError as e:
+        print(str(e))
+    except SyntaxError:
+        # already reported by parse_tokens
+        pass
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import tracemalloc
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import walk
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class Tracer:
+    # instrumentation hooks called by tokenizers and TokenParser, all no-ops
+    # they take tracer=None by default and then skip the hooks entirely
+
+    def token(self, token):
+        # tokenizer produced a token
+        pass
+
+    def advance(self, index, token):
+        # parser moved to the token at index
+        pass
+
+    def declaration(self, definition_type, token):
+        # parser read the declaration token of a definition
+        pass
+
+    def node(self, node):
+        # parser finished a node of the root or of a definition body
+        pass
+
+class PrintTracer(Tracer):
+    # debug output TokenParser used to print unconditionally
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def advance(self, index, token):
+        print("Next index [" + str(index) + "]: " + str(token), file=self.stream)
+
+    def declaration(self, definition_type, token):
+        print("declaration: " + str(token.value), file=self.stream)
+
+    def node(self, node):
+        print("parsed: " + type(node).__name__, file=self.stream)
+
+class CountingTracer(Tracer):
+
+    def __init__(self):
+        self.tokens = 0
+        self.advances = 0
+        self.declarations = 0
+        self.nodes = 0
+
+    def token(self, token):
+        self.tokens += 1
+
+    def advance(self, index, token):
+        self.advances += 1
+
+    def declaration(self, definition_type, token):
+        self.declarations += 1
+
+    def node(self, node):
+        self.nodes += 1
+
+def count_nodes(root):
+    count = 0
+    for node in walk(root):
+        count += 1
+    return count
+
+def peak_rss():
+    # process high water mark in bytes, None where resource is not available
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Profile:
+    def __init__(self, file_name, engine):
+        self.file_name = file_name
+        self.engine = engine
+        # phase name -> seconds, phases are read, lex and parse
+        self.phases = {}
+        self.source_bytes = 0
+        self.token_count = 0
+        self.node_count = 0
+        # peak of traced python allocations, only with trace_memory
+        self.peak_memory = None
+        self.peak_rss = None
+
+    def total_time(self):
+        return sum(self.phases.values())
+
+    def tokens_per_second(self):
+        elapsed = self.phases.get("lex", 0) + self.phases.get("read", 0)
+        return self.token_count / elapsed if elapsed > 0 else 0.0
+
+    def nodes_per_second(self):
+        elapsed = self.phases.get("parse", 0)
+        return self.node_count / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        return {
+            "file": self.file_name,
+            "engine": self.engine,
+            "source_bytes": self.source_bytes,
+            "tokens": self.token_count,
+            "nodes": self.node_count,
+            "phases": dict(self.phases),
+            "total_seconds": self.total_time(),
+            "tokens_per_second": self.tokens_per_second(),
+            "nodes_per_second": self.nodes_per_second(),
+            "peak_memory": self.peak_memory,
+            "peak_rss": self.peak_rss,
+        }
+
+    def __str__(self):
+        lines = ["profile " + self.file_name + " (" + self.engine + " engine)"]
+        for name, seconds in self.phases.items():
+            lines.append("  " + name + ": " + format(seconds * 1000, ".3f") + " ms")
+        lines.append("  tokens: " + str(self.token_count) + " (" + format(self.tokens_per_second(), ".0f") + " tokens/s)")
+        if "parse" in self.phases:
+            lines.append("  nodes: " + str(self.node_count) + " (" + format(self.nodes_per_second(), ".0f") + " nodes/s)")
+        if self.peak_memory is not None:
+            lines.append("  peak traced memory: " + str(self.peak_memory) + " bytes")
+        if self.peak_rss is not None:
+            lines.append("  peak rss: " + str(self.peak_rss) + " bytes")
+        return "\n".join(lines)
+
+engines = ("file", "text", "buffer")
+
+def run_phases(file_name, engine, parse, phases, tracer=None):
+    clock = time.perf_counter
+    if engine == "file":
+        # FileTokenizer reads while lexing, so reading is part of the lex phase
+        start = clock()
+        with open(file_name, "r") as file_stream:
+            tokens = FileTokenizer(file_name, file_stream, tracer).tokenize()
+        phases["lex"] = clock() - start
+    elif engine == "text" or engine == "buffer":
+        start = clock()
+        text = read_source(file_name)
+        phases["read"] = clock() - start
+        start = clock()
+        tokenizer = TextTokenizer(file_name, text, tracer)
+        tokens = tokenizer.tokenize() if engine == "text" else tokenizer.tokenize_buffer()
+        phases["lex"] = clock() - start
+    else:
+        raise ValueError("unknown engine " + str(engine) + ", expected one of " + ", ".join(engines))
+    root = None
+    if parse:
+        start = clock()
+        root = TokenParser(tokens, tracer=tracer).parse_tokens()
+        phases["parse"] = clock() - start
+    return tokens, root
+
+def run_profiled(file_name, engine="text", parse=True, trace_memory=False, tracer=None):
+    # returns tokens, root (None without parse) and the Profile
+    profile = Profile(file_name, engine)
+    tokens, root = run_phases(file_name, engine, parse, profile.phases, tracer)
+    profile.token_count = len(tokens)
+    if root is not None:
+        profile.node_count = count_nodes(root)
+    profile.source_bytes = os.path.getsize(file_name)
+    if trace_memory:
+        # separate run, tracemalloc would distort the timings above
+        tracemalloc.start()
+        run_phases(file_name, engine, parse, {})
+        profile.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    profile.peak_rss = peak_rss()
+    return tokens, root, profile
+
+def profile_file(file_name, engine="text", parse=True, trace_memory=False):
+    return run_profiled(file_name, engine, parse, trace_memory)[2]
@@ -0,0 +1,288 @@
+import struct
+import sys
+from array import array
+from json.encoder import encode_basestring_ascii
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import *
+from src.canonical_types import Type
+
+# syntax trees as JSON, S-expressions or a compact binary encoding
+# the writers walk the tree once and stream their output to a file object,
+# none of them builds the text of a subtree or recurses
+
+# node fields which are not children or positions, in slot order
+value_fields = {node_type: tuple(field for field in node_type.__slots__ if field not in child_fields[node_type] and field != 'line' and field != 'column') for node_type in node_types}
+positioned = {node_type: 'line' in node_type.__slots__ for node_type in node_types}
+
+def quote(value):
+    if value is None:
+        return "null"
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    if isinstance(value, Type):
+        # resolved types as their text, like {x: Int} -> Bool
+        return encode_basestring_ascii(str(value))
+    raise ValueError("cannot serialize value of type " + type(value).__name__)
+
+def position(value):
+    return "null" if value is None else str(value)
+
+def json_pieces(node):
+    # {"node": class name, "line": .., "column": .., fields in slot order}, missing values are null
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            yield item
+            continue
+        node_type = type(item)
+        parts = ["{\"node\": \"" + node_type.__name__ + "\""]
+        if positioned[node_type]:
+            parts.append(", \"line\": " + position(item.line) + ", \"column\": " + position(item.column))
+        for field in value_fields[node_type]:
+            parts.append(", \"" + field + "\": " + quote(getattr(item, field)))
+        for field in child_fields[node_type]:
+            value = getattr(item, field)
+            parts.append(", \"" + field + "\": ")
+            if type(value) is list:
+                parts.append("[")
+                for index, child in enumerate(value):
+                    if index > 0:
+                        parts.append(", ")
+                    parts.append(child)
+                parts.append("]")
+            elif value is None:
+                parts.append("null")
+            else:
+                parts.append(value)
+        parts.append("}")
+        parts.reverse()
+        stack.extend(parts)
+
+def sexp_pieces(node):
+    # (ClassName :line .. :column .. :field value ...), lists are (a b ...) and missing values nil
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            yield item
+            continue
+        node_type = type(item)
+        parts = ["(" + node_type.__name__]
+        if positioned[node_type]:
+            parts.append(" :line " + ("nil" if item.line is None else str(item.line)) + " :column " + ("nil" if item.column is None else str(item.column)))
+        for field in value_fields[node_type]:
+            value = getattr(item, field)
+            parts.append(" :" + field + " " + ("nil" if value is None else quote(value)))
+        for field in child_fields[node_type]:
+            value = getattr(item, field)
+            parts.append(" :" + field + " ")
+            if type(value) is list:
+                parts.append("(")
+                for index, child in enumerate(value):
+                    if index > 0:
+                        parts.append(" ")
+                    parts.append(child)
+                parts.append(")")
+            elif value is None:
+                parts.append("nil")
+            else:
+                parts.append(value)
+        parts.append(")")
+        parts.reverse()
+        stack.extend(parts)
+
+def write_json(node, out):
+    write_pieces(json_pieces(node), out)
+
+def write_sexp(node, out):
+    write_pieces(sexp_pieces(node), out)
+
+# binary trees: header, string table, then one little endian int32 stream in pre-order
+# a node is its index in node_types, line and column if the class has them (-1 for None),
+# an index into the string table per value field (-1 for None) and per child field
+# -1 for None, -2 followed by a node, or a count followed by that many nodes
+# resolved types are left out (-1), src.canonical_types resolves a loaded tree again
+tree_format = 2
+tree_magic = b"SIMT"
+# magic, format, string count, string table bytes, int count
+tree_header = struct.Struct("<4sHIII")
+node_codes = {node_type: code for code, node_type in enumerate(node_types)}
+
+def little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def encode_tree(node):
+    strings = {}
+    ints = array('i')
+    append = ints.append
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if type(item) is int:
+            append(item)
+            continue
+        node_type = type(item)
+        code = node_codes.get(node_type)
+        if code is None:
+            raise ValueError("cannot serialize " + node_type.__name__)
+        append(code)
+        if positioned[node_type]:
+            append(-1 if item.line is None else item.line)
+            append(-1 if item.column is None else item.column)
+        for field in value_fields[node_type]:
+            value = getattr(item, field)
+            if value is None or isinstance(value, Type):
+                append(-1)
+            elif type(value) is str:
+                index = strings.get(value)
+                if index is None:
+                    index = strings[value] = len(strings)
+                append(index)
+            else:
+                raise ValueError("cannot serialize value of type " + type(value).__name__)
+        pending = []
+        for field in child_fields[node_type]:
+            value = getattr(item, field)
+            if type(value) is list:
+                pending.append(len(value))
+                pending.extend(value)
+            elif value is None:
+                pending.append(-1)
+            else:
+                pending.append(-2)
+                pending.append(value)
+        pending.reverse()
+        stack.extend(pending)
+    # character lengths, the table is decoded in one go and sliced
+    lengths = little_endian(array('I', [len(string) for string in strings]))
+    table = "".join(strings).encode("utf-8", "surrogatepass")
+    return tree_header.pack(tree_magic, tree_format, len(strings), len(table), len(ints)) + lengths.tobytes() + table + little_endian(ints).tobytes()
+
+def decode_tree(data):
+    # ValueError for data which is not a whole tree from encode_tree
+    if len(data) < tree_header.size:
+        raise ValueError("not a syntax tree")
+    magic, version, string_count, table_size, int_count = tree_header.unpack_from(data)
+    if magic != tree_magic or version != tree_format:
+        raise ValueError("not a syntax tree")
+    view = memoryview(data)
+    lengths = array('I')
+    ints = array('i')
+    start = tree_header.size
+    end = start + string_count * lengths.itemsize
+    if end + table_size + int_count * ints.itemsize != len(data):
+        raise ValueError("truncated syntax tree")
+    lengths.frombytes(view[start:end])
+    text = str(view[end:end + table_size], "utf-8", "surrogatepass")
+    ints.frombytes(view[end + table_size:])
+    strings = []
+    offset = 0
+    for length in little_endian(lengths):
+        strings.append(sys.intern(text[offset:offset + length]))
+        offset += length
+    read = iter(little_endian(ints).tolist()).__next__
+    layouts = [(node_type, positioned[node_type], value_fields[node_type], child_fields[node_type]) for node_type in node_types]
+    # [node, child fields, next field, list being filled, nodes still to read into it]
+    stack = []
+
+    def read_node():
+        code = read()
+        if code < 0 or code >= len(layouts):
+            raise ValueError("invalid node code")
+        node_type, has_position, values, children = layouts[code]
+        node = node_type.__new__(node_type)
+        if has_position:
+            line = read()
+            column = read()
+            node.line = None if line < 0 else line
+            node.column = None if column < 0 else column
+        for field in values:
+            index = read()
+            setattr(node, field, None if index < 0 else strings[index])
+        if children:
+            stack.append([node, children, 0, None, 0])
+        return node
+
+    try:
+        root = read_node()
+        while stack:
+            frame = stack[-1]
+            if frame[4] > 0:
+                frame[4] -= 1
+                frame[3].append(read_node())
+                continue
+            children = frame[1]
+            if frame[2] == len(children):
+                stack.pop()
+                continue
+            field = children[frame[2]]
+            frame[2] += 1
+            count = read()
+            if count == -1:
+                setattr(frame[0], field, None)
+            elif count == -2:
+                setattr(frame[0], field, read_node())
+            elif count >= 0:
+                items = []
+                setattr(frame[0], field, items)
+                frame[3] = items
+                frame[4] = count
+            else:
+                raise ValueError("invalid child count " + str(count))
+    except (StopIteration, IndexError):
+        raise ValueError("truncated syntax tree")
+    try:
+        read()
+    except StopIteration:
+        return root
+    raise ValueError("data after syntax tree")
+
+def dump_tree(node, out):
+    out.write(encode_tree(node))
+
+def load_tree(stream):
+    return decode_tree(stream.read())
+
+writers = {
+    "text": write_text,
+    "json": write_json,
+    "sexp": write_sexp,
+}
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="source file or a binary syntax tree")
+    parser.add_argument("--format", choices=sorted(writers) + ["binary"], default="json")
+    parser.add_argument("--output", help="defaults to stdout")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as file_stream:
+        data = file_stream.read()
+    try:
+        if data[:len(tree_magic)] == tree_magic:
+            root = decode_tree(data)
+        else:
+            parser = TokenParser(tokenize_path(args.file))
+            parser.print_errors = False
+            root = parser.parse_tokens()
+    except (TokenizerError, SyntaxError, ValueError) as error:
+        print(args.file + ": " + str(error), file=sys.stderr)
+        sys.exit(1)
+    if args.format == "binary":
+        if args.output:
+            with open(args.output, "wb") as out:
+                dump_tree(root, out)
+        else:
+            dump_tree(root, sys.stdout.buffer)
+    elif args.output:
+        with open(args.output, "w") as out:
+            writers[args.format](root, out)
+            out.write("\n")
+    else:
+        writers[args.format](root, sys.stdout)
+        sys.stdout.write("\n")
@@ -0,0 +1,435 @@
+import io
+import json
+import os
+import re
+import sys
+from urllib.parse import quote, unquote, urlparse
+from src.tokenizer import *
+from src.parser import *
+from src.incremental import IncrementalDocument
+from src.driver import refresh_index
+from src.serialize import writers
+from src.symbols import SymbolIndex, declared_name
+
+# front end server speaking JSON-RPC 2.0 over stdin and stdout, messages are framed
+# with Content-Length headers like the language server protocol
+# documents keep their tokens and tree between requests and are updated by
+# didChange edits through src.incremental, symbols of the whole workspace are
+# kept in a src.symbols.SymbolIndex; requests are answered one at a time in
+# the order they arrive
+# positions on the wire are zero based lines and characters, characters are code points
+
+parse_error = -32700
+invalid_request = -32600
+method_not_found = -32601
+invalid_params = -32602
+internal_error = -32603
+
+# language server protocol SymbolKind
+symbol_kinds = {"module": 2, "function": 12}
+# line and optional column at the end of tokenizer and parser messages
+error_position = re.compile(r':(\d+)(?: col:(\d+))?$')
+
+class RequestError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+def file_name_from_uri(uri):
+    if uri.startswith("file://"):
+        return os.path.abspath(unquote(urlparse(uri).path))
+    return os.path.abspath(uri)
+
+def uri_from_file_name(file_name):
+    return "file://" + quote(file_name)
+
+def wire_range(line, start_column, end_column):
+    # 1 based token positions to a zero based range on one line, end_column is the
+    # column just after the token
+    return {"start": {"line": line - 1, "character": start_column - 1}, "end": {"line": line - 1, "character": end_column - 1}}
+
+class ServerDocument:
+    # a file the server knows, open in the client or read from disk
+    # document is the IncrementalDocument, None while the first parse of the text failed
+
+    def __init__(self, file_name, text, version=None):
+        self.file_name = file_name
+        self.version = version
+        self.document = None
+        self.error = None
+        self.starts = None
+        # method and format -> result, dropped on every change
+        self.results = {}
+        self.reset(text)
+
+    def reset(self, text):
+        self.text = text
+        self.starts = None
+        self.results = {}
+        try:
+            self.document = IncrementalDocument(self.file_name, text)
+            self.error = None
+        except (TokenizerError, SyntaxError) as error:
+            self.document = None
+            self.error = error
+
+    def line_starts(self):
+        if self.starts is None:
+            self.starts = line_starts(self.text)
+        return self.starts
+
+    def offset(self, position):
+        starts = self.line_starts()
+        line = position.get("line", 0)
+        if line < 0:
+            line = 0
+        if line >= len(starts):
+            return len(self.text)
+        end = starts[line + 1] - 1 if line + 1 < len(starts) else len(self.text)
+        return min(starts[line] + max(position.get("character", 0), 0), end)
+
+    def change(self, change):
+        # one contentChanges entry, without range it replaces the whole text
+        if "range" not in change:
+            self.reset(change["text"])
+            return
+        start = self.offset(change["range"]["start"])
+        end = max(start, self.offset(change["range"]["end"]))
+        if self.document is None:
+            self.reset(self.text[:start] + change["text"] + self.text[end:])
+            return
+        self.starts = None
+        self.results = {}
+        try:
+            self.document.apply_edit(start, end, change["text"])
+            self.error = None
+        except (TokenizerError, SyntaxError) as error:
+            self.error = error
+        self.text = self.document.text
+
+    def valid(self):
+        return self.document is not None and self.error is None
+
+    def diagnostics(self):
+        if self.error is None:
+            return []
+        if type(self.error) is SyntaxError:
+            # the document keeps only the first syntax error, a recovering parse finds all of them
+            result = self.results.get("diagnostics")
+            if result is None:
+                parser = TokenParser(TextTokenizer(self.file_name, self.text).tokenize())
+                parser.diagnostics = []
+                parser.parse_tokens()
+                result = self.results["diagnostics"] = [{"range": wire_range(diagnostic.line, diagnostic.column, diagnostic.end_column), "severity": 1, "source": "sima", "message": diagnostic.message} for diagnostic in parser.diagnostics]
+            return result
+        message = str(self.error)
+        match = error_position.search(message)
+        line = int(match.group(1)) if match else 1
+        column = int(match.group(2)) if match and match.group(2) else 1
+        return [{"range": wire_range(line, column, column + 1), "severity": 1, "source": "sima", "message": message}]
+
+    def token_at(self, position):
+        # token under a zero based position or None
+        if not self.valid():
+            return None
+        offset = self.offset(position)
+        document = self.document
+        index = document.token_index(offset)
+        if index < 0:
+            return None
+        token = document.tokens[index]
+        # up to and including the character after the token, like a cursor at its end
+        length = len(token.value) if token.value is not None else 0
+        if offset - token.start > length:
+            return None
+        return token
+
+class FrontEndServer:
+
+    def __init__(self, output, workspace=None):
+        # binary stream responses and notifications are written to
+        self.output = output
+        # file name -> ServerDocument, open documents and files read for a request
+        self.documents = {}
+        # file names of documents open in the client
+        self.open = set()
+        self.index = SymbolIndex()
+        self.workspace = None
+        self.shutdown_requested = False
+        self.running = True
+        if workspace is not None:
+            self.index_workspace(workspace)
+
+    def index_workspace(self, directory):
+        # symbols of all files under directory, parsed again only when changed on disk
+        self.workspace = os.path.abspath(directory)
+        return refresh_index(self.index, self.workspace, workers=1)
+
+    def send(self, message):
+        body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        self.output.write(b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+        self.output.flush()
+
+    def notify(self, method, params):
+        self.send({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def handle(self, message):
+        # one decoded message, returns the response or None for notifications
+        if type(message) is not dict or type(message.get("method")) is not str:
+            return {"jsonrpc": "2.0", "id": message.get("id") if type(message) is dict else None, "error": {"code": invalid_request, "message": "invalid request"}}
+        is_request = "id" in message
+        handler = self.requests.get(message["method"]) if is_request else self.notifications.get(message["method"])
+        params = message.get("params")
+        if params is None:
+            params = {}
+        try:
+            if handler is None:
+                raise RequestError(method_not_found, "unknown method " + message["method"])
+            if self.shutdown_requested and message["method"] != "exit":
+                raise RequestError(invalid_request, "server is shutting down")
+            result = handler(self, params)
+        except RequestError as error:
+            if not is_request:
+                return None
+            return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": error.code, "message": error.message}}
+        except (KeyError, TypeError, ValueError, AttributeError) as error:
+            if not is_request:
+                return None
+            return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": invalid_params, "message": "invalid params: " + str(error)}}
+        except Exception as error:
+            if not is_request:
+                return None
+            return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": internal_error, "message": type(error).__name__ + ": " + str(error)}}
+        if not is_request:
+            return None
+        return {"jsonrpc": "2.0", "id": message["id"], "result": result}
+
+    def document(self, params):
+        # ServerDocument of params["textDocument"]["uri"], read from disk when not open
+        file_name = file_name_from_uri(params["textDocument"]["uri"])
+        document = self.documents.get(file_name)
+        if document is None:
+            try:
+                text = read_source(file_name)
+            except OSError as error:
+                raise RequestError(invalid_params, str(error))
+            document = self.documents[file_name] = ServerDocument(file_name, text)
+            self.update_symbols(document)
+        return document
+
+    def update_symbols(self, document):
+        # symbols of the last text that parsed are kept while the text has errors
+        if document.valid():
+            self.index.update_file(document.file_name, document.document.root)
+
+    def publish(self, document):
+        self.notify("textDocument/publishDiagnostics", {"uri": uri_from_file_name(document.file_name), "version": document.version, "diagnostics": document.diagnostics()})
+
+    def initialize(self, params):
+        root = params.get("rootUri") or params.get("rootPath")
+        if root:
+            self.index_workspace(file_name_from_uri(root))
+        return {
+            "capabilities": {
+                # incremental
+                "textDocumentSync": 2,
+                "documentSymbolProvider": True,
+                "definitionProvider": True,
+                "workspaceSymbolProvider": True,
+            },
+            "serverInfo": {"name": "sima"},
+        }
+
+    def initialized(self, params):
+        pass
+
+    def shutdown(self, params):
+        self.shutdown_requested = True
+        return None
+
+    def exit(self, params):
+        self.running = False
+
+    def did_open(self, params):
+        item = params["textDocument"]
+        file_name = file_name_from_uri(item["uri"])
+        document = ServerDocument(file_name, item["text"], item.get("version"))
+        self.documents[file_name] = document
+        self.open.add(file_name)
+        self.update_symbols(document)
+        self.publish(document)
+
+    def did_change(self, params):
+        document = self.document(params)
+        document.version = params["textDocument"].get("version")
+        for change in params["contentChanges"]:
+            document.change(change)
+        self.update_symbols(document)
+        self.publish(document)
+
+    def did_close(self, params):
+        file_name = file_name_from_uri(params["textDocument"]["uri"])
+        self.open.discard(file_name)
+        self.documents.pop(file_name, None)
+        # back to the file on disk
+        self.index.remove_file(file_name)
+        if os.path.exists(file_name):
+            self.document(params)
+
+    def tokenize(self, params):
+        # [type, value, line, start column, end column] per token, positions 1 based
+        document = self.document(params)
+        result = document.results.get("tokenize")
+        if result is None:
+            if not document.valid():
+                raise RequestError(invalid_params, str(document.error))
+            result = document.results["tokenize"] = [[token.type.name, token.value, token.line, token.start_column, token.end_column] for token in document.document.tokens]
+        return result
+
+    def parse(self, params):
+        # tree as text in a src.serialize format, json by default
+        document = self.document(params)
+        tree_format = params.get("format", "json")
+        if tree_format not in writers:
+            raise RequestError(invalid_params, "unknown format " + str(tree_format))
+        key = "parse " + tree_format
+        result = document.results.get(key)
+        if result is None:
+            if not document.valid():
+                raise RequestError(invalid_params, str(document.error))
+            out = io.StringIO()
+            writers[tree_format](document.document.root, out)
+            result = document.results[key] = {"format": tree_format, "tree": out.getvalue()}
+        return result
+
+    def diagnostics(self, params):
+        return self.document(params).diagnostics()
+
+    def symbol_information(self, symbol):
+        name = symbol.name
+        container = name.rpartition(".")[0]
+        # positions of a definition are its def or defmodule keyword
+        information = {
+            "name": name,
+            "kind": symbol_kinds[symbol.kind],
+            "location": {"uri": uri_from_file_name(symbol.file_name), "range": wire_range(symbol.line, symbol.column, symbol.column + 1)},
+        }
+        if container:
+            information["containerName"] = container
+        return information
+
+    def document_symbols(self, params):
+        document = self.document(params)
+        return [self.symbol_information(symbol) for symbol in self.index.file_symbols(document.file_name)]
+
+    def workspace_symbols(self, params):
+        # symbols whose qualified names start with the query
+        return [self.symbol_information(symbol) for symbol in self.index.prefix(params.get("query", ""))]
+
+    def definition(self, params):
+        # definitions named by the identifier or declaration under the position, the name
+        # is looked up in the definitions around it from the innermost one outwards
+        document = self.document(params)
+        position = params["position"]
+        token = self.token_at(document, position)
+        if token is None:
+            return None
+        name = declared_name(token.value)
+        scope = []
+        line = position.get("line", 0) + 1
+        for symbol in self.index.file_symbols(document.file_name):
+            if symbol.line > line:
+                break
+            scope = symbol.name.split(".")
+        for length in range(len(scope), -1, -1):
+            symbols = self.index.lookup(".".join(scope[:length] + [name]))
+            if symbols:
+                return [{"uri": uri_from_file_name(symbol.file_name), "range": wire_range(symbol.line, symbol.column, symbol.column + 1)} for symbol in symbols]
+        return None
+
+    def token_at(self, document, position):
+        token = document.token_at(position)
+        if token is None or (token.type != TokenType.identifier and token.type != TokenType.declaration_literal):
+            return None
+        return token
+
+    # method -> handler(server, params)
+    requests = {
+        "initialize": initialize,
+        "shutdown": shutdown,
+        "textDocument/documentSymbol": document_symbols,
+        "textDocument/definition": definition,
+        "workspace/symbol": workspace_symbols,
+        "sima/tokenize": tokenize,
+        "sima/parse": parse,
+        "sima/diagnostics": diagnostics,
+    }
+    notifications = {
+        "initialized": initialized,
+        "exit": exit,
+        "textDocument/didOpen": did_open,
+        "textDocument/didChange": did_change,
+        "textDocument/didClose": did_close,
+    }
+
+def read_message(stream):
+    # body of the next message, None at end of input
+    # a header block with a Content-Length which is not a number is read up to its end
+    # and raises a RequestError, the next message is then read from there
+    length = None
+    invalid = None
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            if length is not None:
+                break
+            continue
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            value = value.strip()
+            if value.isdigit():
+                length = int(value)
+                invalid = None
+            else:
+                length = 0
+                invalid = value
+    if invalid is not None:
+        raise RequestError(parse_error, "invalid Content-Length: " + invalid.decode("utf-8", "replace"))
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return body
+
+def serve(input_stream, output_stream, workspace=None):
+    # returns the exit code, 0 after shutdown and exit
+    server = FrontEndServer(output_stream, workspace)
+    while server.running:
+        try:
+            body = read_message(input_stream)
+        except RequestError as error:
+            server.send({"jsonrpc": "2.0", "id": None, "error": {"code": error.code, "message": error.message}})
+            continue
+        if body is None:
+            break
+        try:
+            message = json.loads(body)
+        except ValueError as error:
+            server.send({"jsonrpc": "2.0", "id": None, "error": {"code": parse_error, "message": str(error)}})
+            continue
+        response = server.handle(message)
+        if response is not None:
+            server.send(response)
+    return 0 if server.shutdown_requested else 1
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workspace", help="directory indexed before the first request")
+    args = parser.parse_args()
+    sys.exit(serve(sys.stdin.buffer, sys.stdout.buffer, args.workspace))
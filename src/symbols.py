@@ -0,0 +1,245 @@
+import os
+import pickle
+import struct
+import tempfile
+from bisect import bisect_left
+from src.tokenizer import *
+from src.parser import *
+from src.syntax import *
+from src.serialize import encode_tree, decode_tree
+
+# bump when the saved layout changes
+index_format = 2
+index_magic = b"SIMS"
+# magic, format
+index_header = struct.Struct("<4sH")
+
+class Symbol:
+    __slots__ = ('name', 'kind', 'file_name', 'line', 'column', 'signature', 'node')
+
+    def __init__(self, name, kind, file_name, line, column, signature, node):
+        # qualified name, Main.answer for def answer: in defmodule Main:
+        self.name = name
+        # "module" or "function"
+        self.kind = kind
+        self.file_name = file_name
+        self.line = line
+        self.column = column
+        # FunctionTypeNode of functions, None for modules
+        self.signature = signature
+        # definition node, None for symbols of a loaded index
+        self.node = node
+
+    def __str__(self):
+        return self.name + " " + self.kind + " " + self.file_name + ":" + str(self.line) + ":" + str(self.column)
+
+def collect_symbols(file_name, root):
+    # module and function definitions of a tree in source order, nested ones get
+    # the names of the definitions around them as prefix
+    # the parser ends a definition together with the last definition inside it, so
+    # a body not ending in a DefinitionEndNode is still open and the definitions
+    # after it, up to the next DefinitionEndNode of the same list, belong to it
+    symbols = []
+    # [nodes, next index, name prefix, names of definitions still open, name of the definition owning nodes]
+    stack = [[root.content, 0, "", [], None]]
+    while stack:
+        frame = stack[-1]
+        nodes, index, scope, open_names = frame[0], frame[1], frame[2], frame[3]
+        if index == len(nodes):
+            stack.pop()
+            if stack and nodes and type(nodes[-1]) is not DefinitionEndNode:
+                stack[-1][3].append(frame[4])
+                stack[-1][3].extend(open_names)
+            continue
+        frame[1] += 1
+        node = nodes[index]
+        if type(node) is DefinitionEndNode:
+            if open_names:
+                open_names.pop()
+            continue
+        if type(node) is ModuleDefinitionNode:
+            kind = "module"
+            signature = None
+        elif type(node) is FunctionDefinitionNode:
+            kind = "function"
+            signature = node.function_type
+        else:
+            continue
+        name = (open_names[-1] + "." if open_names else scope) + declared_name(node.identifier)
+        symbols.append(Symbol(name, kind, file_name, node.line, node.column, signature, node))
+        stack.append([node.body, 0, name + ".", [], name])
+    return symbols
+
+class SymbolIndex:
+    # symbols of many files by qualified name, replaced a file at a time
+    # lookups and file symbols are dictionary reads, prefix queries a binary search
+    # over sorted names; a name defined in several files has a symbol for each
+    # new names are collected unsorted and merged into the sorted names by the next
+    # prefix query once there are enough of them, names of removed symbols stay
+    # until a merge drops them, so updates never move the sorted list
+
+    def __init__(self):
+        # qualified name -> symbols with that name
+        self.symbols = {}
+        # sorted qualified names, some may have no symbols left
+        self.names = []
+        # names added since the last merge, sorted when recent_sorted is set
+        self.recent = []
+        self.recent_sorted = True
+        # all names in names and recent
+        self.listed = set()
+        # file name -> (stamp, symbols in source order), stamps are the caller's,
+        # src.driver.refresh_index uses modification time and size to find changed files
+        self.files = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def update_file(self, file_name, root, stamp=None):
+        self.set_symbols(file_name, collect_symbols(file_name, root), stamp)
+
+    def set_symbols(self, file_name, symbols, stamp=None):
+        self.remove_file(file_name)
+        self.files[file_name] = (stamp, symbols)
+        for symbol in symbols:
+            named = self.symbols.get(symbol.name)
+            if named is None:
+                named = self.symbols[symbol.name] = []
+                if symbol.name not in self.listed:
+                    self.listed.add(symbol.name)
+                    self.recent.append(symbol.name)
+                    self.recent_sorted = False
+            named.append(symbol)
+
+    def remove_file(self, file_name):
+        entry = self.files.pop(file_name, None)
+        if entry is None:
+            return
+        for symbol in entry[1]:
+            named = self.symbols[symbol.name]
+            named.remove(symbol)
+            if not named:
+                del self.symbols[symbol.name]
+
+    def sorted_names(self):
+        # (names, recent) both sorted, merged when recent is an eighth of names
+        if len(self.recent) * 8 > len(self.names):
+            symbols = self.symbols
+            names = [name for name in self.names if name in symbols]
+            names.extend(name for name in self.recent if name in symbols)
+            names.sort()
+            self.names = names
+            self.recent = []
+            self.listed = set(names)
+        elif not self.recent_sorted:
+            self.recent.sort()
+        self.recent_sorted = True
+        return self.names, self.recent
+
+    def lookup(self, name):
+        # symbols of a qualified name, empty when nothing defines it
+        return tuple(self.symbols.get(name, ()))
+
+    def prefix(self, prefix):
+        # symbols whose qualified names start with prefix, ordered by name
+        symbols = self.symbols
+        names, recent = self.sorted_names()
+        index = bisect_left(names, prefix)
+        recent_index = bisect_left(recent, prefix)
+        while True:
+            name = names[index] if index < len(names) else None
+            recent_name = recent[recent_index] if recent_index < len(recent) else None
+            if recent_name is not None and (name is None or recent_name < name):
+                name = recent_name
+                recent_index += 1
+            else:
+                index += 1
+            if name is None or not name.startswith(prefix):
+                break
+            for symbol in symbols.get(name, ()):
+                yield symbol
+
+    def file_symbols(self, file_name):
+        entry = self.files.get(file_name)
+        return tuple(entry[1]) if entry is not None else ()
+
+    def stamp(self, file_name):
+        entry = self.files.get(file_name)
+        return entry[0] if entry is not None else None
+
+    def encode(self):
+        # symbols without their definition nodes, signatures as encode_tree bytes; only
+        # plain values are pickled, nodes would make pickle recurse as deep as the tree
+        files = {}
+        for file_name, (stamp, symbols) in self.files.items():
+            files[file_name] = (stamp, [(symbol.name, symbol.kind, symbol.line, symbol.column, None if symbol.signature is None else encode_tree(symbol.signature)) for symbol in symbols])
+        return index_header.pack(index_magic, index_format) + pickle.dumps(files, pickle.HIGHEST_PROTOCOL)
+
+    def save(self, path):
+        # written to a temporary file and renamed, readers see the old or the new index
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as out:
+                out.write(self.encode())
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+def decode_index(data):
+    if len(data) < index_header.size:
+        raise ValueError("not a symbol index")
+    magic, version = index_header.unpack_from(data)
+    if magic != index_magic or version != index_format:
+        raise ValueError("not a symbol index")
+    index = SymbolIndex()
+    for file_name, (stamp, symbols) in pickle.loads(memoryview(data)[index_header.size:]).items():
+        symbols = [Symbol(name, kind, file_name, line, column, None if signature is None else decode_tree(signature), None) for name, kind, line, column, signature in symbols]
+        index.files[file_name] = (stamp, symbols)
+        for symbol in symbols:
+            index.symbols.setdefault(symbol.name, []).append(symbol)
+    index.names = sorted(index.symbols)
+    index.listed = set(index.names)
+    return index
+
+def load_index(path):
+    with open(path, "rb") as stream:
+        return decode_index(stream.read())
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    # workers unpickle results by module name, so use src.driver and not __main__
+    import src.driver as driver
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--index", help="saved index, read and updated when given")
+    parser.add_argument("--workers", type=int, help="processes parsing changed files")
+    parser.add_argument("--lookup", help="qualified name")
+    parser.add_argument("--prefix", help="start of qualified names")
+    parser.add_argument("--file", help="symbols of a file")
+    args = parser.parse_args()
+
+    index = SymbolIndex()
+    if args.index and os.path.exists(args.index):
+        try:
+            index = load_index(args.index)
+        except (OSError, ValueError, pickle.UnpicklingError) as error:
+            print(args.index + ": " + str(error) + ", building a new index", file=sys.stderr)
+    project = driver.refresh_index(index, args.directory, args.workers)
+    for result in project.diagnostics():
+        print(result.file_name + ": " + result.diagnostic, file=sys.stderr)
+    if args.index:
+        index.save(args.index)
+    if args.lookup is not None:
+        symbols = index.lookup(args.lookup)
+    elif args.prefix is not None:
+        symbols = index.prefix(args.prefix)
+    elif args.file is not None:
+        symbols = index.file_symbols(args.file)
+    else:
+        symbols = index.prefix("")
+    for symbol in symbols:
+        print(str(symbol))
+    print(str(len(index.files)) + " files, " + str(len(index)) + " names, " + str(len(project.results)) + " parsed", file=sys.stderr)
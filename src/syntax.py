@@ -1,110 +1,288 @@
 from enum import Enum
+from itertools import islice
 
 class SyntaxError(Exception):
-    def __init__(self, reason):
+    def __init__(self, reason, token=None):
         self.reason = reason
+        # token the error was found at, None when not known
+        self.token = token
 
     def __str__(self):
         return self.reason
 
+# nodes are slotted, line and column of the token a node starts at are kept
+# as plain ints, None for nodes not built from tokens; identifiers, atoms and
+# type names are interned by the parser so all trees share one copy of each
+# str(node) is built from text_layouts below without recursion, write_text
+# streams the same text to a file
+
 class RootNode:
+    __slots__ = ('content',)
 
     def __init__(self, content):
         self.content = content
     
     def __str__(self):
-        return "{\n\tRootNode Content: [\n" + "\n".join(str(p) for p in self.content) + "\n]\n}"
+        return node_text(self)
 
 class AtomLiteralNode:
+    __slots__ = ('identifier', 'line', 'column')
 
-    def __init__(self, identifier):
+    def __init__(self, identifier, line=None, column=None):
         self.identifier = identifier
+        self.line = line
+        self.column = column
     
     def __str__(self):
-        return "{\n\tAtomLiteralNode Identifier: " + str(self.identifier) + "\n}"
+        return node_text(self)
 
 class IntegerLiteralNode:
+    __slots__ = ('value', 'line', 'column')
 
-    def __init__(self, value):
+    def __init__(self, value, line=None, column=None):
         self.value = value
+        self.line = line
+        self.column = column
     
     def __str__(self):
-        return "{\n\tIntegerLiteralNode Value: " + str(self.value) + "\n}"
+        return node_text(self)
 
 
 class FloatLiteralNode:
+    __slots__ = ('value', 'line', 'column')
 
-    def __init__(self, value):
+    def __init__(self, value, line=None, column=None):
         self.value = value
+        self.line = line
+        self.column = column
     
     def __str__(self):
-        return "{\n\tFloatLiteralNode Value: " + str(self.value) + "\n}"
+        return node_text(self)
 
 class StringLiteralNode:
+    __slots__ = ('value', 'line', 'column')
 
-    def __init__(self, value):
+    def __init__(self, value, line=None, column=None):
         self.value = value
+        self.line = line
+        self.column = column
     
     def __str__(self):
-        return "{\n\tStringLiteralNode Value: " + str(self.value) + "\n}"
+        return node_text(self)
 
 class StructFieldNode:
-    def __init__(self, field_identifier, field_type):
+    __slots__ = ('field_identifier', 'field_type', 'line', 'column')
+
+    def __init__(self, field_identifier, field_type, line=None, column=None):
             self.field_identifier = field_identifier
             self.field_type = field_type
+            self.line = line
+            self.column = column
 
     def __str__(self):
-        return "{\n\tStructFieldNode Identifier: " + str(self.field_identifier) + " Type: " + str(self.field_type) + "\n}"
+        return node_text(self)
 
 class StructTypeNode:
-    def __init__(self, identifier, fields):
+    __slots__ = ('identifier', 'fields', 'resolved_type', 'line', 'column')
+
+    def __init__(self, identifier, fields, line=None, column=None):
             self.identifier = identifier
             self.fields = fields
+            # canonical src.canonical_types type, set by the type pass
+            self.resolved_type = None
+            self.line = line
+            self.column = column
 
     def __str__(self):
-        return "{\n\tStructTypeNode Identifier: " + str(self.identifier) + " Fields: [\n" + "\n".join(str(p) for p in self.fields) + "\n]\n}"
+        return node_text(self)
 
 class FunctionTypeNode:
-    def __init__(self, identifier, argument_type, return_type):
+    __slots__ = ('identifier', 'argument_type', 'return_type', 'resolved_type', 'line', 'column')
+
+    def __init__(self, identifier, argument_type, return_type, line=None, column=None):
             self.identifier = identifier
             self.argument_type = argument_type
             self.return_type = return_type
+            # canonical src.canonical_types type, set by the type pass
+            self.resolved_type = None
+            self.line = line
+            self.column = column
 
     def __str__(self):
-        return "{\n\tFunctionTypeNode Identifier: " + str(self.identifier) + " Signature: " + str(self.argument_type) + "->" + str(self.return_type) + "\n}"
+        return node_text(self)
 
 class TypeIdentifierNode:
-    def __init__(self, identifier, resolved_type):
+    __slots__ = ('identifier', 'resolved_type', 'line', 'column')
+
+    def __init__(self, identifier, resolved_type, line=None, column=None):
             self.identifier = identifier
             self.resolved_type = resolved_type
+            self.line = line
+            self.column = column
 
     def __str__(self):
-        return "{\n\tTypeIdentifierNode Identifier: " + str(self.identifier) + " Signature: " + str(self.resolved_type) + "\n}"
+        return node_text(self)
 
 class DefinitionEndNode:
+    __slots__ = ('line', 'column')
+
+    def __init__(self, line=None, column=None):
+        self.line = line
+        self.column = column
+
     def __str__(self):
-        return "{\n\tDefinitionEndNode\n}"
+        return node_text(self)
 
 class ModuleDefinitionNode:
-    def __init__(self, identifier, body):
+    __slots__ = ('identifier', 'body', 'line', 'column')
+
+    def __init__(self, identifier, body, line=None, column=None):
             self.identifier = identifier
             self.body = body
+            self.line = line
+            self.column = column
 
     def __str__(self):
-        return "{\n\tModuleDefinitionNode Identifier: " + str(self.identifier) + " Body: [\n" + "\n".join(str(p) for p in self.body) + "\n]\n}"
+        return node_text(self)
 
 class FunctionDefinitionNode:
-    def __init__(self, identifier, function_type, body):
+    __slots__ = ('identifier', 'function_type', 'body', 'line', 'column')
+
+    def __init__(self, identifier, function_type, body, line=None, column=None):
             self.identifier = identifier
             self.function_type = function_type
             self.body = body
+            self.line = line
+            self.column = column
 
     def __str__(self):
-        return "{\n\tFunctionDefinitionNode Identifier: " + str(self.identifier) + " Type : " + str(self.function_type) + " Body: [\n" + "\n".join(str(p) for p in self.body) + "\n]\n}"
+        return node_text(self)
 
 class FunctionReturnNode:
-    def __init__(self, return_value):
+    __slots__ = ('return_value', 'line', 'column')
+
+    def __init__(self, return_value, line=None, column=None):
             self.return_value = return_value
+            self.line = line
+            self.column = column
 
     def __str__(self):
-        return "{\n\tFunctionReturnNode return value: " + str(self.return_value) + "\n}"
\ No newline at end of file
+        return node_text(self)
+
+node_types = (RootNode, AtomLiteralNode, IntegerLiteralNode, FloatLiteralNode, StringLiteralNode, StructFieldNode, StructTypeNode,
+    FunctionTypeNode, TypeIdentifierNode, DefinitionEndNode, ModuleDefinitionNode, FunctionDefinitionNode, FunctionReturnNode)
+
+# fields holding a node, a list of nodes or None
+child_fields = {
+    RootNode: ('content',),
+    AtomLiteralNode: (),
+    IntegerLiteralNode: (),
+    FloatLiteralNode: (),
+    StringLiteralNode: (),
+    StructFieldNode: ('field_type',),
+    StructTypeNode: ('fields',),
+    FunctionTypeNode: ('argument_type', 'return_type'),
+    TypeIdentifierNode: (),
+    DefinitionEndNode: (),
+    ModuleDefinitionNode: ('body',),
+    FunctionDefinitionNode: ('function_type', 'body'),
+    FunctionReturnNode: ('return_value',),
+}
+
+# child fields holding a list of nodes, the others hold a node or None
+list_fields = frozenset(('content', 'body', 'fields'))
+# node type -> ((field, holds a list), ...) in reverse field order, the order children
+# are pushed on a stack so they come off it in field order; types without children
+# have an empty table
+child_tables = {node_type: tuple((field, field in list_fields) for field in reversed(child_fields[node_type])) for node_type in node_types}
+
+def child_nodes(node):
+    # nodes in the child fields of node, list fields in order
+    for field in child_fields[type(node)]:
+        value = getattr(node, field)
+        if field in list_fields:
+            for item in value:
+                yield item
+        elif value is not None:
+            yield value
+
+def walk(node):
+    # node and all nodes below it, parents first, without recursion
+    tables = child_tables
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        for field, is_list in tables[type(node)]:
+            value = getattr(node, field)
+            if is_list:
+                stack.extend(reversed(value))
+            elif value is not None:
+                stack.append(value)
+
+# (text, field) pairs making up str(node), the field is None after the last text
+# child lists are joined with newlines, missing children and other values go through str
+text_layouts = {
+    RootNode: (("{\n\tRootNode Content: [\n", 'content'), ("\n]\n}", None)),
+    AtomLiteralNode: (("{\n\tAtomLiteralNode Identifier: ", 'identifier'), ("\n}", None)),
+    IntegerLiteralNode: (("{\n\tIntegerLiteralNode Value: ", 'value'), ("\n}", None)),
+    FloatLiteralNode: (("{\n\tFloatLiteralNode Value: ", 'value'), ("\n}", None)),
+    StringLiteralNode: (("{\n\tStringLiteralNode Value: ", 'value'), ("\n}", None)),
+    StructFieldNode: (("{\n\tStructFieldNode Identifier: ", 'field_identifier'), (" Type: ", 'field_type'), ("\n}", None)),
+    StructTypeNode: (("{\n\tStructTypeNode Identifier: ", 'identifier'), (" Fields: [\n", 'fields'), ("\n]\n}", None)),
+    FunctionTypeNode: (("{\n\tFunctionTypeNode Identifier: ", 'identifier'), (" Signature: ", 'argument_type'), ("->", 'return_type'), ("\n}", None)),
+    TypeIdentifierNode: (("{\n\tTypeIdentifierNode Identifier: ", 'identifier'), (" Signature: ", 'resolved_type'), ("\n}", None)),
+    DefinitionEndNode: (("{\n\tDefinitionEndNode\n}", None),),
+    ModuleDefinitionNode: (("{\n\tModuleDefinitionNode Identifier: ", 'identifier'), (" Body: [\n", 'body'), ("\n]\n}", None)),
+    FunctionDefinitionNode: (("{\n\tFunctionDefinitionNode Identifier: ", 'identifier'), (" Type : ", 'function_type'), (" Body: [\n", 'body'), ("\n]\n}", None)),
+    FunctionReturnNode: (("{\n\tFunctionReturnNode return value: ", 'return_value'), ("\n}", None)),
+}
+
+def text_pieces(node):
+    # strings which joined are str(node), in order
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            yield item
+            continue
+        node_type = type(item)
+        children = child_fields[node_type]
+        parts = []
+        for text, field in text_layouts[node_type]:
+            parts.append(text)
+            if field is None:
+                continue
+            value = getattr(item, field)
+            if field not in children:
+                parts.append(str(value))
+            elif type(value) is list:
+                for index, child in enumerate(value):
+                    if index > 0:
+                        parts.append("\n")
+                    parts.append(child)
+            elif value is None:
+                parts.append("None")
+            else:
+                parts.append(value)
+        parts.reverse()
+        stack.extend(parts)
+
+def write_pieces(pieces, out, batch=4096):
+    # joins a few thousand pieces per write, the whole text is never held at once
+    pieces = iter(pieces)
+    while True:
+        chunk = list(islice(pieces, batch))
+        if not chunk:
+            break
+        out.write("".join(chunk))
+
+def node_text(node):
+    return "".join(text_pieces(node))
+
+def write_text(node, out):
+    write_pieces(text_pieces(node), out)
+
+def declared_name(identifier):
+    # declaration literals keep their colon
+    return identifier[:-1] if identifier.endswith(":") else identifier
@@ -1,5 +1,11 @@
 #!/usr/bin/python
 
+import codecs
+import io
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
 from enum import Enum
 
 class TokenType(Enum):
@@ -42,17 +48,130 @@ class TokenType(Enum):
      
 operator_allowed_chars = ['+','-','*','/','%','&','>','<','\\','|','~','!','=']
 
+def line_starts(text):
+    # offset of the first character of each line
+    starts = [0]
+    position = text.find("\n")
+    while position >= 0:
+        starts.append(position + 1)
+        position = text.find("\n", position + 1)
+    return starts
+
+class LineIndex:
+    # line start offsets of one source, turns offsets into 1 based lines and columns
+    # built from the whole text on first use, or line by line while a stream is read
+    # a newline ending an unterminated string literal is read as part of the string and
+    # FileTokenizer never counted it, so it does not start a line; scans report those
+    # with join
+
+    def __init__(self, file_name, text=None):
+        self.file_name = file_name
+        self.text = text
+        self.starts = [0] if text is None else None
+        # sorted offsets of newlines which do not start a line
+        self.joined = []
+
+    def line_starts(self):
+        if self.starts is None:
+            starts = line_starts(self.text)
+            if self.joined:
+                joined = set(self.joined)
+                starts = [start for start in starts if start - 1 not in joined]
+            self.starts = starts
+        return self.starts
+
+    def add_line(self, start):
+        self.starts.append(start)
+
+    def join(self, offset):
+        joined = self.joined
+        index = bisect_left(joined, offset)
+        if index < len(joined) and joined[index] == offset:
+            return
+        joined.insert(index, offset)
+        starts = self.starts
+        if starts is not None:
+            index = bisect_left(starts, offset + 1)
+            if index < len(starts) and starts[index] == offset + 1:
+                del starts[index]
+
+    def split_from(self, offset):
+        # undoes join for newlines from offset on, returns their offsets
+        index = bisect_left(self.joined, offset)
+        split = self.joined[index:]
+        del self.joined[index:]
+        if self.starts is not None:
+            for newline in split:
+                insort(self.starts, newline + 1)
+        return split
+
+    def line(self, offset):
+        return bisect_right(self.line_starts(), offset)
+
+    def position(self, offset):
+        # (line, column) of the character at offset
+        starts = self.line_starts()
+        line = bisect_right(starts, offset)
+        return line, offset - starts[line - 1] + 1
+
+    def end_column(self, start, end):
+        # column of end counted on the line of start
+        starts = self.line_starts()
+        return end - starts[bisect_right(starts, start) - 1] + 1
+
 class Token:
-    def __init__(self, type, value, file_name, line, start_column, end_column):
+    # positions are offsets into the source, lines and columns are looked up in its
+    # LineIndex only when asked for
+    # end is the offset end_column counts to: after the token, the colon of a declaration,
+    # after the closing quote of a string and the start of a newline token; it is kept
+    # as a length so an edit in front of the token only has start to move
+    __slots__ = ('type', 'value', 'source', 'start', 'length')
+
+    def __init__(self, type, value, source, start, end):
         self.type = type
         self.value = value
-        self.file_name = file_name
-        self.line = line
-        self.start_column = start_column
-        self.end_column = end_column
-    
+        # LineIndex of the file
+        self.source = source
+        self.start = start
+        self.length = end - start
+
+    @property
+    def end(self):
+        return self.start + self.length
+
+    @property
+    def file_name(self):
+        return self.source.file_name
+
+    # the parser asks every node token for its position, so these look into the
+    # starts list themselves instead of going through LineIndex methods
+    def position(self):
+        # (line, start column) with a single search
+        source = self.source
+        starts = source.starts or source.line_starts()
+        start = self.start
+        line = bisect_right(starts, start)
+        return line, start - starts[line - 1] + 1
+
+    @property
+    def line(self):
+        source = self.source
+        return bisect_right(source.starts or source.line_starts(), self.start)
+
+    @property
+    def start_column(self):
+        source = self.source
+        starts = source.starts or source.line_starts()
+        start = self.start
+        return start - starts[bisect_right(starts, start) - 1] + 1
+
+    @property
+    def end_column(self):
+        return self.source.end_column(self.start, self.end)
+
     def __str__(self):
-        return str(self.type) + " value: \"" + str(self.value) + "\" in " + self.file_name + ":" + str(self.line) + " col:" + str(self.start_column) + "-" + str(self.end_column)
+        line, start_column = self.source.position(self.start)
+        return str(self.type) + " value: \"" + str(self.value) + "\" in " + self.file_name + ":" + str(line) + " col:" + str(start_column) + "-" + str(self.end_column)
 
 
 class TokenizerError(Exception):
@@ -63,224 +182,781 @@ class TokenizerError(Exception):
         return self.reason
 
 class FileTokenizer:
-    def __init__(self, file_name, file_stream):
+    def __init__(self, file_name, file_stream, tracer=None):
         self.file_name = file_name
         self.file_stream = file_stream
+        # optional src.profiling.Tracer, hooks are skipped entirely when None
+        self.tracer = tracer
         self.current_char = ' '
-        self.current_line = 1
-        self.current_column = 0
+        # offset of current_char, the first read moves onto the first character
+        self.position = -1
+        # line starts are added as newlines are read, tokens look their lines up in it
+        self.lines = LineIndex(file_name)
+
+    def error(self):
+        line, column = self.lines.position(self.position)
+        return TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(line) + " col:" + str(column))
 
     def next_token(self):
         # check eof
         if self.current_char == None or self.current_char == '':
-            return Token(TokenType.eof, None, self.file_name, self.current_line, self.current_column, self.current_column)
+            return Token(TokenType.eof, None, self.lines, self.position, self.position)
 
         # omit spaces
         while self.current_char == ' ' or self.current_char == '\t':
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
+            self.position += 1
 
         # merge newlines
         if self.current_char == '\n':
-            line_break_line = self.current_line
-            line_break_column = self.current_column
+            start = self.position
             while self.current_char == ' ' or self.current_char == '\t' or self.current_char == '\n':
                 if self.current_char == '\n':
-                    self.current_line += 1
-                    self.current_column = 0
+                    self.lines.add_line(self.position + 1)
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1
-            return Token(TokenType.newline, None, self.file_name, line_break_line, line_break_column, line_break_column)
+                self.position += 1
+            return Token(TokenType.newline, None, self.lines, start, start)
         
         # begin line comment
         if self.current_char == '#':
             word = ''
-            start_column = self.current_column
+            start = self.position
             while self.current_char != '\n' and self.current_char != None and self.current_char != '':
                 word += self.current_char
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1
-            return Token(TokenType.comment, word, self.file_name, self.current_line, start_column, self.current_column)
+                self.position += 1
+            return Token(TokenType.comment, word, self.lines, start, self.position)
 
         # atom_literal
         if self.current_char == ':':
             word = self.current_char
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
+            self.position += 1
             if self.current_char.isalnum():
                 while self.current_char.isalnum() or self.current_char == '_':
                     word += self.current_char
                     self.current_char = self.file_stream.read(1)
-                    self.current_column += 1
+                    self.position += 1
                 # space after is required
                 if self.current_char == ' ' or self.current_char == '\t' or self.current_char == '\n':
-                    return Token(TokenType.atom_literal, word, self.file_name, self.current_line, start_column, self.current_column)
+                    return Token(TokenType.atom_literal, word, self.lines, start, self.position)
                 else:
-                    raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+                    raise self.error()
             else:
-                raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+                raise self.error()
         
         # try definition, declaration, identifier
         if self.current_char.isalpha():
             word = ''
-            start_column = self.current_column
+            start = self.position
             while self.current_char.isalnum() or self.current_char == '_':
                 word += self.current_char
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1
+                self.position += 1
                 
             if word == 'def':
                 # space after is required
                 if self.current_char == ' ':
-                    return Token(TokenType.definition, None, self.file_name, self.current_line, start_column, self.current_column)
+                    return Token(TokenType.definition, None, self.lines, start, self.position)
                 else:
-                    raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+                    raise self.error()
             elif word == 'ret':
                 # space after is required
                 if self.current_char == ' ' or self.current_char == '\n':
-                    return Token(TokenType.function_return, None, self.file_name, self.current_line, start_column, self.current_column)
+                    return Token(TokenType.function_return, None, self.lines, start, self.position)
                 else:
-                    raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+                    raise self.error()
             elif word == 'end':
                 # space after is required
                 if self.current_char == ' ' or self.current_char == '\n' or self.current_char == '':
-                    return Token(TokenType.definition_end, None, self.file_name, self.current_line, start_column, self.current_column)
+                    return Token(TokenType.definition_end, None, self.lines, start, self.position)
                 else:
-                    raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+                    raise self.error()
             elif word == 'defmodule':
                 # space after is required
                 if self.current_char == ' ' or self.current_char == '\n':
-                    return Token(TokenType.definition, "module", self.file_name, self.current_line, start_column, self.current_column)
+                    return Token(TokenType.definition, "module", self.lines, start, self.position)
                 else:
-                    raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+                    raise self.error()
             elif self.current_char == ':':
                 word += self.current_char
-                end_column = self.current_column
+                end = self.position
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1
+                self.position += 1
                 # space after is required
                 if self.current_char == ' ' or self.current_char == '\t' or self.current_char == '\n':
-                    return Token(TokenType.declaration_literal, word, self.file_name, self.current_line, start_column, end_column)
+                    return Token(TokenType.declaration_literal, word, self.lines, start, end)
                 else:
-                    raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+                    raise self.error()
             else:
-                return Token(TokenType.identifier, word, self.file_name, self.current_line, start_column, self.current_column)
+                return Token(TokenType.identifier, word, self.lines, start, self.position)
         
         # try number literal
         if self.current_char.isdigit():
             word = ''
-            start_column = self.current_column
+            start = self.position
             while self.current_char.isdigit():
                 word += self.current_char
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1
+                self.position += 1
                 
             if self.current_char == '.':
                 word += self.current_char
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1
+                self.position += 1
                 while self.current_char.isdigit():
                     word += self.current_char
                     self.current_char = self.file_stream.read(1)
-                    self.current_column += 1
-                return Token(TokenType.float_literal, word, self.file_name, self.current_line, start_column, self.current_column)
+                    self.position += 1
+                return Token(TokenType.float_literal, word, self.lines, start, self.position)
             else:
-                return Token(TokenType.integer_literal, word, self.file_name, self.current_line, start_column, self.current_column)
+                return Token(TokenType.integer_literal, word, self.lines, start, self.position)
         
         # try string literal
         if self.current_char == "\"":
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
+            self.position += 1
             word = ''
             # TODO: escaping quotes
             while self.current_char != "\"" and self.current_char != '\n' and self.current_char != None and self.current_char != '':
                 word += self.current_char
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1
+                self.position += 1
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.string_literal, word, self.file_name, self.current_line, start_column, self.current_column)
+            self.position += 1
+            return Token(TokenType.string_literal, word, self.lines, start, self.position)
         
         # check brackets
         if self.current_char == '(':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.round_bracket_open, '(', self.file_name, self.current_line, start_column, self.current_column)
+            self.position += 1
+            return Token(TokenType.round_bracket_open, '(', self.lines, start, self.position)
         if self.current_char == ')':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.round_bracket_close, ')', self.file_name, self.current_line, start_column, self.current_column)
+            self.position += 1
+            return Token(TokenType.round_bracket_close, ')', self.lines, start, self.position)
         if self.current_char == '[':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.square_bracket_open, '[', self.file_name, self.current_line, start_column, self.current_column)
+            self.position += 1
+            return Token(TokenType.square_bracket_open, '[', self.lines, start, self.position)
         if self.current_char == ']':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.square_bracket_close, ']', self.file_name, self.current_line, start_column, self.current_column)
+            self.position += 1
+            return Token(TokenType.square_bracket_close, ']', self.lines, start, self.position)
         if self.current_char == '{':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.curly_bracket_open, '{', self.file_name, self.current_line, start_column, self.current_column)
+            self.position += 1
+            return Token(TokenType.curly_bracket_open, '{', self.lines, start, self.position)
         if self.current_char == '}':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.curly_bracket_close, '}', self.file_name, self.current_line, start_column, self.current_column)   
+            self.position += 1
+            return Token(TokenType.curly_bracket_close, '}', self.lines, start, self.position)   
         
         # try separator
         if self.current_char == ',':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.separator, ',', self.file_name, self.current_line, start_column, self.current_column) 
+            self.position += 1
+            return Token(TokenType.separator, ',', self.lines, start, self.position) 
         
         # try accessor
         if self.current_char == '.':
-            start_column = self.current_column
+            start = self.position
             self.current_char = self.file_stream.read(1)
-            self.current_column += 1
-            return Token(TokenType.accessor, '.', self.file_name, self.current_line, start_column, self.current_column) 
+            self.position += 1
+            return Token(TokenType.accessor, '.', self.lines, start, self.position) 
         
         # try operator
         if self.current_char in operator_allowed_chars:
             word = ''
-            start_column = self.current_column
+            start = self.position
             while self.current_char in operator_allowed_chars:
                 word += self.current_char
                 self.current_char = self.file_stream.read(1)
-                self.current_column += 1   
+                self.position += 1   
             if word == '->':
-                return Token(TokenType.function_arrow, word, self.file_name, self.current_line, start_column, self.current_column)
+                return Token(TokenType.function_arrow, word, self.lines, start, self.position)
             else:
-                return Token(TokenType.operator, word, self.file_name, self.current_line, start_column, self.current_column)
+                return Token(TokenType.operator, word, self.lines, start, self.position)
         # error - cannot parse token
-        raise TokenizerError("Invalid token: " + self.current_char + " in " + self.file_name + ":" + str(self.current_line) + " col:" + str(self.current_column))
+        raise self.error()
 
-    def tokenize(self):
-        tokens = []
+    def iter_tokens(self):
         while True:
             token = self.next_token()
             if not(token) or token.type == TokenType.eof:
-                return tokens
+                return
+            if self.tracer is not None:
+                self.tracer.token(token)
+            yield token
+
+    def tokenize(self):
+        return list(self.iter_tokens())
+
+# precomputed tables for whole-buffer scanning
+# whole-buffer engines work on integer type codes, see token_types
+
+token_types = {token_type.value: token_type for token_type in TokenType}
+
+# keyword: type code, value offset from keyword start (-1 for no value), characters allowed after
+# "defmodule"[3:] is the "module" value, so it stays a slice of the source
+keyword_table = {
+    'def': (TokenType.definition.value, -1, (' ',)),
+    'ret': (TokenType.function_return.value, -1, (' ', '\n')),
+    'end': (TokenType.definition_end.value, -1, (' ', '\n', '')),
+    'defmodule': (TokenType.definition.value, 3, (' ', '\n')),
+}
+
+single_char_table = {
+    '(': TokenType.round_bracket_open.value,
+    ')': TokenType.round_bracket_close.value,
+    '[': TokenType.square_bracket_open.value,
+    ']': TokenType.square_bracket_close.value,
+    '{': TokenType.curly_bracket_open.value,
+    '}': TokenType.curly_bracket_close.value,
+    ',': TokenType.separator.value,
+    '.': TokenType.accessor.value,
+}
+
+operator_chars = frozenset(operator_allowed_chars)
+operator_class = '[' + re.escape(''.join(operator_allowed_chars)) + ']'
+
+# \w matches exactly isalnum() or '_', \d is a subset of isdigit()
+word_pattern = re.compile(r'\w*')
+digits_pattern = re.compile(r'\d*')
+spaces_pattern = re.compile(r'[ \t]*')
+blank_pattern = re.compile(r'[ \t\n]*')
+string_pattern = re.compile(r'[^"\n]*')
+comment_pattern = re.compile(r'[^\n]*')
+operator_pattern = re.compile(operator_class + '*')
+
+# master pattern for the common ascii case, group index selects the token kind
+# anything it does not cover exactly goes through TextTokenizer.next_token
+newline_group = 1
+comment_group = 2
+word_group = 3
+float_group = 4
+integer_group = 5
+string_group = 6
+atom_group = 7
+single_char_group = 8
+operator_group = 9
+token_pattern = re.compile(
+    r'[ \t]*(?:'
+    r'(\n[ \t\n]*)|'
+    r'(#[^\n]*)|'
+    r'([A-Za-z]\w*)|'
+    r'([0-9]+\.[0-9]*)|([0-9]+)|'
+    r'("[^"\n]*)|'
+    r'(:[A-Za-z0-9]\w*)|'
+    r'([()\[\]{},.])|'
+    r'(' + operator_class + '+))')
+
+def scan_digits(text, position):
+    # regex covers decimal digits, other isdigit() characters are rare
+    length = len(text)
+    while True:
+        position = digits_pattern.match(text, position).end()
+        if position < length and text[position].isdigit():
+            position += 1
+        else:
+            return position
+
+class TextTokenizer:
+    # scans produce raw records instead of Token objects:
+    # (type code, value start, value end, start, end)
+    # value is text[value start:value end], value start -1 means no value,
+    # start and end are the offsets of Token.start and Token.end; lines and
+    # columns are not tracked while scanning, self.lines resolves them when needed
+
+    def __init__(self, file_name, text, tracer=None):
+        self.file_name = file_name
+        self.text = text
+        # optional src.profiling.Tracer, hooks are skipped entirely when None
+        self.tracer = tracer
+        # built on first use, shared by the tokens of this text
+        self.lines = LineIndex(file_name, text)
+
+    def error(self, char, offset):
+        line, column = self.lines.position(offset)
+        return TokenizerError("Invalid token: " + char + " in " + self.file_name + ":" + str(line) + " col:" + str(column))
+
+    def join_newline(self, offset):
+        # the newline at offset ends an unterminated string, see LineIndex
+        self.lines.join(offset)
+
+    def next_token(self, position):
+        # character by character rules of FileTokenizer, returns raw record and new position
+        text = self.text
+        length = len(text)
+
+        # omit spaces
+        position = spaces_pattern.match(text, position).end()
+        if position >= length:
+            raise self.error('', position)
+        char = text[position]
+
+        # merge newlines
+        if char == '\n':
+            return (TokenType.newline.value, -1, -1, position, position), blank_pattern.match(text, position).end()
+
+        # line comment
+        if char == '#':
+            end = text.find('\n', position)
+            if end < 0:
+                end = length
+            return (TokenType.comment.value, position, end, position, end), end
+
+        # brackets, separator, accessor
+        code = single_char_table.get(char)
+        if code is not None:
+            return (code, position, position + 1, position, position + 1), position + 1
+
+        # definition, declaration, identifier
+        if char.isalpha():
+            end = word_pattern.match(text, position).end()
+            word = text[position:end]
+            next_char = text[end:end + 1]
+            keyword = keyword_table.get(word)
+            if keyword is not None:
+                # space after is required
+                if next_char in keyword[2]:
+                    value_start = position + keyword[1] if keyword[1] >= 0 else -1
+                    return (keyword[0], value_start, end, position, end), end
+                raise self.error(next_char, end)
+            if next_char == ':':
+                # space after is required
+                after = text[end + 1:end + 2]
+                if after == ' ' or after == '\t' or after == '\n':
+                    return (TokenType.declaration_literal.value, position, end + 1, position, end), end + 1
+                raise self.error(after, end + 1)
+            return (TokenType.identifier.value, position, end, position, end), end
+
+        # number literal
+        if char.isdigit():
+            end = scan_digits(text, position)
+            if text[end:end + 1] == '.':
+                end = scan_digits(text, end + 1)
+                code = TokenType.float_literal.value
             else:
+                code = TokenType.integer_literal.value
+            return (code, position, end, position, end), end
+
+        # string literal, closing quote or line break is consumed
+        if char == '"':
+            end = string_pattern.match(text, position + 1).end()
+            if text[end:end + 1] == '\n':
+                self.join_newline(end)
+            return (TokenType.string_literal.value, position + 1, end, position, end + 1), end + 1
+
+        # atom literal
+        if char == ':':
+            next_char = text[position + 1:position + 2]
+            if next_char.isalnum():
+                end = word_pattern.match(text, position + 1).end()
+                # space after is required
+                after = text[end:end + 1]
+                if after == ' ' or after == '\t' or after == '\n':
+                    return (TokenType.atom_literal.value, position, end, position, end), end
+                raise self.error(after, end)
+            raise self.error(next_char, position + 1)
+
+        # operator
+        if char in operator_chars:
+            end = operator_pattern.match(text, position).end()
+            code = TokenType.function_arrow.value if end - position == 2 and text[position:end] == '->' else TokenType.operator.value
+            return (code, position, end, position, end), end
+
+        # error - cannot parse token
+        raise self.error(char, position)
+
+    def scan(self, position=0):
+        # yields raw records from position to the end of text
+        # any token start is a valid position to resume from
+        text = self.text
+        length = len(text)
+        match = token_pattern.match
+        newline = TokenType.newline.value
+        comment = TokenType.comment.value
+        identifier = TokenType.identifier.value
+        declaration_literal = TokenType.declaration_literal.value
+        integer_literal = TokenType.integer_literal.value
+        float_literal = TokenType.float_literal.value
+        string_literal = TokenType.string_literal.value
+        atom_literal = TokenType.atom_literal.value
+        function_arrow = TokenType.function_arrow.value
+        operator = TokenType.operator.value
+        while True:
+            found = match(text, position)
+            if found is not None:
+                kind = found.lastindex
+                start = found.start(kind)
+                end = found.end()
+                if kind == newline_group:
+                    yield newline, -1, -1, start, start
+                    position = end
+                    if position >= length:
+                        return
+                    continue
+                if kind == word_group:
+                    next_char = text[end:end + 1]
+                    if next_char == ':':
+                        after = text[end + 1:end + 2]
+                        if (after == ' ' or after == '\n' or after == '\t') and found.group(kind) not in keyword_table:
+                            yield declaration_literal, start, end + 1, start, end
+                            position = end + 1
+                            continue
+                    else:
+                        keyword = keyword_table.get(found.group(kind))
+                        if keyword is None:
+                            yield identifier, start, end, start, end
+                            position = end
+                            if position >= length:
+                                return
+                            continue
+                        if next_char in keyword[2]:
+                            yield keyword[0], start + keyword[1] if keyword[1] >= 0 else -1, end, start, end
+                            position = end
+                            if position >= length:
+                                return
+                            continue
+                elif kind == single_char_group:
+                    yield single_char_table[text[start]], start, end, start, end
+                    position = end
+                    if position >= length:
+                        return
+                    continue
+                elif kind == comment_group:
+                    yield comment, start, end, start, end
+                    position = end
+                    if position >= length:
+                        return
+                    continue
+                elif kind == integer_group or kind == float_group:
+                    if not text[end:end + 1].isdigit():
+                        yield float_literal if kind == float_group else integer_literal, start, end, start, end
+                        position = end
+                        if position >= length:
+                            return
+                        continue
+                elif kind == string_group:
+                    if text[end:end + 1] == '\n':
+                        self.join_newline(end)
+                    yield string_literal, start + 1, end, start, end + 1
+                    position = end + 1
+                    if position >= length:
+                        return
+                    continue
+                elif kind == operator_group:
+                    yield function_arrow if end - start == 2 and text[start:end] == '->' else operator, start, end, start, end
+                    position = end
+                    if position >= length:
+                        return
+                    continue
+                elif kind == atom_group:
+                    after = text[end:end + 1]
+                    if after == ' ' or after == '\n' or after == '\t':
+                        yield atom_literal, start, end, start, end
+                        position = end
+                        continue
+            # not covered by the master pattern, use character rules
+            record, position = self.next_token(position)
+            yield record
+            if position >= length:
+                return
+
+    def iter_tokens(self, records=None):
+        # Token objects for records of scan, by default for a new scan of the whole text
+        text = self.text
+        lines = self.lines
+        types = token_types
+        tracer = self.tracer
+        if records is None:
+            records = self.scan()
+        for code, value_start, value_end, start, end in records:
+            token = Token(types[code], text[value_start:value_end] if value_start >= 0 else None, lines, start, end)
+            if tracer is not None:
+                tracer.token(token)
+            yield token
+
+    def tokenize(self):
+        return list(self.iter_tokens())
+
+    def tokenize_buffer(self):
+        tokens = TokenBuffer(self.file_name, self.text)
+        tokens.lines = self.lines
+        tokens.extend(self.scan())
+        return tokens
+
+def pending_pattern(text):
+    # pattern matching the characters which leave the unfinished token text starts with
+    # unfinished, None when any character may finish it or make it an error
+    # text is what a PushTokenizer could not lex yet; it is only scanned again once a
+    # chunk has a character outside the pattern, so a long comment, string, word, number
+    # or blank run is scanned once more when it ends instead of once per chunk
+    position = spaces_pattern.match(text).end()
+    if position == len(text):
+        return spaces_pattern
+    char = text[position]
+    if char == '\n':
+        return blank_pattern if blank_pattern.match(text, position).end() == len(text) else None
+    if char == '#':
+        return comment_pattern
+    if char == '"':
+        return string_pattern
+    if char.isalpha():
+        return word_pattern if word_pattern.match(text, position).end() == len(text) else None
+    if char.isdigit():
+        end = digits_pattern.match(text, position).end()
+        if end < len(text) and text[end] == '.':
+            end = digits_pattern.match(text, end + 1).end()
+        return digits_pattern if end == len(text) else None
+    if char == ':':
+        if position + 1 < len(text) and text[position + 1].isalnum() and word_pattern.match(text, position + 1).end() == len(text):
+            return word_pattern
+        return None
+    if char in operator_chars:
+        return operator_pattern if operator_pattern.match(text, position).end() == len(text) else None
+    return None
+
+class PushTokenizer(TextTokenizer):
+    # lexes source pushed in chunks of any size: feed returns the tokens a chunk completed
+    # and close the rest, together they are the tokens and errors FileTokenizer gives for
+    # the whole text
+    # a token is complete once a character after it has arrived; an unfinished one is
+    # kept with pending_pattern of it, chunks the pattern takes whole are only collected
+    # and the token is lexed again from its start with the first chunk that could end
+    # it; that is how words, numbers, operators, merged newlines, strings and comments
+    # carry over chunk boundaries in time linear in the length of the source
+
+    def __init__(self, file_name, tracer=None):
+        TextTokenizer.__init__(self, file_name, '', tracer)
+        # line starts are added as newline tokens complete, like FileTokenizer does
+        self.lines = LineIndex(file_name)
+        # text and then chunks hold what is not lexed yet, base is the offset of its
+        # first character
+        self.base = 0
+        self.chunks = []
+        # pending_pattern of text
+        self.pending = None
+        self.closed = False
+        # offset in text of the character the last error was about
+        self.error_offset = None
+
+    def join_newline(self, offset):
+        # lines only come from newline tokens, a newline inside a string is never added
+        pass
+
+    def error(self, char, offset):
+        self.error_offset = offset
+        line, column = self.lines.position(self.base + offset)
+        return TokenizerError("Invalid token: " + char + " in " + self.file_name + ":" + str(line) + " col:" + str(column))
+
+    def feed(self, chunk):
+        if self.closed:
+            raise ValueError("feed after close")
+        if not chunk:
+            return []
+        self.chunks.append(chunk)
+        if self.pending is not None and self.pending.match(chunk).end() == len(chunk):
+            return []
+        return self.lex(False)
+
+    def close(self):
+        if self.closed:
+            return []
+        self.closed = True
+        return self.lex(True)
+
+    def lex(self, final):
+        # complete tokens at the start of text, an error is only raised once the
+        # character it is about has arrived
+        if self.chunks:
+            self.text = self.text + "".join(self.chunks)
+            self.chunks = []
+        text = self.text
+        length = len(text)
+        tokens = []
+        if length == 0:
+            # like the other tokenizers an empty source is an error
+            if final and self.base == 0:
+                raise self.error('', 0)
+            return tokens
+        base = self.base
+        lines = self.lines
+        types = token_types
+        tracer = self.tracer
+        newline = TokenType.newline.value
+        position = 0
+        try:
+            for code, value_start, value_end, start, end in self.scan():
+                if code == newline:
+                    after = blank_pattern.match(text, start).end()
+                else:
+                    # declarations end after their colon, strings after the closing quote
+                    after = value_end if value_end > end else end
+                if after >= length and not final:
+                    break
+                if code == newline:
+                    line_break = text.find('\n', start, after)
+                    while line_break >= 0:
+                        lines.add_line(base + line_break + 1)
+                        line_break = text.find('\n', line_break + 1, after)
+                token = Token(types[code], text[value_start:value_end] if value_start >= 0 else None, lines, base + start, base + end)
+                if tracer is not None:
+                    tracer.token(token)
                 tokens.append(token)
+                position = after
+        except TokenizerError:
+            if final or self.error_offset < length:
+                raise
+        self.text = text[position:]
+        self.base = base + position
+        self.pending = pending_pattern(self.text)
         return tokens
 
+async def iter_stream_tokens(reader, file_name="<stream>", encoding="utf-8", chunk_size=65536):
+    # tokens from an asyncio.StreamReader as they complete, bytes are decoded with the
+    # newline translation of a file opened in text mode
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), True)
+    tokenizer = PushTokenizer(file_name)
+    while True:
+        data = await reader.read(chunk_size)
+        if not data:
+            break
+        for token in tokenizer.feed(decoder.decode(data)):
+            yield token
+    for token in tokenizer.feed(decoder.decode(b'', True)) + tokenizer.close():
+        yield token
+
+class TokenView:
+    # Token-like proxy for one entry of a TokenBuffer
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def type(self):
+        return token_types[self.buffer.types[self.index]]
+
+    @property
+    def value(self):
+        return self.buffer.value(self.index)
+
+    @property
+    def file_name(self):
+        return self.buffer.file_name
+
+    @property
+    def source(self):
+        return self.buffer.lines
+
+    @property
+    def start(self):
+        return self.buffer.starts[self.index]
+
+    @property
+    def end(self):
+        return self.buffer.ends[self.index]
+
+    position = Token.position
+    line = Token.line
+    start_column = Token.start_column
+    end_column = Token.end_column
+    __str__ = Token.__str__
+
+class TokenBuffer:
+    # struct of arrays token storage, one row per token
+    # values are slices of the source text, the file name and line index are stored once
+
+    def __init__(self, file_name, text):
+        self.file_name = file_name
+        self.text = text
+        self.lines = LineIndex(file_name, text)
+        self.types = array('h')
+        self.value_starts = array('i')
+        self.value_ends = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+
+    def append(self, code, value_start, value_end, start, end):
+        self.types.append(code)
+        self.value_starts.append(value_start)
+        self.value_ends.append(value_end)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def extend(self, records):
+        # transpose fixed size batches in C instead of five appends per token
+        records = iter(records)
+        columns = (self.types, self.value_starts, self.value_ends, self.starts, self.ends)
+        while True:
+            batch = list(islice(records, 4096))
+            if not batch:
+                return
+            for column, values in zip(columns, zip(*batch)):
+                column.extend(values)
+
+    def value(self, index):
+        value_start = self.value_starts[index]
+        if value_start < 0:
+            return None
+        return self.text[value_start:self.value_ends[index]]
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.types)
+        if index < 0 or index >= len(self.types):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield TokenView(self, index)
+
+    def to_tokens(self):
+        return [Token(token.type, token.value, self.lines, token.start, token.end) for token in self]
+
+def tokenize_text(text, file_name="<string>"):
+    return TextTokenizer(file_name, text).tokenize()
+
+def read_source(file_name):
+    # single bulk read, same newline translation as FileTokenizer
+    with open(file_name, "r") as file_stream:
+        return file_stream.read()
+
+def tokenize_path(file_name):
+    return TextTokenizer(file_name, read_source(file_name)).tokenize()
+
 if __name__ == "__main__":
     import sys
     file_name = sys.argv[1]
-    tokenizer = FileTokenizer(file_name, open(file_name, "r"))
+    errors = (TokenizerError,)
+    profile = None
     try:
-        tokens = tokenizer.tokenize()
+        if "--profile" in sys.argv[2:]:
+            # run as python -m src.tokenizer, profiling uses the src.tokenizer module
+            import src.profiling as profiling
+            errors = (TokenizerError, profiling.TokenizerError)
+            tokens, root, profile = profiling.run_profiled(file_name, parse=False)
+        else:
+            tokens = tokenize_path(file_name)
         for t in tokens:
             print(str(t))
-    except TokenizerError as e:
+        if profile is not None:
+            print(str(profile), file=sys.stderr)
+    except errors as e:
         print(str(e))
\ No newline at end of file
@@ -0,0 +1,180 @@
+from src.syntax import *
+
+# generic passes over syntax trees: children are found through the child_tables of
+# src.syntax, walks keep an explicit stack so trees of any depth are walked without
+# recursion, and the methods of a Visitor or Transformer class are looked up by node
+# class name once per class
+# run_passes walks a tree once for several visitors, transform_passes rebuilds it once
+# for several transformers
+
+# returned by an enter method to leave the children of the node out, for that visitor only
+skip_children = object()
+# pushed above a node whose children are on the stack, the node is left when it comes off
+leave_marker = object()
+
+def postorder(node):
+    # node and all nodes below it, children before their parent, without recursion
+    tables = child_tables
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node is leave_marker:
+            yield stack.pop()
+            continue
+        table = tables[type(node)]
+        if not table:
+            yield node
+            continue
+        stack.append(node)
+        stack.append(leave_marker)
+        for field, is_list in table:
+            value = getattr(node, field)
+            if is_list:
+                stack.extend(reversed(value))
+            elif value is not None:
+                stack.append(value)
+
+def class_methods(cls, prefix):
+    # node type -> function prefix + class name of cls, or None, built once per class
+    cache = cls.__dict__.get('method_cache')
+    if cache is None:
+        cache = {}
+        cls.method_cache = cache
+    methods = cache.get(prefix)
+    if methods is None:
+        methods = cache[prefix] = {node_type: getattr(cls, prefix + node_type.__name__, None) for node_type in node_types}
+    return methods
+
+class Visitor:
+    # subclasses define enter_<node class>(node), called before the children of a node,
+    # and leave_<node class>(node), called after them; both are optional and node types
+    # without either are only walked through
+    # an enter method returning skip_children leaves out the children of that node,
+    # its leave method is still called
+
+    def visit(self, root):
+        run_passes(root, [self])
+        return self
+
+def run_passes(root, visitors):
+    # one walk over root calling every visitor in the order given, each one sees the
+    # same calls its own visit would make
+    enter_calls = {}
+    leave_calls = {}
+    for node_type in node_types:
+        enter_calls[node_type] = []
+        leave_calls[node_type] = []
+    for index, visitor in enumerate(visitors):
+        enters = class_methods(type(visitor), "enter_")
+        leaves = class_methods(type(visitor), "leave_")
+        for node_type in node_types:
+            if enters[node_type] is not None:
+                enter_calls[node_type].append((index, visitor, enters[node_type]))
+            if leaves[node_type] is not None:
+                leave_calls[node_type].append((index, visitor, leaves[node_type]))
+    tables = child_tables
+    # node whose children each visitor skips, None while it sees everything
+    skipped = [None] * len(visitors)
+    skipping = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is leave_marker:
+            node = stack.pop()
+            if skipping:
+                for index in range(len(skipped)):
+                    if skipped[index] is node:
+                        skipped[index] = None
+                        skipping -= 1
+            for index, visitor, method in leave_calls[type(node)]:
+                if not skipping or skipped[index] is None:
+                    method(visitor, node)
+            continue
+        node_type = type(node)
+        table = tables[node_type]
+        skips_here = False
+        for index, visitor, method in enter_calls[node_type]:
+            if skipping and skipped[index] is not None:
+                continue
+            # a node without children has nothing to skip
+            if method(visitor, node) is skip_children and table:
+                skipped[index] = node
+                skipping += 1
+                skips_here = True
+        if skips_here or leave_calls[node_type]:
+            stack.append(node)
+            stack.append(leave_marker)
+        # children nobody looks at are not walked
+        if skipping == len(visitors):
+            continue
+        for field, is_list in table:
+            value = getattr(node, field)
+            if is_list:
+                stack.extend(reversed(value))
+            elif value is not None:
+                stack.append(value)
+
+class Transformer:
+    # subclasses define transform_<node class>(node), called after the children of the
+    # node were transformed and put in its fields; it returns the node to put in its
+    # place: node itself, changed or not, another node, or None to remove it, which
+    # drops it from a list field and leaves None in any other field
+    # node types without a method are kept as they are
+
+    def transform(self, root):
+        return transform_passes(root, [self])
+
+def transform_passes(root, transformers):
+    # root transformed by every transformer in one walk: at each node the transformers
+    # run in the order given, each on what the one before returned; the same as
+    # transforming the whole tree with each in turn as long as a transform method only
+    # looks at its node and the nodes below it
+    # list fields are changed in place, returns what replaces root
+    methods = [(transformer, class_methods(type(transformer), "transform_")) for transformer in transformers]
+    tables = child_tables
+    stack = [root]
+    # transformed nodes waiting for their parent, in walk order
+    results = []
+    while stack:
+        node = stack.pop()
+        if node is leave_marker:
+            node = stack.pop()
+            # results of the children in field order, the tables list fields in reverse
+            table = tables[type(node)]
+            end = len(results)
+            for field, is_list in table:
+                value = getattr(node, field)
+                if is_list:
+                    start = end - len(value)
+                    changed = results[start:end]
+                    for old, new in zip(value, changed):
+                        if old is not new:
+                            value[:] = [child for child in changed if child is not None]
+                            break
+                    end = start
+                elif value is not None:
+                    end -= 1
+                    if results[end] is not value:
+                        setattr(node, field, results[end])
+            del results[end:]
+        else:
+            table = tables[type(node)]
+            if table:
+                stack.append(node)
+                stack.append(leave_marker)
+                for field, is_list in table:
+                    value = getattr(node, field)
+                    if is_list:
+                        stack.extend(reversed(value))
+                    elif value is not None:
+                        stack.append(value)
+                continue
+        # each transformer dispatches on what the one before returned
+        for transformer, found in methods:
+            method = found.get(type(node))
+            if method is not None:
+                node = method(transformer, node)
+                if node is None:
+                    break
+        results.append(node)
+    return results[0]
@@ -0,0 +1,43 @@
+# results of src.evaluator for bodies with and without ret, the first statement of a
+# body included, and the tree the parser gives for them
+# run from repository root: python -m unittest tests.test_evaluator, or python -m pytest
+
+import unittest
+from src.tokenizer import *
+from src.parser import *
+from src.evaluator import run
+
+def parsed(bodies):
+    # one module with a function per body, each body is a list of lines
+    lines = ["defmodule Test:"]
+    for index, body in enumerate(bodies):
+        lines.append("    def f" + str(index) + ": Void -> Int")
+        lines.extend("        " + line for line in body)
+        lines.append("    end")
+    lines.append("end")
+    return TokenParser(TextTokenizer("test.sima", "\n".join(lines) + "\n").tokenize()).parse_tokens()
+
+def results(bodies):
+    root = parsed(bodies)
+    return [run(root, "Test.f" + str(index)) for index in range(len(bodies))]
+
+class FunctionResults(unittest.TestCase):
+    def test_first_ret(self):
+        self.assertEqual(results([["ret 1", "ret 2"], ["ret 1", "7"], ["5", "ret 3", "ret 4"], ["# c", "ret 1", "7"]]), [1, 1, 3, 1])
+
+    def test_last_expression(self):
+        self.assertEqual(results([["5", "6"], ["5"], ["ret ret 2", "3"], [":ok", "\"s\""], []]), [6, 5, 2, "s", None])
+
+    def test_first_statement_parsed(self):
+        root = parsed([["ret 1", "ret 2"], ["5", "ret 3"]])
+        functions = [root.content[0].body[0], root.content[1]]
+        self.assertEqual([type(node).__name__ for node in functions[0].body], ["FunctionReturnNode", "FunctionReturnNode", "DefinitionEndNode"])
+        self.assertEqual([type(node).__name__ for node in functions[1].body], ["IntegerLiteralNode", "FunctionReturnNode", "DefinitionEndNode"])
+        self.assertEqual((functions[0].body[0].line, functions[0].body[0].column), (3, 9))
+
+    def test_sample(self):
+        root = TokenParser(tokenize_path("sample/sima_sample.sima")).parse_tokens()
+        self.assertEqual((run(root, "Main.main"), run(root, "Main.answer")), (0, 42))
+
+if __name__ == "__main__":
+    unittest.main()
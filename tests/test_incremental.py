@@ -0,0 +1,149 @@
+# IncrementalDocument.apply_edit against tokenizing and parsing the edited text from
+# scratch, over random edits of random and generated sources: the tokens with their
+# offsets, lines and columns, the tree with the positions of all nodes, or the first
+# TokenizerError or SyntaxError, have to be the same after every edit
+# run from repository root: python -m unittest tests.test_incremental, or python -m pytest
+
+import io
+import random
+import unittest
+from src.tokenizer import *
+from src.parser import *
+from src.incremental import IncrementalDocument
+from src.serialize import write_sexp
+from benchmarks.generator import generate_source
+
+# whole lines and single tokens
+pieces = ['def f: Int -> Int\n', 'defmodule M:\n', '    ret 1\n', '    ret ret :ok\n', 'end\n', 'end', 'ret ', '12', '3.5',
+    ':ok', '"s"', 'x', 'Int', ' -> ', '{}', ' ', '    ', '\n', '\n\n', '# c', '#']
+# lines inserted where a line starts
+line_pieces = ['def f: Int -> Int\n', 'def g: {} -> Void # c\n', 'defmodule M:\n', '    ret 1\n', '    2.5\n', 'end\n', '\n', '# c\n']
+# pieces breaking tokens or definitions: quotes, characters no rule takes, definitions
+# without a declaration
+broken_pieces = ['def ', ':', '"', '½', 'def 12\n']
+
+def random_piece(rng):
+    return rng.choice(broken_pieces) if rng.random() < 0.05 else rng.choice(pieces)
+
+def described(tokens):
+    return [(token.type, token.value, token.start, token.line, token.start_column, token.end_column) for token in tokens]
+
+def sexp(root):
+    out = io.StringIO()
+    write_sexp(root, out)
+    return out.getvalue()
+
+def full_run(text):
+    # described tokens, tree text and tree with positions, or the error
+    try:
+        tokens = TextTokenizer("test.sima", text).tokenize()
+        parser = TokenParser(tokens)
+        parser.print_errors = False
+        root = parser.parse_tokens()
+    except (TokenizerError, SyntaxError) as error:
+        return type(error).__name__ + ": " + str(error)
+    return described(tokens), str(root), sexp(root)
+
+def random_source(rng):
+    if rng.random() < 0.5:
+        return "".join(random_piece(rng) for _ in range(rng.randint(1, 30)))
+    return generate_source(rng.randint(1, 3), rng.randint(1, 5), rng.randint(0, 3), 0.3, 0, rng.randint(1, 3), rng.randrange(1000))
+
+def random_edit(rng, text):
+    if rng.random() < 0.7:
+        # a whole line inserted, deleted or replaced, which mostly keeps the text valid
+        starts = [0] + [index + 1 for index, character in enumerate(text) if character == "\n"]
+        start = rng.choice(starts)
+        end = start
+        if rng.random() < 0.5:
+            newline = text.find("\n", start)
+            end = len(text) if newline < 0 else newline + 1
+        return start, end, rng.choice(line_pieces) if rng.random() < 0.7 else ""
+    start = rng.randint(0, len(text))
+    end = min(len(text), start + rng.choice([0, 0, 1, 2, 5, 20]))
+    replacement = "".join(random_piece(rng) for _ in range(rng.choice([0, 1, 1, 2])))
+    return start, end, replacement
+
+class IncrementalEdits(unittest.TestCase):
+    def edit(self, document, text, start, end, replacement, read):
+        # returns the document, None when it could not be made
+        expected = full_run(text)
+        message = "edit " + repr((start, end, replacement)) + " giving " + repr(text)
+        try:
+            if document is None:
+                document = IncrementalDocument("test.sima", text)
+            else:
+                document.apply_edit(start, end, replacement)
+        except (TokenizerError, SyntaxError) as error:
+            self.assertEqual(type(error).__name__ + ": " + str(error), expected, message)
+            return document
+        self.assertEqual(document.text, text, message)
+        # the tree is not read after every edit, node lines are then left pending
+        if read:
+            self.assertEqual((described(document.tokens), str(document.root), sexp(document.root)), expected, message)
+        return document
+
+    def check(self, seed, documents, edits, read_rate):
+        rng = random.Random(seed)
+        for _ in range(documents):
+            text = random_source(rng)
+            try:
+                document = IncrementalDocument("test.sima", text)
+            except (TokenizerError, SyntaxError):
+                document = None
+            undo = None
+            for _ in range(edits):
+                # undoing the edit before brings broken texts back, like typing does
+                if undo is not None and rng.random() < 0.4:
+                    start, end, replacement = undo
+                    undo = None
+                else:
+                    start, end, replacement = random_edit(rng, text)
+                    undo = (start, start + len(replacement), text[start:end])
+                text = text[:start] + replacement + text[end:]
+                document = self.edit(document, text, start, end, replacement, rng.random() < read_rate)
+            # whatever was left pending is settled at the end
+            self.assertEqual(full_run(text), self.final(document, text))
+
+    def final(self, document, text):
+        if document is None or not document.valid:
+            return full_run(text)
+        return described(document.tokens), str(document.root), sexp(document.root)
+
+    def test_every_edit(self):
+        self.check(1, 80, 30, 1.0)
+
+    def test_pending_lines(self):
+        self.check(2, 80, 30, 0.2)
+
+    def test_long_document(self):
+        # edits far apart in a long document move the pending gap over many nodes
+        rng = random.Random(3)
+        text = generate_source(3, 25, 2, 0.3, 0, 2, 3)
+        document = IncrementalDocument("test.sima", text)
+        for _ in range(200):
+            start, end, replacement = random_edit(rng, text)
+            text = text[:start] + replacement + text[end:]
+            document = self.edit(document, text, start, end, replacement, rng.random() < 0.3)
+        self.assertEqual(full_run(text), self.final(document, text))
+
+    def test_errors(self):
+        # an edit breaking the text, then the edit fixing it again
+        text = "defmodule M:\n    def f: Int -> Int\n        ret 1\n    end\nend\n"
+        document = IncrementalDocument("test.sima", text)
+        expected = full_run(text)
+        ret = text.index("ret")
+        for start, end, replacement in ((ret, ret, "½ "), (13, 13, "def 12\n"), (10, 12, "12"), (0, 9, "def")):
+            broken = text[:start] + replacement + text[end:]
+            self.assertIsInstance(full_run(broken), str)
+            document = self.edit(document, broken, start, end, replacement, True)
+            document = self.edit(document, text, start, start + len(replacement), text[start:end], True)
+            self.assertEqual(self.final(document, text), expected)
+
+    def test_invalid_range(self):
+        document = IncrementalDocument("test.sima", "end\n")
+        self.assertRaises(ValueError, document.apply_edit, 3, 2, "")
+        self.assertRaises(ValueError, document.apply_edit, 0, 5, "")
+
+if __name__ == "__main__":
+    unittest.main()
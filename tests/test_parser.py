@@ -0,0 +1,172 @@
+# TokenParser, which runs on an explicit stack, against a plain recursive descent
+# parser of the same grammar on well formed sources: the trees with all lines and
+# columns have to be the same, for token lists, token streams and the recovering
+# parse, which must not report anything on them
+# run from repository root: python -m unittest tests.test_parser, or python -m pytest
+
+import io
+import random
+import unittest
+from sys import intern
+from src.tokenizer import *
+from src.parser import *
+from src.serialize import write_sexp
+from benchmarks.generator import generate_source
+
+class RecursiveParser:
+    # recursive descent the way TokenParser read sources before it had a stack, only
+    # for well formed sources; current_index is left at the last token of a node
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.current_index = -1
+
+    def parse_tokens(self):
+        nodes = []
+        while True:
+            try:
+                nodes.append(self.parse_node())
+            except IndexError:
+                return RootNode(nodes)
+
+    def next_token(self):
+        self.current_index += 1
+        while self.tokens[self.current_index].type == TokenType.comment:
+            self.current_index += 1
+        return self.tokens[self.current_index]
+
+    def parse_node(self):
+        token = self.next_token()
+        position = (token.line, token.start_column)
+        if token.type == TokenType.atom_literal:
+            return AtomLiteralNode(intern(token.value), *position)
+        if token.type == TokenType.integer_literal:
+            return IntegerLiteralNode(token.value, *position)
+        if token.type == TokenType.float_literal:
+            return FloatLiteralNode(token.value, *position)
+        if token.type == TokenType.string_literal:
+            return StringLiteralNode(token.value, *position)
+        if token.type == TokenType.definition_end:
+            return DefinitionEndNode(*position)
+        if token.type == TokenType.function_return:
+            return FunctionReturnNode(self.parse_node(), *position)
+        if token.type == TokenType.definition:
+            return self.parse_definition(token)
+        return self.parse_node()
+
+    def parse_definition(self, definition_token):
+        declaration_token = self.next_token()
+        # a module has no signature, the type of a function may still be None
+        module = self.tokens[self.current_index + 1].type not in (TokenType.identifier, TokenType.curly_bracket_open)
+        function_type = None if module else self.parse_type()
+        # the body starts on the newline, it ends with the first end read in it,
+        # which may be the end of a definition inside it
+        self.next_token()
+        body = []
+        while self.tokens[self.current_index].type != TokenType.definition_end:
+            body.append(self.parse_node())
+        position = (definition_token.line, definition_token.start_column)
+        if module:
+            return ModuleDefinitionNode(intern(declaration_token.value), body, *position)
+        return FunctionDefinitionNode(intern(declaration_token.value), function_type, body, *position)
+
+    def parse_type(self):
+        token = self.next_token()
+        if token.type == TokenType.curly_bracket_open:
+            self.next_token()
+            argument_type = StructTypeNode(None, [], token.line, token.start_column)
+        else:
+            argument_type = TypeIdentifierNode(intern(token.value), None, token.line, token.start_column)
+        if self.tokens[self.current_index + 1].type != TokenType.function_arrow:
+            # struct types are only supported as argument of a function type so far
+            return argument_type if token.type != TokenType.curly_bracket_open else None
+        self.next_token()
+        return FunctionTypeNode(None, argument_type, self.parse_type(), token.line, token.start_column)
+
+def sexp(root):
+    out = io.StringIO()
+    write_sexp(root, out)
+    return out.getvalue()
+
+literals = ['1', '42', '2.5', ':ok', '"s"', '""']
+
+def random_statement(rng):
+    kind = rng.randrange(5)
+    if kind == 0:
+        return "ret " + rng.choice(literals)
+    if kind == 1:
+        return "ret ret " + rng.choice(literals)
+    if kind == 2:
+        return "# " + rng.choice(literals)
+    return rng.choice(literals) + rng.choice(["", "", " # c"])
+
+def random_definition(rng, indent, depth, lines):
+    # a module or function with statements, blank lines and nested definitions
+    if rng.random() < 0.3:
+        lines.append(indent + "defmodule M" + str(rng.randrange(10)) + ":" + rng.choice(["", " # c"]))
+    else:
+        arrows = [rng.choice(["Void", "Int", "{}"]) for _ in range(rng.randint(1, 4))]
+        lines.append(indent + "def f" + str(rng.randrange(10)) + ": " + " -> ".join(arrows) + rng.choice(["", " # c"]))
+    for _ in range(rng.randint(0, 4)):
+        if depth > 0 and rng.random() < 0.3:
+            random_definition(rng, indent + "    ", depth - 1, lines)
+        elif rng.random() < 0.2:
+            lines.append("")
+        else:
+            lines.append(indent + "    " + random_statement(rng))
+    lines.append(indent + "end")
+
+def random_source(rng):
+    lines = []
+    for _ in range(rng.randint(1, 3)):
+        random_definition(rng, "", 2, lines)
+    return "\n".join(lines) + rng.choice(["", "\n"])
+
+class ParserEngines(unittest.TestCase):
+    def check(self, text):
+        tokens = TextTokenizer("test.sima", text).tokenize()
+        expected = sexp(RecursiveParser(tokens).parse_tokens())
+        self.assertEqual(sexp(TokenParser(tokens).parse_tokens()), expected, "source " + repr(text))
+        self.assertEqual(sexp(TokenParser(iter(tokens)).parse_tokens()), expected, "stream of " + repr(text))
+        parser = TokenParser(tokens)
+        parser.diagnostics = []
+        self.assertEqual(sexp(parser.parse_tokens()), expected, "recovering " + repr(text))
+        self.assertEqual(parser.diagnostics, [], "recovering " + repr(text))
+
+    def test_random(self):
+        rng = random.Random(1)
+        for _ in range(2000):
+            self.check(random_source(rng))
+
+    def test_corpus(self):
+        for seed in range(20):
+            self.check(generate_source(3, 8, seed % 4, 0.3, 2, 1 + seed % 3, seed))
+
+    def test_sample(self):
+        with open("sample/sima_sample.sima") as source:
+            self.check(source.read())
+
+    def test_deep(self):
+        # deeper than the recursion limit, only the explicit stack gets through
+        depth = 5000
+        text = "def f: " + "Int -> " * depth + "Int\n    " + "ret " * depth + "1\nend\n"
+        tokens = TextTokenizer("test.sima", text).tokenize()
+        for recovering in (False, True):
+            parser = TokenParser(tokens)
+            if recovering:
+                parser.diagnostics = []
+            root = parser.parse_tokens()
+            definition = root.content[0]
+            node = definition.function_type
+            arrows = 0
+            while type(node) is FunctionTypeNode:
+                node = node.return_type
+                arrows += 1
+            node = definition.body[0]
+            returns = 0
+            while type(node) is FunctionReturnNode:
+                node = node.return_value
+                returns += 1
+            self.assertEqual((arrows, returns, node.value, len(definition.body)), (depth, depth, "1", 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# every tokenizer engine against FileTokenizer, the baseline, on random sources made
+# of token pieces, blanks and invalid characters: the tokens with their lines and
+# columns, or the message of the first TokenizerError, have to be the same
+# run from repository root: python -m unittest tests.test_tokenizers, or python -m pytest
+
+import io
+import random
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from src.tokenizer import *
+from src.parallel import tokenize_parallel, stitch_slices, submit_slices, buffer_tokens
+from benchmarks.generator import generate_source
+
+# unterminated strings, lone colons and characters no rule takes are in here too
+pieces = ['def', 'defmodule', 'ret', 'end', 'x', 'main:', 'Int', ':ok', ' ', '  ', '\t', '\n', '\n\n', ' \n ',
+    '#c ', '"s"', '"u', '12', '3.4', '5.', '->', '+=', '(', ')', '[', ']', '{', '}', ',', '.', 'a_b',
+    'é', '²', '½', ':', '"', '#', ':x:', '-', 'x1', '_']
+
+def random_source(rng, pieces_count):
+    return "".join(rng.choice(pieces) for _ in range(rng.randint(0, pieces_count)))
+
+def described(tokens):
+    return [(token.type, token.value, token.file_name, token.line, token.start_column, token.end_column, str(token)) for token in tokens]
+
+def outcome(function):
+    # described tokens, or the error message
+    try:
+        return described(function())
+    except TokenizerError as error:
+        return "error: " + str(error)
+
+def baseline(text):
+    return outcome(lambda: FileTokenizer("test.sima", io.StringIO(text)).tokenize())
+
+def pushed(text, rng):
+    # chunks of random sizes, a chunk of one character is common
+    tokenizer = PushTokenizer("test.sima")
+    tokens = []
+    position = 0
+    while position < len(text):
+        size = rng.choice([1, 1, 2, 3, 5, 17, 64])
+        tokens.extend(tokenizer.feed(text[position:position + size]))
+        position += size
+    tokens.extend(tokenizer.close())
+    return tokens
+
+class TokenizerEngines(unittest.TestCase):
+    def sources(self, seed, count, pieces_count):
+        rng = random.Random(seed)
+        return [random_source(rng, pieces_count) for _ in range(count)]
+
+    def check(self, engine, sources):
+        for text in sources:
+            self.assertEqual(outcome(lambda: engine(text)), baseline(text), "source " + repr(text))
+
+    def test_text(self):
+        self.check(lambda text: TextTokenizer("test.sima", text).tokenize(), self.sources(1, 3000, 30))
+
+    def test_buffer(self):
+        self.check(lambda text: list(TextTokenizer("test.sima", text).tokenize_buffer()), self.sources(2, 3000, 30))
+        self.check(lambda text: TextTokenizer("test.sima", text).tokenize_buffer().to_tokens(), self.sources(3, 1000, 30))
+
+    def test_push(self):
+        rng = random.Random(4)
+        self.check(lambda text: pushed(text, rng), self.sources(5, 3000, 30))
+
+    def test_parallel(self):
+        # threads run the slices, a threshold of 0 splits every source
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for workers in (2, 3, 7):
+                self.check(lambda text: tokenize_parallel("test.sima", text, workers, 0, executor), self.sources(6 + workers, 500, 150))
+                self.check(lambda text: buffer_tokens(stitch_slices("test.sima", text, submit_slices("test.sima", text, executor, workers))), self.sources(16 + workers, 200, 150))
+
+    def test_corpus(self):
+        # long lines and many lines, with an error near the end
+        text = generate_source(3, 20, 2, 0.3, 3, 2, 7)
+        broken = text[:-200] + "½" + text[-200:]
+        rng = random.Random(8)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for source in (text, broken):
+                expected = baseline(source)
+                self.assertEqual(outcome(lambda: TextTokenizer("test.sima", source).tokenize()), expected)
+                self.assertEqual(outcome(lambda: list(TextTokenizer("test.sima", source).tokenize_buffer())), expected)
+                self.assertEqual(outcome(lambda: pushed(source, rng)), expected)
+                self.assertEqual(outcome(lambda: tokenize_parallel("test.sima", source, 4, 0, executor)), expected)
+        self.assertTrue(expected.startswith("error: "))
+
+if __name__ == "__main__":
+    unittest.main()